@@ -0,0 +1,232 @@
+"""Benchmark of the hot paths of gpx2exif on synthetic data
+
+Times read_gpx, compute_pos, process_image (read only and with the update of the
+EXIF) and write_kml at several scales. The results can be saved as a JSON baseline
+and compared to a later run to catch regressions:
+
+python -m benchmarks.bench_core run --output baseline.json
+python -m benchmarks.bench_core run --output current.json
+python -m benchmarks.bench_core compare baseline.json current.json --threshold 0.2
+"""
+
+from datetime import timedelta
+import json
+import logging
+import os
+from pathlib import Path
+import platform
+import sys
+import tempfile
+import time
+
+import click
+import numpy as np
+
+from gpx2exif.common import GeotagOptions, compute_pos, read_gpx, write_kml
+from gpx2exif.gpx2exif import image_name, image_src, process_image
+
+from .bench_flickr import parse_int_list
+from .corpus import write_gpx, write_jpegs
+
+TRACK_INTERVAL = timedelta(seconds=1)
+PHOTO_INTERVAL = timedelta(seconds=30)
+TRACK_SEGMENTS = 4
+TOLERANCE = timedelta(seconds=10)
+OFFSET = "+02:00"
+
+
+def best_time(func, repeat):
+    """Best of repeat runs of func (in seconds): The least noisy for comparisons"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def result(name, scale, seconds, items):
+    return {
+        "name": name,
+        "scale": scale,
+        "seconds": seconds,
+        "items": items,
+        "items_per_sec": items / seconds if seconds else None,
+    }
+
+
+def photo_times(start_time, end_time, num_photos):
+    """Times of the photos, spread over the track (some in the gaps)"""
+    step = (end_time - start_time) / num_photos
+    return [start_time + i * step for i in range(num_photos)]
+
+
+def bench_gpx(dir_path, num_points, repeat):
+    gpx_path = dir_path / f"track_{num_points}.gpx"
+    start_time, end_time = write_gpx(
+        gpx_path, num_points, TRACK_SEGMENTS, TRACK_INTERVAL
+    )
+
+    seconds = best_time(lambda: read_gpx(gpx_path), repeat)
+    yield result("read_gpx", num_points, seconds, num_points)
+
+    gpx_segments = read_gpx(gpx_path)
+    img_times = photo_times(start_time, end_time, min(num_points, 10000))
+    seconds = best_time(
+        lambda: [compute_pos(t, gpx_segments, TOLERANCE) for t in img_times], repeat
+    )
+    yield result("compute_pos", num_points, seconds, len(img_times))
+
+
+def bench_images(dir_path, num_images, image_size, repeat):
+    # track covering all the photos
+    num_points = int(num_images * PHOTO_INTERVAL / TRACK_INTERVAL) + 1
+    gpx_path = dir_path / f"track_images_{num_images}.gpx"
+    write_gpx(gpx_path, num_points, 1, TRACK_INTERVAL)
+    gpx_segments = read_gpx(gpx_path)
+
+    img_dir = dir_path / f"images_{num_images}"
+    img_paths = [
+        Path(p)
+        for p in write_jpegs(
+            img_dir, num_images, image_size, interval=PHOTO_INTERVAL, offset=OFFSET
+        )
+    ]
+
+    def process_images(is_update_images):
+        options = GeotagOptions(tolerance=TOLERANCE, is_update_images=is_update_images)
+        return [
+            process_image(img_path, gpx_segments, options, tz_warning=False)
+            for img_path in img_paths
+        ]
+
+    seconds = best_time(lambda: process_images(False), repeat)
+    yield result("process_image", num_images, seconds, num_images)
+
+    # the GPS tags are replaced at each run after the first one
+    seconds = best_time(lambda: process_images(True), repeat)
+    yield result("process_image_update", num_images, seconds, num_images)
+
+    positions = [
+        (pos, str(img_path))
+        for pos, img_path in zip(process_images(False), img_paths, strict=True)
+    ]
+    kml_path = dir_path / f"photos_{num_images}.kml"
+    seconds = best_time(
+        lambda: write_kml(positions, kml_path, 400, image_src, image_name), repeat
+    )
+    yield result("write_kml", num_images, seconds, num_images)
+
+
+def compare_results(baseline, current, threshold):
+    """Ratio current / baseline of the seconds of the benchmarks present in both
+
+    Return a list of (name, scale, baseline seconds, current seconds, ratio,
+    is_regression).
+    """
+    baseline_seconds = {(r["name"], r["scale"]): r["seconds"] for r in baseline}
+    rows = []
+    for r in current:
+        key = (r["name"], r["scale"])
+        if key not in baseline_seconds:
+            continue
+        ratio = r["seconds"] / baseline_seconds[key]
+        rows.append(
+            (*key, baseline_seconds[key], r["seconds"], ratio, ratio > 1 + threshold)
+        )
+    return rows
+
+
+@click.group(help="Benchmark of the hot paths of gpx2exif on synthetic data")
+def main():
+    # only the results
+    logging.getLogger("gpx2exif").setLevel(logging.ERROR)
+
+
+@main.command(help="Run the benchmarks")
+@click.option(
+    "--points",
+    default="10000,100000",
+    callback=parse_int_list,
+    show_default=True,
+    help="Numbers of trackpoints in the GPX",
+)
+@click.option(
+    "--images",
+    default="100,1000",
+    callback=parse_int_list,
+    show_default=True,
+    help="Numbers of photos",
+)
+@click.option(
+    "--image-size", default=200_000, show_default=True, help="Size of a photo (bytes)"
+)
+@click.option("--repeat", default=3, show_default=True, help="Best of N runs")
+@click.option("--output", "output_path", help="Path for a JSON file with the results")
+def run(points, images, image_size, repeat, output_path):
+    results = []
+    click.echo(f"{'benchmark':<22} {'scale':>8} {'seconds':>9} {'items/s':>12}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dir_path = Path(tmp_dir)
+        benchmarks = [bench_gpx(dir_path, n, repeat) for n in points] + [
+            bench_images(dir_path, n, image_size, repeat) for n in images
+        ]
+        for benchmark in benchmarks:
+            for r in benchmark:
+                results.append(r)
+                click.echo(
+                    f"{r['name']:<22} {r['scale']:>8} {r['seconds']:>9.3f} "
+                    f"{r['items_per_sec']:>12.1f}"
+                )
+
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "python": sys.version.split()[0],
+                    "platform": platform.platform(),
+                    "cpu_count": os.cpu_count(),
+                    "numpy": np.__version__,
+                    "image_size": image_size,
+                    "repeat": repeat,
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+@main.command(help="Compare a run to a baseline (exit code 1 if regressions)")
+@click.argument("baseline_path", type=click.Path(exists=True, dir_okay=False))
+@click.argument("current_path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--threshold",
+    default=0.2,
+    show_default=True,
+    help="Slowdown (fraction of the baseline time) flagged as a regression",
+)
+def compare(baseline_path, current_path, threshold):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(current_path, encoding="utf-8") as f:
+        current = json.load(f)
+
+    rows = compare_results(baseline["results"], current["results"], threshold)
+    click.echo(
+        f"{'benchmark':<22} {'scale':>8} {'baseline':>9} {'current':>9} {'ratio':>7}"
+    )
+    for name, scale, baseline_seconds, current_seconds, ratio, is_regression in rows:
+        flag = "  REGRESSION" if is_regression else ""
+        click.echo(
+            f"{name:<22} {scale:>8} {baseline_seconds:>9.3f} {current_seconds:>9.3f} "
+            f"{ratio:>7.2f}{flag}"
+        )
+
+    num_regressions = sum(row[-1] for row in rows)
+    if num_regressions:
+        click.echo(f"{num_regressions} regression(s) above {threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Load benchmark of gpx2exif flickr against the local stand-in Flickr server
+
+Reports photos/sec and API calls per photo for albums of various sizes, with
+the listing and update calls going through HTTP like with the real Flickr.
+
+python -m benchmarks.bench_flickr --sizes 100,1000,10000 --latency 0.02
+"""
+
+from datetime import timedelta
+import json
+import logging
+import time
+
+from addict import Dict as Addict
+import click
+import pandas as pd
+
+from gpx2exif.flickr_writer import FlickrWriter
+from gpx2exif.gpx2flickr import ALBUM_PAGE_WORKERS, FlickrAlbum, synch_gps_flickr
+
+from .fake_flickr import (
+    ALBUM_ID,
+    ALBUM_URL,
+    DEFAULT_START_TIME,
+    FakeFlickr,
+    FakeFlickrServer,
+    create_fake_flickr_api,
+)
+
+PHOTO_INTERVAL = timedelta(seconds=10)
+TRACK_INTERVAL = timedelta(seconds=3)
+
+
+def make_track(num_photos):
+    """GPX segment (like read_gpx) covering the photos of the fake album"""
+    start = pd.Timestamp(DEFAULT_START_TIME, tz="utc")
+    end = start + num_photos * PHOTO_INTERVAL
+    index = pd.date_range(start, end, freq=TRACK_INTERVAL, name="time")
+    n = len(index)
+    df = pd.DataFrame(
+        {
+            "lat": [45.0 + 0.01 * i / n for i in range(n)],
+            "lon": [6.0 + 0.01 * i / n for i in range(n)],
+        },
+        index=index,
+    )
+    return [df]
+
+
+def run_once(
+    num_photos,
+    workers,
+    latency,
+    error_rate,
+    rate_limit,
+    max_retries,
+    is_update_time,
+):
+    fake_flickr = FakeFlickr(num_photos, interval=PHOTO_INTERVAL)
+    gpx_segments = make_track(num_photos)
+
+    with FakeFlickrServer(
+        fake_flickr, latency=latency, error_rate=error_rate, rate_limit=rate_limit
+    ) as server:
+        flickr = create_fake_flickr_api(
+            server.url, pool_size=ALBUM_PAGE_WORKERS + workers
+        )
+        user = Addict(flickr.urls.lookupUser(url=ALBUM_URL)).user
+        writer = FlickrWriter(flickr, max_retries=max_retries, workers=workers)
+
+        start = time.perf_counter()
+        positions = synch_gps_flickr(
+            flickr,
+            user,
+            FlickrAlbum(ALBUM_ID, ALBUM_URL),
+            gpx_segments,
+            timedelta(0),
+            timedelta(seconds=1) if is_update_time else timedelta(0),
+            timedelta(seconds=10),
+            False,
+            True,
+            is_update_time,
+            False,
+            writer=writer,
+        )
+        elapsed = time.perf_counter() - start
+        writer.close()
+
+    # lookupUser is before the timed part
+    api_calls = sum(fake_flickr.calls.values()) - 1
+    http_errors = sum(server.http_errors.values())
+    return {
+        "photos": num_photos,
+        "workers": workers,
+        "latency": latency,
+        "error_rate": error_rate,
+        "rate_limit": rate_limit,
+        "elapsed": elapsed,
+        "photos_per_sec": num_photos / elapsed,
+        "api_calls": api_calls,
+        "http_errors": http_errors,
+        "api_calls_per_photo": (api_calls + http_errors) / num_photos,
+        "geotagged": len(positions),
+    }
+
+
+def parse_int_list(ctx, param, value):
+    try:
+        return [int(v) for v in value.split(",")]
+    except ValueError as ex:
+        raise click.BadParameter("Must be a list of integers: eg 100,1000") from ex
+
+
+@click.command(help="Benchmark gpx2exif flickr against a local fake Flickr server")
+@click.option("--sizes", default="100,1000", callback=parse_int_list, show_default=True)
+@click.option("--workers", default="1,4", callback=parse_int_list, show_default=True)
+@click.option("--latency", default=0.01, show_default=True, help="Seconds per call")
+@click.option("--error-rate", default=0.0, show_default=True, help="HTTP 502 rate")
+@click.option("--rate-limit", type=float, default=None, help="Calls per second")
+@click.option("--retries", "max_retries", default=5, show_default=True)
+@click.option("--update-time", "is_update_time", is_flag=True)
+@click.option("--output", "output_path", help="Path for a JSON file with the results")
+def main(
+    sizes,
+    workers,
+    latency,
+    error_rate,
+    rate_limit,
+    max_retries,
+    is_update_time,
+    output_path,
+):
+    # only the results
+    logging.getLogger("gpx2exif").setLevel(logging.ERROR)
+    # logs the HTTP errors
+    logging.getLogger("flickrapi").setLevel(logging.CRITICAL)
+
+    results = []
+    click.echo(
+        f"{'photos':>8} {'workers':>8} {'seconds':>9} {'photos/s':>10} "
+        f"{'calls/photo':>12} {'errors':>7}"
+    )
+    for size in sizes:
+        for num_workers in workers:
+            result = run_once(
+                size,
+                num_workers,
+                latency,
+                error_rate,
+                rate_limit,
+                max_retries,
+                is_update_time,
+            )
+            results.append(result)
+            click.echo(
+                f"{size:>8} {num_workers:>8} {result['elapsed']:>9.2f} "
+                f"{result['photos_per_sec']:>10.1f} "
+                f"{result['api_calls_per_photo']:>12.3f} {result['http_errors']:>7}"
+            )
+
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Benchmark of the preparation of the clock photos before OCR
+
+Compares the bytes uploaded and the time per photo for the images that can be sent
+to the OCR (original file, reduced, cropped, EXIF thumbnail), with a stub OCR
+backend that simulates the upload (no call to the Vision API).
+
+python -m benchmarks.bench_ocr --photos 8 --upload-rate 2000000
+"""
+
+from io import BytesIO
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+import click
+import piexif
+
+from gpx2exif.imaging import PIL_AVAILABLE
+from gpx2exif.time_extractor import (
+    DEFAULT_OCR_MAX_SIZE,
+    OcrOptions,
+    StubOcrBackend,
+    read_clock_photos,
+)
+
+if PIL_AVAILABLE:
+    from PIL import Image
+
+CASES = {
+    "original": OcrOptions("original", None, None),
+    "reduced": OcrOptions("reduced", DEFAULT_OCR_MAX_SIZE, None),
+    "cropped": OcrOptions("reduced", DEFAULT_OCR_MAX_SIZE, (0.25, 0.25, 0.75, 0.75)),
+    "thumbnail": OcrOptions("thumbnail", DEFAULT_OCR_MAX_SIZE, None),
+}
+
+
+def make_photo(path, width, height, seed):
+    """JPEG with noise (compresses like a real photo) and an EXIF thumbnail"""
+    rnd = random.Random(seed)
+    # noise upscaled: some structure like in a photo
+    small = Image.frombytes(
+        "RGB", (width // 8, height // 8), rnd.randbytes(width // 8 * height // 8 * 3)
+    )
+    image = small.resize((width, height), Image.Resampling.BILINEAR)
+    thumbnail = BytesIO()
+    image.resize((160, 120)).save(thumbnail, format="JPEG")
+    exif_data = {
+        "0th": {piexif.ImageIFD.Model: b"Bench"},
+        "Exif": {piexif.ExifIFD.DateTimeOriginal: b"2025:10:24 08:00:00"},
+        "1st": {piexif.ImageIFD.JPEGInterchangeFormat: 0},
+        "thumbnail": thumbnail.getvalue(),
+    }
+    image.save(path, format="JPEG", quality=92, exif=piexif.dump(exif_data))
+    return path
+
+
+@click.command(help="Benchmark the images sent for OCR by gpx2exif extract-time")
+@click.option("--photos", "num_photos", default=8, show_default=True)
+@click.option("--width", default=6000, show_default=True)
+@click.option("--height", default=4000, show_default=True)
+@click.option("--jobs", default=4, show_default=True)
+@click.option("--latency", default=0.2, show_default=True, help="Seconds per call")
+@click.option(
+    "--upload-rate",
+    default=2_000_000,
+    show_default=True,
+    help="Bytes per second for each upload",
+)
+@click.option("--output", "output_path", help="Path for a JSON file with the results")
+def main(num_photos, width, height, jobs, latency, upload_rate, output_path):
+    if not PIL_AVAILABLE:
+        raise click.ClickException("Pillow is required")
+    logging.getLogger("gpx2exif").setLevel(logging.ERROR)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        photo_paths = [
+            make_photo(os.path.join(tmp_dir, f"{i}.jpg"), width, height, i)
+            for i in range(num_photos)
+        ]
+        file_bytes = sum(os.path.getsize(p) for p in photo_paths)
+        click.echo(f"{num_photos} photos {width}x{height}: {file_bytes} bytes")
+        click.echo(f"{'image':>10} {'bytes/photo':>12} {'s/photo':>9} {'total s':>9}")
+
+        for name, ocr_options in CASES.items():
+            backend = StubOcrBackend(
+                lambda content: ["8:00:30"], latency=latency, upload_rate=upload_rate
+            )
+            start = time.perf_counter()
+            read_clock_photos(photo_paths, backend, None, ocr_options, jobs)
+            elapsed = time.perf_counter() - start
+
+            result = {
+                "image": name,
+                "photos": num_photos,
+                "bytes_per_photo": backend.bytes_sent / num_photos,
+                "elapsed": elapsed,
+                "seconds_per_photo": elapsed / num_photos,
+            }
+            results.append(result)
+            click.echo(
+                f"{name:>10} {result['bytes_per_photo']:>12.0f} "
+                f"{result['seconds_per_photo']:>9.3f} {elapsed:>9.2f}"
+            )
+
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
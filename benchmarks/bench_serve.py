@@ -0,0 +1,129 @@
+"""Throughput benchmark of the serve subcommand for batched lookups
+
+Starts the server on a synthetic GPX (in the same process, in a background
+thread) and sends POST /locate requests with batches of times of various sizes
+over a keep-alive connection. Reports the requests/sec and the lookups/sec.
+
+python -m benchmarks.bench_serve --batches 1,100,10000 --requests 200
+"""
+
+from datetime import timedelta
+import http.client
+import json
+import logging
+import os
+import random
+import socket
+import tempfile
+import time
+
+import click
+
+from gpx2exif.server import GeotagServer
+from gpx2exif.track_index import TrackIndex
+
+from .bench_flickr import parse_int_list
+from .corpus import write_gpx
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection to a server listening on a Unix socket"""
+
+    def __init__(self, socket_path):
+        super().__init__("localhost")
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def create_connection(server):
+    if server.socket_path:
+        return UnixHTTPConnection(server.socket_path)
+    host, port = server.httpd.server_address[:2]
+    return http.client.HTTPConnection(host, port)
+
+
+def post(connection, path, body):
+    connection.request(
+        "POST", path, json.dumps(body), {"Content-Type": "application/json"}
+    )
+    response = connection.getresponse()
+    data = response.read()
+    if response.status != 200:
+        raise RuntimeError(f"HTTP {response.status}: {data[:200]}")
+    return json.loads(data)
+
+
+def run_once(server, batch_size, num_requests, start_time, end_time, rng):
+    span = (end_time - start_time).total_seconds()
+    bodies = [
+        {
+            "times": [
+                (start_time + timedelta(seconds=rng.uniform(0, span))).isoformat()
+                for _ in range(batch_size)
+            ]
+        }
+        for _ in range(num_requests)
+    ]
+    connection = create_connection(server)
+    try:
+        start = time.perf_counter()
+        located = 0
+        for body in bodies:
+            positions = post(connection, "/locate", body)["positions"]
+            located += sum(pos is not None for pos in positions)
+        elapsed = time.perf_counter() - start
+    finally:
+        connection.close()
+    return {
+        "batch_size": batch_size,
+        "requests": num_requests,
+        "elapsed": elapsed,
+        "requests_per_sec": num_requests / elapsed,
+        "lookups_per_sec": num_requests * batch_size / elapsed,
+        "located": located,
+    }
+
+
+@click.command(help="Benchmark of the lookups of gpx2exif serve")
+@click.option("--points", default=100_000, show_default=True, help="GPX trackpoints")
+@click.option("--batches", default="1,100,10000", callback=parse_int_list)
+@click.option("--requests", "num_requests", default=100, show_default=True)
+@click.option("--unix-socket", "is_unix_socket", is_flag=True)
+@click.option("--output", "output_path", help="Path for a JSON file with the results")
+def main(points, batches, num_requests, is_unix_socket, output_path):
+    logging.getLogger("gpx2exif").setLevel(logging.ERROR)
+    rng = random.Random(0)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        gpx_path = os.path.join(tmp_dir, "track.gpx")
+        start_time, end_time = write_gpx(gpx_path, points, num_segments=4)
+        socket_path = os.path.join(tmp_dir, "serve.sock") if is_unix_socket else None
+        index = TrackIndex([gpx_path])
+
+        click.echo(
+            f"{'batch':>7} {'requests':>9} {'seconds':>9} {'requests/s':>11} "
+            f"{'lookups/s':>11}"
+        )
+        with GeotagServer(index, port=0, socket_path=socket_path) as server:
+            for batch_size in batches:
+                result = run_once(
+                    server, batch_size, num_requests, start_time, end_time, rng
+                )
+                results.append(result)
+                click.echo(
+                    f"{batch_size:>7} {num_requests:>9} {result['elapsed']:>9.2f} "
+                    f"{result['requests_per_sec']:>11.1f} "
+                    f"{result['lookups_per_sec']:>11.0f}"
+                )
+
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
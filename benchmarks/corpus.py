@@ -0,0 +1,128 @@
+"""Synthetic GPX tracks and EXIF JPEGs for the benchmarks
+
+The JPEGs are not real images (no need for Pillow): A minimal JPEG structure with
+the EXIF, padded with comment segments to the requested size, which is enough for
+piexif (read and write of the EXIF go through the whole file).
+"""
+
+from datetime import datetime, timedelta, timezone
+import math
+import os
+
+import piexif
+
+from gpx2exif.gpx2exif import get_gps_ifd
+
+DEFAULT_START_TIME = datetime(2025, 10, 24, 8, 0, 0, tzinfo=timezone.utc)
+
+# SOI, JFIF APP0 ... SOS, EOI
+JPEG_START = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+JPEG_END = b"\xff\xda\x00\x02\x00\xff\xd9"
+# maximum payload of a JPEG segment
+MAX_SEGMENT_SIZE = 65533
+
+
+def track_point(i, num_points):
+    """Position of point i on a wiggly line (around 10 km long)"""
+    t = i / max(1, num_points - 1)
+    lat = 45.0 + 0.1 * t + 0.002 * math.sin(200 * t)
+    lon = 6.0 + 0.1 * t + 0.002 * math.cos(150 * t)
+    return lat, lon
+
+
+def write_gpx(
+    path,
+    num_points,
+    num_segments=1,
+    interval=timedelta(seconds=1),
+    gap=timedelta(minutes=10),
+    start_time=DEFAULT_START_TIME,
+):
+    """GPX with num_points trackpoints every interval, split in num_segments
+
+    The segments are separated by a gap without points (like when the logger is
+    paused). Return the time range of the track.
+    """
+    points_per_segment = math.ceil(num_points / num_segments)
+    time = start_time
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<gpx version="1.1" creator="benchmarks" '
+            'xmlns="http://www.topografix.com/GPX/1/1">\n<trk>\n'
+        )
+        for i in range(num_points):
+            if i % points_per_segment == 0:
+                if i > 0:
+                    f.write("</trkseg>\n")
+                    time += gap
+                f.write("<trkseg>\n")
+            lat, lon = track_point(i, num_points)
+            f.write(
+                f'<trkpt lat="{lat:.7f}" lon="{lon:.7f}">'
+                f"<ele>{1000 + i % 100}</ele>"
+                f"<time>{time.strftime('%Y-%m-%dT%H:%M:%SZ')}</time></trkpt>\n"
+            )
+            time += interval
+        f.write("</trkseg>\n</trk>\n</gpx>\n")
+    return start_time, time - interval
+
+
+def make_jpeg_content(size):
+    """Minimal JPEG of (about) size bytes"""
+    padding = max(0, size - len(JPEG_START) - len(JPEG_END))
+    segments = []
+    while padding > 4:
+        payload = min(MAX_SEGMENT_SIZE, padding - 4)
+        # COM segment: length includes its 2 bytes
+        segments.append(b"\xff\xfe" + (payload + 2).to_bytes(2, "big"))
+        segments.append(b"\x00" * payload)
+        padding -= payload + 4
+    return JPEG_START + b"".join(segments) + JPEG_END
+
+
+def write_jpeg(path, size, dt, offset=None, gps=None):
+    """JPEG with DateTimeOriginal dt (naive, local time of the camera)
+
+    offset: OffsetTimeOriginal (eg "+02:00"); gps: (lat, lon) for the GPS tags
+    """
+    with open(path, "wb") as f:
+        f.write(make_jpeg_content(size))
+    exif_ifd = {
+        piexif.ExifIFD.DateTimeOriginal: dt.strftime("%Y:%m:%d %H:%M:%S").encode()
+    }
+    if offset:
+        exif_ifd[piexif.ExifIFD.OffsetTimeOriginal] = offset.encode()
+    exif_data = {"0th": {piexif.ImageIFD.Model: b"Bench"}, "Exif": exif_ifd}
+    if gps:
+        exif_data["GPS"] = get_gps_ifd(*gps)
+    piexif.insert(piexif.dump(exif_data), str(path))
+    return path
+
+
+def write_jpegs(
+    dir_path,
+    num_images,
+    size,
+    start_time=DEFAULT_START_TIME,
+    interval=timedelta(seconds=30),
+    offset=None,
+    is_gps=False,
+):
+    """num_images JPEGs taken every interval from start_time (UTC)
+
+    With offset, the times are written in the local time of the offset.
+    """
+    os.makedirs(dir_path, exist_ok=True)
+    tz = timezone.utc
+    if offset:
+        sign = -1 if offset.startswith("-") else 1
+        hours, minutes = offset.lstrip("+-").split(":")
+        tz = timezone(sign * timedelta(hours=int(hours), minutes=int(minutes)))
+    paths = []
+    for i in range(num_images):
+        dt = (start_time + i * interval).astimezone(tz).replace(tzinfo=None)
+        gps = track_point(i, num_images) if is_gps else None
+        path = os.path.join(dir_path, f"IMG_{i:06d}.jpg")
+        paths.append(write_jpeg(path, size, dt, offset, gps))
+    return paths
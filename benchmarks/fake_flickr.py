@@ -0,0 +1,297 @@
+"""Local stand-in for the Flickr REST API
+
+Covers the methods used by gpx2exif flickr, with configurable latency, error rate
+and rate limiting, so the throughput and the retry behavior can be measured
+without calling Flickr.
+"""
+
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import math
+import random
+import threading
+import time
+from urllib.parse import parse_qs
+
+import flickrapi
+from flickrapi.auth import FlickrAccessToken
+
+from gpx2exif.flickr_api_auth import set_connection_pool_size
+
+USER_ID = "12345678@N00"
+USER_NAME = "fake"
+ALBUM_ID = "72157700000000000"
+ALBUM_URL = f"https://www.flickr.com/photos/{USER_NAME}/albums/{ALBUM_ID}"
+USER_URL = f"https://www.flickr.com/photos/{USER_NAME}/"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# date taken of the first photo of the album
+DEFAULT_START_TIME = datetime(2025, 10, 24, 8, 0, 0)
+
+
+class FlickrApiError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class FakeFlickr:
+    """State of the fake Flickr: One user with one album"""
+
+    def __init__(
+        self,
+        num_photos,
+        start_time=DEFAULT_START_TIME,
+        interval=timedelta(seconds=10),
+    ):
+        self.lock = threading.Lock()
+        self.photos = {}
+        for i in range(num_photos):
+            photo_id = str(50000000000 + i)
+            self.photos[photo_id] = {
+                "id": photo_id,
+                "title": f"IMG_{i:05d}",
+                "datetaken": (start_time + i * interval).strftime(DATE_FORMAT),
+                "datetakengranularity": 0,
+                "latitude": 0,
+                "longitude": 0,
+                "accuracy": 0,
+                "lastupdate": "1700000000",
+                "url_m": f"https://live.staticflickr.com/fake/{photo_id}_m.jpg",
+            }
+        self.album = list(self.photos)
+        self.album_date_update = "1700000000"
+        self.calls = Counter()
+
+    def _page(self, photo_ids, params):
+        per_page = min(int(params.get("per_page", 100)), 500)
+        page = int(params.get("page", 1))
+        total = len(photo_ids)
+        pages = max(1, math.ceil(total / per_page))
+        start = (page - 1) * per_page
+        photos = [dict(self.photos[i]) for i in photo_ids[start : start + per_page]]
+        return {
+            "page": page,
+            "pages": pages,
+            "perpage": per_page,
+            "total": total,
+            "photo": photos,
+        }
+
+    def _get_photo(self, params):
+        photo_id = params.get("photo_id")
+        if photo_id not in self.photos:
+            raise FlickrApiError(1, "Photo not found")
+        return self.photos[photo_id]
+
+    def call(self, method, params):
+        with self.lock:
+            self.calls[method] += 1
+            func = getattr(self, method.replace("flickr.", "").replace(".", "_"), None)
+            if func is None:
+                raise FlickrApiError(112, f'Method "{method}" not found')
+            return func(params)
+
+    def urls_lookupUser(self, params):
+        return {"user": {"id": USER_ID, "username": {"_content": USER_NAME}}}
+
+    def photosets_getInfo(self, params):
+        if params.get("photoset_id") != ALBUM_ID:
+            raise FlickrApiError(1, "Photoset not found")
+        return {
+            "photoset": {
+                "id": ALBUM_ID,
+                "date_update": self.album_date_update,
+                "count_photos": len(self.album),
+            }
+        }
+
+    def photosets_getPhotos(self, params):
+        if params.get("photoset_id") != ALBUM_ID:
+            raise FlickrApiError(1, "Photoset not found")
+        photoset = self._page(self.album, params)
+        photoset.update({"id": ALBUM_ID, "title": "Fake album", "owner": USER_ID})
+        return {"photoset": photoset}
+
+    def photos_search(self, params):
+        min_taken = params.get("min_taken_date", "")
+        max_taken = params.get("max_taken_date", "9999")
+        photo_ids = [
+            photo_id
+            for photo_id in self.album
+            if min_taken <= self.photos[photo_id]["datetaken"] <= max_taken
+        ]
+        return {"photos": self._page(photo_ids, params)}
+
+    def photos_recentlyUpdated(self, params):
+        min_date = int(params.get("min_date", 0))
+        photo_ids = [
+            photo_id
+            for photo_id in self.album
+            if int(self.photos[photo_id]["lastupdate"]) > min_date
+        ]
+        return {"photos": self._page(photo_ids, params)}
+
+    def _touch(self, photo):
+        photo["lastupdate"] = str(int(time.time()))
+
+    def photos_setDates(self, params):
+        photo = self._get_photo(params)
+        photo["datetaken"] = params["date_taken"]
+        self._touch(photo)
+        return {}
+
+    def photos_geo_setLocation(self, params):
+        photo = self._get_photo(params)
+        photo["latitude"] = float(params["lat"])
+        photo["longitude"] = float(params["lon"])
+        self._touch(photo)
+        return {}
+
+    def photos_geo_removeLocation(self, params):
+        photo = self._get_photo(params)
+        photo["latitude"] = 0
+        photo["longitude"] = 0
+        self._touch(photo)
+        return {}
+
+
+class RateLimiter:
+    """Token bucket: rate requests per second, with bursts of up to rate"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class FakeFlickrServer:
+    """HTTP server for a FakeFlickr, run in a background thread
+
+    latency: seconds added to each request (+ up to latency_jitter)
+    error_rate: probability of an HTTP 502 for a request (only for the methods
+        in error_methods if set)
+    rate_limit: maximum number of requests per second (HTTP 429 above)
+    """
+
+    def __init__(
+        self,
+        fake_flickr,
+        latency=0.0,
+        latency_jitter=0.0,
+        error_rate=0.0,
+        rate_limit=None,
+        seed=None,
+        error_methods=None,
+    ):
+        self.fake_flickr = fake_flickr
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_methods = error_methods
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.random = random.Random(seed)
+        self.http_errors = Counter()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/services/rest/"
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive connections
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately: no delayed ACK wait
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length).decode("utf-8")
+                params = {k: v[0] for k, v in parse_qs(body).items()}
+                server._handle(self, params)
+
+        return Handler
+
+    def _handle(self, handler, params):
+        if self.latency or self.latency_jitter:
+            time.sleep(self.latency + self.random.uniform(0, self.latency_jitter))
+
+        if self.rate_limiter is not None and not self.rate_limiter.allow():
+            self.http_errors[429] += 1
+            handler._reply(429, "Too Many Requests")
+            return
+
+        method = params.get("method", "")
+        is_error_method = self.error_methods is None or method in self.error_methods
+        if (
+            self.error_rate
+            and is_error_method
+            and self.random.random() < self.error_rate
+        ):
+            self.http_errors[502] += 1
+            handler._reply(502, "Bad Gateway")
+            return
+
+        try:
+            result = self.fake_flickr.call(method, params)
+            result["stat"] = "ok"
+        except FlickrApiError as ex:
+            result = {"stat": "fail", "code": ex.code, "message": ex.message}
+        handler._reply(200, json.dumps(result))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def create_fake_flickr_api(url, pool_size=None):
+    """FlickrAPI client for the fake server (no authentication needed)"""
+    token = FlickrAccessToken("token", "secret", "write")
+    flickr = flickrapi.FlickrAPI(
+        "key", "secret", token=token, format="parsed-json", store_token=False
+    )
+    flickr.REST_URL = url
+    if pool_size:
+        set_connection_pool_size(flickr, pool_size)
+    return flickr
@@ -2,4 +2,9 @@ __version__ = "13"
 
 import colorama
 
+from .common import GeotagOptions, GpsPosition
+from .geotagger import Geotagger
+
+__all__ = ["GeotagOptions", "Geotagger", "GpsPosition"]
+
 colorama.init()
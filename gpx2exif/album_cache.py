@@ -0,0 +1,92 @@
+import json
+import logging
+import os
+from pathlib import Path
+import time
+
+from addict import Dict as Addict
+
+logger = logging.getLogger(__package__)
+
+ALBUM_CACHE_DIRNAME = "album_cache"
+# entries not used for that long are deleted
+ALBUM_CACHE_MAX_AGE = 30 * 24 * 3600
+# least recently used entries are deleted above that total size
+ALBUM_CACHE_MAX_BYTES = 100 * 1024 * 1024
+
+
+class AlbumCache:
+    """Flickr album listings stored as JSON files on disk.
+
+    An entry younger than ttl (in seconds) can be used without any call to Flickr.
+    Older entries are still kept as a base for an incremental refresh, until they
+    are evicted by age or by total size of the cache.
+    """
+
+    def __init__(
+        self,
+        cache_dir,
+        ttl,
+        max_age=ALBUM_CACHE_MAX_AGE,
+        max_bytes=ALBUM_CACHE_MAX_BYTES,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+
+    def _entry_path(self, album_id):
+        return self.cache_dir / f"{album_id}.json"
+
+    def is_fresh(self, entry):
+        return time.time() - entry["refreshed"] < self.ttl
+
+    def load(self, album_id):
+        path = self._entry_path(album_id)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logger.warning(f"Invalid album cache entry {path}: Ignored")
+            return None
+
+        # mark as recently used for the eviction
+        os.utime(path)
+        entry["photos"] = [Addict(photo) for photo in entry["photos"]]
+        return entry
+
+    def save(self, album_id, entry):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._entry_path(album_id)
+        # write then rename so an interrupted run does not leave a truncated entry
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        if not self.cache_dir.is_dir():
+            return
+
+        now = time.time()
+        entries = []
+        for path in self.cache_dir.glob("*.json"):
+            stat = path.stat()
+            if now - stat.st_mtime > self.max_age:
+                logger.debug(f"Evict expired album cache entry {path.name}")
+                path.unlink(missing_ok=True)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        # most recently used first
+        entries.sort(reverse=True)
+        total_size = 0
+        for i, (_, size, path) in enumerate(entries):
+            total_size += size
+            # the most recent entry is always kept
+            if i > 0 and total_size > self.max_bytes:
+                logger.debug(f"Evict album cache entry {path.name} (cache too large)")
+                path.unlink(missing_ok=True)
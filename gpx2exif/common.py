@@ -1,5 +1,8 @@
+from collections import namedtuple
+from dataclasses import dataclass
 from datetime import timedelta
 import logging
+import os
 import re
 
 import click
@@ -7,11 +10,31 @@ from colorama import Fore
 import dateutil.parser
 import gpxpy
 import gpxpy.gpx
+import numpy as np
 import pandas as pd
-import simplekml
+
+from .kml_writer import DEFAULT_TRACK_POINTS, TRACK_MODES, KmlWriter, KmzWriter
+from .metrics import metrics
+from .output_writers import OUTPUT_WRITERS, create_output_writer, write_outputs
+from .time_sources import DEFAULT_TIME_SOURCES, TIME_SOURCES
 
 logger = logging.getLogger(__package__)
 
+# name of the folder for the config and cache files (location depends on the OS)
+DEFAULT_APP_DIR = "gpx2exif"
+
+# quality of the match of a photo time with the GPX:
+# exact: time of a trackpoint
+# interpolated: between 2 trackpoints
+# outside: before the start or after the end of a segment (within the tolerance)
+MATCH_EXACT = "exact"
+MATCH_INTERPOLATED = "interpolated"
+MATCH_OUTSIDE = "outside"
+
+# position of a photo computed from the GPX (lat and lon first: can be used as
+# a (lat, lon) tuple). gap is the time in seconds to the closest trackpoint
+GpsPosition = namedtuple("GpsPosition", "lat lon time quality gap")
+
 delta_option = click.option(
     "-d",
     "--delta",
@@ -62,6 +85,68 @@ kml_option = click.option(
     required=False,
 )
 
+
+def validate_output_paths(ctx, param, value):
+    for path in value:
+        if os.path.splitext(path)[1].lower() not in OUTPUT_WRITERS:
+            raise click.BadParameter(
+                f"Unknown format for {path}: The extension must be one of "
+                f"{', '.join(OUTPUT_WRITERS)}",
+                ctx,
+            )
+    return value
+
+
+output_option = click.option(
+    "--output",
+    "output_paths",
+    help=(
+        "Path for an output file with the positions of the photos, their corrected "
+        "time and the quality of the match with the GPX. The format depends on the "
+        "extension: .geojson, .geojsonl / .ndjson (newline-delimited GeoJSON), .csv "
+        "or .gpx (waypoints). Multiple possible."
+    ),
+    callback=validate_output_paths,
+    multiple=True,
+    required=False,
+)
+
+report_option = click.option(
+    "--report",
+    "report_path",
+    help=(
+        "Path for a JSON file with the timings of the stages of the run (with the "
+        "percentiles of the time per file) and counters (files and bytes read and "
+        "written, API calls...)"
+    ),
+    required=False,
+)
+
+kml_track_option = click.option(
+    "--kml-track",
+    "kml_track",
+    type=click.Choice(TRACK_MODES),
+    help=(
+        "Add the GPX track to the KML: 'line' (one line per segment, with its time "
+        "span) or 'gx-track' (time of each point, for the time slider of Google "
+        "Earth)"
+    ),
+    required=False,
+)
+
+kml_track_points_option = click.option(
+    "--kml-track-points",
+    "kml_track_points",
+    type=click.IntRange(min=2),
+    default=DEFAULT_TRACK_POINTS,
+    show_default=True,
+    help=(
+        "Maximum number of points of the track in the KML (the track is simplified "
+        "to keep its shape)"
+    ),
+    required=False,
+)
+
 kml_thumbnail_size_option = click.option(
     "--kml_thumbnail_size",
     "kml_thumbnail_size",
@@ -91,6 +176,130 @@ update_images_option = click.option(
     required=False,
 )
 
+progress_option = click.option(
+    "--no-progress",
+    "is_progress",
+    is_flag=True,
+    default=False,
+    callback=reverse_flag,
+    help=(
+        "Flag to disable the progress of the files (live bar on a terminal, log line "
+        "every 30s otherwise)"
+    ),
+    required=False,
+)
+
+time_source_option = click.option(
+    "--time-source",
+    "time_sources",
+    type=click.Choice(TIME_SOURCES),
+    help=(
+        "Source of the time of the photos: 'exif' (DateTimeOriginal), 'filename' "
+        "(eg IMG_20260205_095943.jpg, without opening the file) or 'mtime' "
+        "(modification time of the file). Multiple possible: the first source with "
+        "a time is used, in the order given. [default: exif]"
+    ),
+    multiple=True,
+    required=False,
+)
+
+
+def parse_shard(value):
+    """(i, N) for "i/N" (1 <= i <= N)"""
+    try:
+        index, count = (int(v) for v in value.split("/"))
+    except ValueError as ex:
+        raise ValueError(f"Invalid shard '{value}' (must be i/N)") from ex
+    if not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{value}' (must be between 1/N and N/N)")
+    return index, count
+
+
+def validate_shard(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return parse_shard(value)
+    except ValueError as ex:
+        raise click.BadParameter(str(ex)) from ex
+
+
+shard_option = click.option(
+    "--shard",
+    "shard",
+    help=(
+        "Process only the part i of N of the files of IMAGE_FILE_OR_DIR (as i/N, "
+        "from 1/N to N/N), based on a hash of their relative path: the N parts can "
+        "be run on different machines. See --manifest and the merge command"
+    ),
+    callback=validate_shard,
+    required=False,
+)
+
+manifest_option = click.option(
+    "--manifest",
+    "manifest_path",
+    help=(
+        "Path for a manifest of the run (JSON lines): status, position and time "
+        "spent for each file, and the report of the run. The manifests of the "
+        "shards can be combined with the merge command"
+    ),
+    required=False,
+)
+
+recursive_option = click.option(
+    "-r",
+    "--recursive",
+    "is_recursive",
+    is_flag=True,
+    help="Flag to also process the images in the subfolders of IMAGE_FILE_OR_DIR",
+    required=False,
+)
+
+include_option = click.option(
+    "--include",
+    "includes",
+    help=(
+        "Glob pattern for the files to process in IMAGE_FILE_OR_DIR (matched against "
+        "the name and the relative path). Multiple possible. [default: all files]"
+    ),
+    multiple=True,
+    required=False,
+)
+
+exclude_option = click.option(
+    "--exclude",
+    "excludes",
+    help=(
+        "Glob pattern for the files and folders to skip in IMAGE_FILE_OR_DIR "
+        "(matched against the name and the relative path). Multiple possible."
+    ),
+    multiple=True,
+    required=False,
+)
+
+extension_option = click.option(
+    "--ext",
+    "extensions",
+    help=(
+        "Extension of the files to process in IMAGE_FILE_OR_DIR (eg jpg, case "
+        "insensitive). Multiple possible. [default: all extensions]"
+    ),
+    multiple=True,
+    required=False,
+)
+
+sort_option = click.option(
+    "--sort",
+    "is_sorted",
+    is_flag=True,
+    help=(
+        "Flag to process the files in the order of their names (otherwise in the "
+        "order of the file system, starting right away)"
+    ),
+    required=False,
+)
+
 clear_option = click.option(
     "-c",
     "--clear",
@@ -128,6 +337,50 @@ yes_option = click.option(
 )
 
 
+DEFAULT_TOLERANCE = timedelta(seconds=10)
+
+
+@dataclass(frozen=True)
+class GeotagOptions:
+    """Options of the geotagging of photos on disk (same as the image command)
+
+    delta: shift added to the times of the photos (eg drift of the camera clock);
+    delta_tz: shift from the local time of the photos to UTC (or None), also added
+    to the times for the matching with the GPX but not written with
+    is_update_time. As with --delta-tz, is_ignore_offset is then forced.
+    tolerance: photos up to that much before the start or after the end of a
+    segment get its first or last point.
+    time_sources: chain of sources of the time of the photos (see TIME_SOURCES):
+    the first one with a time is used.
+    """
+
+    delta: timedelta = timedelta(0)
+    delta_tz: timedelta | None = None
+    tolerance: timedelta = DEFAULT_TOLERANCE
+    is_ignore_offset: bool = False
+    is_clear: bool = False
+    is_update_images: bool = True
+    is_update_time: bool = False
+    time_sources: tuple = DEFAULT_TIME_SOURCES
+
+    def __post_init__(self):
+        if not self.time_sources:
+            raise ValueError("No time source")
+        for source in self.time_sources:
+            if source not in TIME_SOURCES:
+                raise ValueError(f"Unknown time source: {source}")
+        if self.delta_tz:
+            # frozen
+            object.__setattr__(self, "is_ignore_offset", True)
+
+    @property
+    def delta_total(self):
+        """Shift to apply to the time of a photo to compare with the GPX"""
+        if self.delta_tz:
+            return self.delta + self.delta_tz
+        return self.delta
+
+
 class UpdateConfirmationAbortedException(Exception):
     """Exception raised when confirmation is denied by user (with the --ask option)"""
 
@@ -135,6 +388,7 @@ class UpdateConfirmationAbortedException(Exception):
 
 
 def compute_pos(img_time, gpx_segments, tolerance):
+    """GpsPosition for a photo time (tz-aware) or None if outside of the GPX"""
     img_time = pd.Timestamp(img_time)
     tolerance = pd.Timedelta(tolerance)
     for df in gpx_segments:
@@ -145,7 +399,7 @@ def compute_pos(img_time, gpx_segments, tolerance):
                 gps = gps.iloc[0]
             assert isinstance(gps, pd.core.series.Series)
 
-            return gps["lat"], gps["lon"]
+            return GpsPosition(gps["lat"], gps["lon"], img_time, MATCH_EXACT, 0.0)
 
         # searchsorted returns the index for insertion to keep the
         # series sorted with the arg value inserted
@@ -156,7 +410,9 @@ def compute_pos(img_time, gpx_segments, tolerance):
             if dt < tolerance:
                 # consider the first row as the value
                 gps = df.iloc[0]
-                return gps["lat"], gps["lon"]
+                return GpsPosition(
+                    gps["lat"], gps["lon"], img_time, MATCH_OUTSIDE, dt.total_seconds()
+                )
             else:
                 # no suitable point in GPX found
                 return None
@@ -167,7 +423,9 @@ def compute_pos(img_time, gpx_segments, tolerance):
                 # consider the last row as the value
                 # TODO search the next segment to see if closer ?
                 gps = df.iloc[-1]
-                return gps["lat"], gps["lon"]
+                return GpsPosition(
+                    gps["lat"], gps["lon"], img_time, MATCH_OUTSIDE, dt.total_seconds()
+                )
             else:
                 # search next segment
                 continue
@@ -180,11 +438,93 @@ def compute_pos(img_time, gpx_segments, tolerance):
             # linear interp
             lat = gps_before["lat"] + (gps_after["lat"] - gps_before["lat"]) * gap_ratio
             lon = gps_before["lon"] + (gps_after["lon"] - gps_before["lon"]) * gap_ratio
-            return lat, lon
+            gap = min(img_gap, gpx_gap - img_gap).total_seconds()
+            return GpsPosition(lat, lon, img_time, MATCH_INTERPOLATED, gap)
 
     return None
 
 
+def compute_positions(img_times, gpx_segments, tolerance):
+    """GpsPosition (or None) for each photo time: Same as compute_pos but for all
+    the times at once (vectorized over the times for each segment)
+
+    img_times: tz-aware times (or a tz-aware DatetimeIndex)
+    """
+    if isinstance(img_times, pd.DatetimeIndex):
+        t = img_times.tz_convert("utc").as_unit("ns").asi8
+        # boxed all at once (faster than by item)
+        times = img_times.to_list()
+    else:
+        times = [pd.Timestamp(img_time) for img_time in img_times]
+        # ns since epoch (UTC)
+        t = np.array([img_time.value for img_time in times], dtype=np.int64)
+    tolerance = pd.Timedelta(tolerance).value
+    positions = [None] * len(t)
+
+    def set_positions(indices, lats, lons, quality, gaps):
+        for i, lat, lon, gap in zip(indices, lats, lons, gaps, strict=True):
+            positions[i] = GpsPosition(lat, lon, times[i], quality, float(gap))
+
+    # indices of the times still to be searched in the next segments
+    pending = np.arange(len(t))
+    for df in gpx_segments:
+        if not len(pending):
+            break
+        seg_t = df.index.tz_convert("utc").as_unit("ns").asi8
+        if not len(seg_t):
+            continue
+        lats = df["lat"].to_numpy()
+        lons = df["lon"].to_numpy()
+        last = len(seg_t) - 1
+        pt = t[pending]
+        index = np.searchsorted(seg_t, pt)
+        is_exact = seg_t[np.minimum(index, last)] == pt
+        is_before = (index == 0) & ~is_exact
+        is_after = index > last
+        is_inside = ~(is_exact | is_before | is_after)
+
+        i = index[is_exact]
+        set_positions(
+            pending[is_exact], lats[i], lons[i], MATCH_EXACT, np.zeros(len(i))
+        )
+
+        dt = seg_t[0] - pt[is_before]
+        near = dt < tolerance
+        # not near: no suitable point in GPX (stays None)
+        set_positions(
+            pending[is_before][near],
+            np.full(near.sum(), lats[0]),
+            np.full(near.sum(), lons[0]),
+            MATCH_OUTSIDE,
+            dt[near] / 1e9,
+        )
+
+        dt = pt[is_after] - seg_t[last]
+        near_after = dt < tolerance
+        set_positions(
+            pending[is_after][near_after],
+            np.full(near_after.sum(), lats[last]),
+            np.full(near_after.sum(), lons[last]),
+            MATCH_OUTSIDE,
+            dt[near_after] / 1e9,
+        )
+
+        i = index[is_inside]
+        gpx_gap = seg_t[i] - seg_t[i - 1]
+        img_gap = pt[is_inside] - seg_t[i - 1]
+        gap_ratio = img_gap / gpx_gap
+        # linear interp
+        lat = lats[i - 1] + (lats[i] - lats[i - 1]) * gap_ratio
+        lon = lons[i - 1] + (lons[i] - lons[i - 1]) * gap_ratio
+        gap = np.minimum(img_gap, gpx_gap - img_gap) / 1e9
+        set_positions(pending[is_inside], lat, lon, MATCH_INTERPOLATED, gap)
+
+        # after the end (beyond the tolerance): search the next segment
+        pending = pending[is_after][~near_after]
+
+    return positions
+
+
 def format_timedelta(td):
     if td < timedelta(0):
         return "-" + format_timedelta(-td)
@@ -217,14 +557,17 @@ def process_tolerance(tolerance):
         # in case negative
         tolerance = timedelta(seconds=abs(parse_timedelta(tolerance).total_seconds()))
     else:
-        tolerance = timedelta(seconds=10)
+        tolerance = DEFAULT_TOLERANCE
     logger.info(colored(f"Tolerance: {int(tolerance.total_seconds())}s", Fore.GREEN))
     return tolerance
 
 
 def process_gpx(gpx_filepath):
     logger.info("Parsing GPX...")
-    gpx_segments = read_gpx(gpx_filepath)
+    with metrics.stage("gpx_parse"):
+        gpx_segments = read_gpx(gpx_filepath)
+    metrics.count("gpx_bytes_read", os.path.getsize(gpx_filepath))
+    metrics.count("gpx_points", sum(len(df) for df in gpx_segments))
     logger.info(
         f"GPX time range: {gpx_segments[0].iloc[0].name} => "
         f"{gpx_segments[-1].iloc[0 - 1].name}"
@@ -306,49 +649,93 @@ def parse_timedelta(time_str):
     return timedelta(**time_params)
 
 
-def process_kml(
+def process_outputs(
     positions,
     kml_output_path,
     kml_thumbnail_size,
     image_src,
     image_name,
     image_style=None,
+    is_kmz=False,
+    output_paths=(),
+    image_path=str,
+    gpx_segments=None,
+    kml_track=None,
+    kml_track_points=DEFAULT_TRACK_POINTS,
 ):
+    """Write the positions to the KML and the other outputs as they are produced
+
+    positions can be an iterator (the photos are then processed as the outputs are
+    written): It is consumed even if there is no output.
+    """
+    writers = [create_output_writer(path, image_path) for path in output_paths]
     if kml_output_path:
-        logger.info("Writing KML...")
-        if len(positions) > 0:
-            write_kml(
-                positions,
-                kml_output_path,
-                kml_thumbnail_size,
-                image_src,
-                image_name,
-                image_style,
-            )
-        else:
-            logger.error("No KML output (no georeferenced photos)!")
+        kml_writer = create_kml_writer(
+            kml_output_path,
+            kml_thumbnail_size,
+            image_src,
+            image_name,
+            image_style,
+            is_kmz,
+            gpx_segments,
+            kml_track,
+            kml_track_points,
+        )
+        writers.insert(0, kml_writer)
+
+    for writer in writers:
+        logger.info(f"Writing {writer.format_name} to {writer.path}...")
+    write_outputs(positions, writers)
+
+
+def create_kml_writer(
+    kml_path,
+    kml_thumbnail_size,
+    image_src,
+    image_name,
+    image_style=None,
+    is_kmz=False,
+    gpx_segments=None,
+    kml_track=None,
+    kml_track_points=DEFAULT_TRACK_POINTS,
+):
+    writer_class = KmzWriter if is_kmz else KmlWriter
+    return writer_class(
+        kml_path,
+        kml_thumbnail_size,
+        image_src,
+        image_name,
+        image_style,
+        gpx_segments=gpx_segments,
+        track_mode=kml_track,
+        track_points=kml_track_points,
+    )
 
 
 def write_kml(
-    positions, kml_path, kml_thumbnail_size, image_src, image_name, image_style=None
+    positions,
+    kml_path,
+    kml_thumbnail_size,
+    image_src,
+    image_name,
+    image_style=None,
+    is_kmz=False,
+    gpx_segments=None,
+    kml_track=None,
+    kml_track_points=DEFAULT_TRACK_POINTS,
 ):
-    kml = simplekml.Kml()
-    sharedstyle = simplekml.Style()
-    sharedstyle.balloonstyle.text = "$[description]"
-    for latlon, image in positions:
-        css_style = ""
-        if image_style:
-            css_style = f'style="{image_style(image)}"'
-        desc = f"""<![CDATA[
-{image_name(image)}<br/><br/>
-<img src="{image_src(image)}" width="{kml_thumbnail_size}" {css_style} />
- ]]>"""
-        pnt = kml.newpoint(description=desc, coords=[latlon[::-1]])
-        pnt.style = sharedstyle
-    try:
-        kml.save(kml_path)
-    except Exception:
-        logger.exception(f"Unable to save KML to {kml_path}")
+    kml_writer = create_kml_writer(
+        kml_path,
+        kml_thumbnail_size,
+        image_src,
+        image_name,
+        image_style,
+        is_kmz,
+        gpx_segments,
+        kml_track,
+        kml_track_points,
+    )
+    write_outputs(positions, [kml_writer])
 
 
 def colored(s, color):
@@ -1,41 +1,63 @@
-from datetime import datetime, timedelta
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
 import logging
+import os
 from pathlib import Path
+import re
 import sys
+import time
 
 import click
 import exiftool
 import pytz
 
 from .common import (
+    GpsPosition,
     UpdateConfirmationAbortedException,
     clear_option,
     delta_option,
     delta_tz_option,
+    exclude_option,
+    extension_option,
     format_timedelta,
+    include_option,
     kml_option,
+    manifest_option,
     print_delta,
     process_delta,
+    progress_option,
+    recursive_option,
+    shard_option,
+    sort_option,
     update_images_option,
     update_time_option,
     yes_option,
 )
+from .manifest import (
+    STATUS_LOCATED,
+    STATUS_NOT_LOCATED,
+    ManifestWriter,
+    format_shard,
+)
+from .metrics import metrics
+from .progress import Progress
+from .scanner import ScanOptions, scan_files
 
 logger = logging.getLogger(__package__)
 
+# files per exiftool call: the progress is updated after each batch
+EXIFTOOL_BATCH_SIZE = 50
+# summary of exiftool at the end of its output (eg "    3 image files updated")
+EXIFTOOL_SUMMARY_RE = re.compile(r"^\s*(\d+) (.+?)\s*$")
+
 
-def _get_image_files(img_fileordirpath):
+def _get_image_files(img_fileordirpath, scan_options=None):
     """Get list of image files from a file or directory path."""
     if img_fileordirpath.is_file():
         return [str(img_fileordirpath)]
     elif img_fileordirpath.is_dir():
-        # Get all non-hidden files in the directory
-        files = [
-            str(f.resolve())
-            for f in sorted(img_fileordirpath.iterdir())
-            if f.is_file() and not f.name.startswith(".")
-        ]
-        return files
+        # all the formats supported by exiftool: no check of the content
+        return list(scan_files(img_fileordirpath, scan_options))
     return []
 
 
@@ -72,6 +94,71 @@ def _build_time_shift_params(delta):
     return [f"-DateTimeOriginal+={time_shift}", "-overwrite_original"]
 
 
+def _execute_in_batches(et, params, img_files, is_progress, file_seconds=None):
+    """Run the exiftool command on the files, by batches, and log its output
+
+    The summary lines of the batches are added up so they are logged only once.
+    file_seconds (if present) gets the time spent for each file (time of its
+    batch divided by the number of files).
+    """
+    summary = Counter()
+    with Progress(len(img_files), is_enabled=is_progress) as progress:
+        for i in range(0, len(img_files), EXIFTOOL_BATCH_SIZE):
+            batch = img_files[i : i + EXIFTOOL_BATCH_SIZE]
+            start = time.perf_counter()
+            result = et.execute(*params, *batch)
+            if file_seconds is not None:
+                seconds = (time.perf_counter() - start) / len(batch)
+                for img_file in batch:
+                    file_seconds[img_file] += seconds
+            for line in (result or "").splitlines():
+                match = EXIFTOOL_SUMMARY_RE.match(line)
+                if match:
+                    summary[match[2]] += int(match[1])
+                elif line.strip():
+                    logger.info(line)
+            metrics.count("files_written", len(batch))
+            metrics.count("bytes_written", sum(os.path.getsize(f) for f in batch))
+            progress.update(len(batch))
+
+    for message, count in summary.items():
+        logger.info(f"{count:5d} {message}")
+
+
+def _exiftool_position(metadata, delta):
+    """Position of a file from its tags after the run (None if no GPS or time)
+
+    The time is DateTimeOriginal with the delta (like for the matching with the
+    GPX); exiftool does not give the quality of the match.
+    """
+    # signed (the EXIF tags have a separate ref)
+    lat = metadata.get("Composite:GPSLatitude", metadata.get("EXIF:GPSLatitude"))
+    lon = metadata.get("Composite:GPSLongitude", metadata.get("EXIF:GPSLongitude"))
+    dt_original = metadata.get("EXIF:DateTimeOriginal")
+    if lat is None or lon is None or not dt_original:
+        return None
+    try:
+        dt = datetime.strptime(str(dt_original)[:19], "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+    # assume UTC (as in the image command)
+    time_corrected = dt.replace(tzinfo=timezone.utc) + delta
+    return GpsPosition(float(lat), float(lon), time_corrected, None, None)
+
+
+def _write_manifest_entries(et, img_files, manifest, delta, file_seconds):
+    """Result of each file: located if it has a position after the run"""
+    for i in range(0, len(img_files), EXIFTOOL_BATCH_SIZE):
+        batch = img_files[i : i + EXIFTOOL_BATCH_SIZE]
+        metadata = et.get_tags(
+            batch, tags=["GPSLatitude", "GPSLongitude", "DateTimeOriginal"]
+        )
+        for img_file, m in zip(batch, metadata, strict=True):
+            pos = _exiftool_position(m, delta)
+            status = STATUS_LOCATED if pos else STATUS_NOT_LOCATED
+            manifest.add(img_file, status, pos, file_seconds.get(img_file))
+
+
 def _generate_kml_with_exiftool(et, img_files, kml_output_path):
     """
     Generate KML file using exiftool to extract GPS coordinates.
@@ -176,6 +263,14 @@ def _generate_kml_with_exiftool(et, img_files, kml_output_path):
 @update_images_option
 @update_time_option
 @yes_option
+@progress_option
+@recursive_option
+@include_option
+@exclude_option
+@extension_option
+@sort_option
+@shard_option
+@manifest_option
 @click.pass_context
 def exiftool_command(
     ctx,
@@ -189,6 +284,14 @@ def exiftool_command(
     is_update_images,
     is_update_time,
     is_yes,
+    is_progress,
+    is_recursive,
+    includes,
+    excludes,
+    extensions,
+    is_sorted,
+    shard,
+    manifest_path,
 ):
     """
     Add GPS EXIF tags to local images based on a GPX file using exiftool.
@@ -196,6 +299,7 @@ def exiftool_command(
     All GPX processing and position interpolation is handled by exiftool.
     """
     et = None
+    metrics.reset()
     try:
         if delta_tz and tz:
             raise click.UsageError("Cannot use --delta-tz and --tz at the same time")
@@ -231,6 +335,10 @@ def exiftool_command(
             delta_total = delta
 
         img_fileordirpath = Path(img_fileordirpath)
+        if shard and not img_fileordirpath.is_dir():
+            raise click.UsageError("--shard requires a folder")
+        if shard:
+            logger.info(f"Shard {format_shard(shard)} of the files")
 
         logger.info("Synching EXIF GPS to GPX using exiftool...")
 
@@ -249,12 +357,18 @@ def exiftool_command(
         # auto_start=True (default) means exiftool will start on first command
         et = exiftool.ExifToolHelper()
 
-        img_files = _get_image_files(img_fileordirpath)
+        scan_options = ScanOptions(
+            is_recursive, includes, excludes, extensions, is_sorted, shard
+        )
+        img_files = _get_image_files(img_fileordirpath, scan_options)
         if not img_files:
             logger.error("No image files found!")
             return
 
         logger.debug(f"Processing {len(img_files)} file(s)")
+        file_seconds = defaultdict(float)
+        # shift from the DateTimeOriginal after the run to the time matched
+        manifest_delta = delta_total
 
         # Use exiftool's native geotag support to update images
         if is_update_images:
@@ -266,12 +380,9 @@ def exiftool_command(
 
             # Execute geotag command using pyexiftool
             try:
-                result = et.execute(*geotag_params, *img_files)
-                if result:
-                    # Log the output from exiftool
-                    for line in result.splitlines():
-                        if line.strip():
-                            logger.info(line)
+                _execute_in_batches(
+                    et, geotag_params, img_files, is_progress, file_seconds
+                )
             except Exception as ex:
                 logger.error(f"Error during geotagging: {ex}")
 
@@ -282,11 +393,10 @@ def exiftool_command(
                 logger.debug(f"Time shift params: {time_params}")
 
                 try:
-                    result = et.execute(*time_params, *img_files)
-                    if result:
-                        for line in result.splitlines():
-                            if line.strip():
-                                logger.info(line)
+                    _execute_in_batches(
+                        et, time_params, img_files, is_progress, file_seconds
+                    )
+                    manifest_delta = delta_total - delta
                 except Exception as ex:
                     logger.error(f"Error updating time: {ex}")
 
@@ -295,6 +405,15 @@ def exiftool_command(
             logger.info("Writing KML...")
             _generate_kml_with_exiftool(et, img_files, kml_output_path)
 
+        if manifest_path:
+            logger.info("Writing manifest...")
+            with ManifestWriter(
+                manifest_path, "exiftool", img_fileordirpath, shard
+            ) as manifest:
+                _write_manifest_entries(
+                    et, img_files, manifest, manifest_delta, file_seconds
+                )
+
     except UpdateConfirmationAbortedException:
         logger.error("Update aborted by user!")
         sys.exit(0)
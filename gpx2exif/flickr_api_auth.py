@@ -1,15 +1,29 @@
 import webbrowser
 
 import flickrapi
+from requests.adapters import HTTPAdapter
 
 
-def create_flickr_api(api_key, api_secret, perms="write", token_cache_location=None):
+def set_connection_pool_size(flickr, pool_size):
+    # keep-alive connections to Flickr reused by concurrent calls (the requests
+    # default of 10 would make additional threads reconnect each time)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session = flickr.flickr_oauth.session
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+def create_flickr_api(
+    api_key, api_secret, perms="write", token_cache_location=None, pool_size=None
+):
     flickr = flickrapi.FlickrAPI(
         api_key,
         api_secret,
         format="parsed-json",
         token_cache_location=token_cache_location,
     )
+    if pool_size:
+        set_connection_pool_size(flickr, pool_size)
     if not flickr.token_valid(perms=perms):
         flickr.get_request_token(oauth_callback="oob")
         authorize_url = flickr.auth_url(perms=perms)
@@ -0,0 +1,248 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+import heapq
+import itertools
+import json
+import logging
+from pathlib import Path
+import random
+import threading
+import time
+
+from flickrapi import FlickrError
+import requests
+
+logger = logging.getLogger(__package__)
+
+JOURNAL_DIRNAME = "journal"
+
+# Flickr API error codes for a temporary problem on the Flickr side
+# (0: API not available, 105: service unavailable, 106: write operation failed)
+RETRIABLE_ERROR_CODES = {"0", "105", "106"}
+DEFAULT_MAX_RETRIES = 5
+# number of update calls sent concurrently
+DEFAULT_WORKERS = 4
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+
+def is_retriable(ex):
+    if isinstance(ex, requests.exceptions.RequestException):
+        # network error or timeout
+        return True
+    # no code: HTTP error (like 502) before the Flickr API could answer
+    return ex.code is None or str(ex.code) in RETRIABLE_ERROR_CODES
+
+
+def retry_delay(attempt, base=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(max_delay, base * 2**attempt))
+
+
+def call_key(method, params):
+    return json.dumps([method, params], sort_keys=True, default=str)
+
+
+class FlickrJournal:
+    """Record of the update calls made to Flickr, one JSON object per line.
+
+    The file is appended to after each call so it is up to date even if the run
+    is interrupted. When resuming, the calls already completed (with the same
+    parameters) are read back so they are not sent again.
+    """
+
+    def __init__(self, path, is_resume=False):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.completed = set()
+        if is_resume:
+            self.completed = self._read_completed()
+            logger.info(
+                f"Resuming: {len(self.completed)} completed Flickr calls in journal"
+            )
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # new run: start with an empty journal
+        mode = "a" if is_resume else "w"
+        self.file = open(self.path, mode, encoding="utf-8", buffering=1)
+
+    def _read_completed(self):
+        completed = set()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # last line can be truncated if the run was killed
+                        continue
+                    key = call_key(record["method"], record["params"])
+                    if record["status"] == "ok":
+                        completed.add(key)
+                    else:
+                        completed.discard(key)
+        except FileNotFoundError:
+            logger.warning(f"No journal found at {self.path}: Nothing to resume")
+        return completed
+
+    def is_completed(self, method, params):
+        return call_key(method, params) in self.completed
+
+    def record(self, method, params, status, error=None):
+        record = {
+            "time": time.time(),
+            "method": method,
+            "params": params,
+            "status": status,
+        }
+        if error is not None:
+            record["error"] = error
+        line = json.dumps(record, default=str) + "\n"
+        # calls can be recorded from multiple threads
+        with self._lock:
+            self.file.write(line)
+
+    def close(self):
+        self.file.close()
+
+
+class FlickrWriter:
+    """Send the update calls to Flickr.
+
+    With workers > 1, the calls are sent concurrently from a thread pool (over the
+    pooled keep-alive connections of the Flickr API session) while the caller goes
+    on with the next images. Calls failing with a temporary error are put in a retry
+    queue, processed by flush with exponential backoff and jitter. If a journal is
+    set, every call is recorded in it and calls already completed in a previous run
+    are skipped.
+    """
+
+    def __init__(
+        self,
+        flickr,
+        journal=None,
+        max_retries=0,
+        stats=None,
+        is_debug=False,
+        workers=1,
+    ):
+        self.flickr = flickr
+        self.journal = journal
+        self.max_retries = max_retries
+        self.stats = Counter() if stats is None else stats
+        self.is_debug = is_debug
+        # heap of (due time, sequence, attempt, call)
+        self.retry_queue = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+        self.executor = None
+        if workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+            # limit the number of calls waiting so the caller does not run ahead
+            self._in_flight = threading.BoundedSemaphore(2 * workers)
+            self._pending = set()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _get_method(self, method):
+        # method is the dotted Flickr method name eg photos.geo.setLocation
+        func = self.flickr
+        for name in method.split("."):
+            func = getattr(func, name)
+        return func
+
+    def call(self, method, params, on_success=None):
+        """Send a call (or queue it for retry on a temporary error)
+
+        Raise FlickrError if the call fails and cannot be retried (when sent
+        synchronously: In the background, the error is only logged).
+        """
+        if self.journal is not None and self.journal.is_completed(method, params):
+            logger.debug(f"{method} {params} already completed: Skipped")
+            self._count("api_calls_saved")
+            if on_success:
+                on_success()
+            return
+
+        call = (method, params, on_success)
+        if self.executor is None:
+            self._send(call, attempt=0)
+            return
+
+        self._in_flight.acquire()
+        future = self.executor.submit(self._send_or_log, call, 0)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+        self._in_flight.release()
+
+    def _send(self, call, attempt):
+        method, params, on_success = call
+        self._count("api_calls")
+        try:
+            self._get_method(method)(**params)
+        except (FlickrError, requests.exceptions.RequestException) as ex:
+            if self.journal is not None:
+                self.journal.record(method, params, "failed", str(ex))
+            if is_retriable(ex) and attempt < self.max_retries:
+                delay = retry_delay(attempt)
+                logger.warning(
+                    f"{method} failed for photo {params.get('photo_id')} ({ex}): "
+                    f"Retry in {delay:.1f}s"
+                )
+                due = time.monotonic() + delay
+                with self._lock:
+                    heapq.heappush(
+                        self.retry_queue,
+                        (due, next(self._sequence), attempt + 1, call),
+                    )
+                return
+            self._count("api_calls_failed")
+            raise
+
+        if self.journal is not None:
+            self.journal.record(method, params, "ok")
+        if on_success:
+            on_success()
+
+    def _send_or_log(self, call, attempt):
+        try:
+            self._send(call, attempt)
+        except (FlickrError, requests.exceptions.RequestException):
+            _, params, _ = call
+            msg = f"Image {params.get('photo_id')} could not be processed!"
+            lf = logger.error if not self.is_debug else logger.exception
+            lf(msg)
+
+    def _wait_pending(self):
+        if self.executor is None:
+            return
+        with self._lock:
+            pending = list(self._pending)
+        wait(pending)
+
+    def flush(self):
+        """Wait for the calls in progress then process the retry queue until empty"""
+        self._wait_pending()
+        if self.retry_queue:
+            logger.info(f"Retrying {len(self.retry_queue)} failed Flickr calls...")
+
+        while self.retry_queue:
+            due, _, attempt, call = heapq.heappop(self.retry_queue)
+            wait_time = due - time.monotonic()
+            if wait_time > 0:
+                time.sleep(wait_time)
+            self._count("api_calls_retried")
+            self._send_or_log(call, attempt)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        if self.journal is not None:
+            self.journal.close()
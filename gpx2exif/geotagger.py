@@ -0,0 +1,118 @@
+"""Library API: Geotagging of photos on disk from a process that keeps the GPX loaded
+
+    from gpx2exif import Geotagger, GeotagOptions
+
+    geotagger = Geotagger.from_gpx("track1.gpx", "track2.gpx",
+                                   options=GeotagOptions(tolerance=timedelta(minutes=1)))
+    for path, pos in geotagger.tag_many(paths, jobs=4):
+        ...
+
+The semantics are the same as the image command (with -y, and without the outputs).
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+import logging
+from pathlib import Path
+
+import pandas as pd
+import piexif
+
+from .common import GeotagOptions, compute_positions, read_gpx
+from .gpx2exif import process_image
+
+logger = logging.getLogger(__package__)
+
+# tasks submitted in advance for each thread of tag_many
+TAG_WINDOW_PER_JOB = 2
+
+
+class Geotagger:
+    """Geotagging with an index of GPX tracks, built once
+
+    gpx_segments are DataFrames indexed by time (tz-aware) with lat and lon
+    columns, like returned by read_gpx. The positions are GpsPosition (or None if
+    a time is outside the tracks).
+
+    Without any point (eg GPX just created by a logger), no time is located.
+
+    The geotagger does not change once built, so it can be shared by threads.
+    """
+
+    def __init__(self, gpx_segments, options=None):
+        # the next segment is searched when a time is after the end of a segment
+        self.gpx_segments = sorted(
+            (df for df in gpx_segments if len(df)), key=lambda df: df.index[0]
+        )
+        self.options = options or GeotagOptions()
+
+    @classmethod
+    def from_gpx(cls, *gpx_paths, options=None):
+        gpx_segments = []
+        for gpx_path in gpx_paths:
+            gpx_segments.extend(read_gpx(gpx_path))
+        geotagger = cls(gpx_segments, options)
+        if not geotagger.gpx_segments:
+            raise ValueError("No GPX point")
+        return geotagger
+
+    def locate(self, times):
+        """Positions for the times of photos (as read from the EXIF: the delta of
+        the options is added)
+
+        times can be datetimes or a DatetimeIndex. As in the EXIF without offset,
+        the naive times are assumed UTC.
+        """
+        delta_total = self.options.delta_total
+        if isinstance(times, pd.DatetimeIndex):
+            if times.tz is None:
+                times = times.tz_localize(timezone.utc)
+            times = times + delta_total
+        else:
+            times = [pd.Timestamp(t) for t in times]
+            times = [
+                (t if t.tzinfo else t.tz_localize(timezone.utc)) + delta_total
+                for t in times
+            ]
+        return compute_positions(times, self.gpx_segments, self.options.tolerance)
+
+    def tag_file(self, path):
+        """Position of the photo at path (EXIF updated according to the options)
+
+        Raise piexif.InvalidImageDataError if not a JPEG or TIFF.
+        """
+        return process_image(Path(path), self.gpx_segments, self.options, False)
+
+    def _tag_file_or_skip(self, path):
+        try:
+            return self.tag_file(path)
+        except piexif.InvalidImageDataError:
+            logger.error(f"File {Path(path).name} is not a JPEG or TIFF image")
+            return None
+
+    def tag_many(self, paths, jobs=1):
+        """Yield (path, position) for the photos, in order, with jobs threads
+
+        The files that are not images are skipped (with a None position) like in
+        the image command. The paths must be distinct: the EXIF of a file is
+        rewritten in place, so the same file tagged by 2 threads can be read while
+        half written.
+        """
+        if jobs <= 1:
+            for path in paths:
+                yield path, self._tag_file_or_skip(path)
+            return
+
+        # paths are read and submitted as the results are consumed
+        window = TAG_WINDOW_PER_JOB * jobs
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            pending = deque()
+            for path in paths:
+                pending.append((path, executor.submit(self._tag_file_or_skip, path)))
+                if len(pending) >= window:
+                    path, future = pending.popleft()
+                    yield path, future.result()
+            while pending:
+                path, future = pending.popleft()
+                yield path, future.result()
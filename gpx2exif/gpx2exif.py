@@ -1,3 +1,4 @@
+from contextlib import nullcontext
 from datetime import datetime, timezone
 from fractions import Fraction
 import logging
@@ -11,24 +12,60 @@ import piexif
 import pytz
 
 from .common import (
+    GeotagOptions,
     UpdateConfirmationAbortedException,
     clear_option,
     compute_pos,
     delta_option,
     delta_tz_option,
+    exclude_option,
+    extension_option,
     format_timedelta,
+    include_option,
     kml_option,
     kml_thumbnail_size_option,
+    kml_track_option,
+    kml_track_points_option,
+    manifest_option,
+    output_option,
     print_delta,
     process_delta,
     process_gpx,
-    process_kml,
+    process_outputs,
     process_tolerance,
+    progress_option,
+    recursive_option,
+    report_option,
+    shard_option,
+    sort_option,
+    time_source_option,
     tolerance_option,
     update_images_option,
     update_time_option,
     yes_option,
 )
+from .manifest import (
+    STATUS_LOCATED,
+    STATUS_NOT_LOCATED,
+    STATUS_SKIPPED,
+    ManifestWriter,
+    format_shard,
+)
+from .metrics import metrics
+from .progress import Progress
+from .scanner import (
+    ScanOptions,
+    count_files_in_background,
+    is_image_file,
+    scan_files,
+)
+from .time_sources import (
+    DEFAULT_TIME_SOURCES,
+    TIME_SOURCE_EXIF,
+    TIME_SOURCE_FILENAME,
+    time_from_filename,
+    time_from_mtime,
+)
 
 logger = logging.getLogger(__package__)
 
@@ -103,6 +140,13 @@ def get_gps_ifd(lat, lon, altitude=None):
 
 
 def flush_exif(file_path_s, exif_data):
+    with metrics.stage("exif_write"):
+        _flush_exif(file_path_s, exif_data)
+    metrics.count("files_written")
+    metrics.count("bytes_written", os.path.getsize(file_path_s))
+
+
+def _flush_exif(file_path_s, exif_data):
     exif_bytes = piexif.dump(exif_data)
     try_iter = 1
     while True:
@@ -119,6 +163,7 @@ def flush_exif(file_path_s, exif_data):
             try_iter += 1
             if try_iter > 3:
                 raise
+            metrics.count("flush_exif_retries")
             time.sleep(1)
             logger.warning("Retry...")
 
@@ -135,67 +180,101 @@ def clear_gps_from_exif(exif_data):
     return False
 
 
-# TODO simplify parameters => struct
-def process_image(
-    img_path,
-    gpx_segments,
-    delta,
-    delta_tz,
-    tolerance,
-    is_ignore_offset,
-    is_clear,
-    is_update_images,
-    is_update_time,
-    tz_warning=True,
-):
+def read_photo_time(img_path, options, tz_warning, load_exif):
+    """Time of the photo (tz-aware) from the first time source of the options with
+    a time and the name of that source, or (None, None)
+
+    load_exif is only called for the exif source. As for the EXIF time without
+    offset, the times of the other sources are assumed UTC.
+    """
+    for source in options.time_sources:
+        if source == TIME_SOURCE_EXIF:
+            dt = read_original_photo_time(
+                load_exif(), options.is_ignore_offset, tz_warning
+            )
+        elif source == TIME_SOURCE_FILENAME:
+            dt = time_from_filename(img_path.name)
+        else:
+            dt = time_from_mtime(img_path)
+        if dt:
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+            return dt, source
+    return None, None
+
+
+def process_image(img_path, gpx_segments, options, tz_warning=True):
+    """Position of the image (GeotagOptions options) or None if it cannot be located
+
+    The EXIF of the image is updated according to the options. The file is only
+    read if needed: not with the time from the filename and without update.
+    """
     img_path_s = str(img_path.resolve())
-    exif_data = piexif.load(str(img_path.resolve()))
-    time_original = read_original_photo_time(exif_data, is_ignore_offset, tz_warning)
+    exif_data = None
+
+    def load_exif():
+        nonlocal exif_data
+        if exif_data is None:
+            # not read entirely by piexif (eg videos)
+            if not is_image_file(img_path_s):
+                raise piexif.InvalidImageDataError("Not a JPEG, TIFF or WebP image")
+            with metrics.stage("exif_read"):
+                exif_data = piexif.load(img_path_s)
+            metrics.count("files_read")
+            metrics.count("bytes_read", os.path.getsize(img_path_s))
+        return exif_data
+
+    time_original, source = read_photo_time(img_path, options, tz_warning, load_exif)
 
     to_flush = False
 
     if not time_original:
-        logger.warning(
-            f"Cannot compute position for file {img_path.name} "
-            "(No DateTimeOriginal tag found)"
-        )
-        if is_update_images and is_clear:
-            to_flush = clear_gps_from_exif(exif_data) or to_flush
+        metrics.count("files_without_time")
+        if options.time_sources == DEFAULT_TIME_SOURCES:
+            reason = "No DateTimeOriginal tag found"
+        else:
+            reason = f"No time found from {', '.join(options.time_sources)}"
+        logger.warning(f"Cannot compute position for file {img_path.name} ({reason})")
+        if options.is_update_images and options.is_clear:
+            to_flush = clear_gps_from_exif(load_exif()) or to_flush
 
         if to_flush:
             flush_exif(img_path_s, exif_data)
         return None
 
-    time_corrected = time_original + delta
+    metrics.count(f"time_from_{source}")
+    time_corrected = time_original + options.delta_total
 
     logger.debug(f"Time corrected {time_corrected.isoformat()}")
 
-    if is_update_images and is_update_time:
+    if options.is_update_images and options.is_update_time:
         update_original_photo_time(
-            exif_data, time_corrected, delta_tz, is_ignore_offset
+            load_exif(), time_corrected, options.delta_tz, options.is_ignore_offset
         )
         to_flush = True
 
-    pos = compute_pos(time_corrected, gpx_segments, tolerance)
+    with metrics.stage("interpolation"):
+        pos = compute_pos(time_corrected, gpx_segments, options.tolerance)
     if not pos:
+        metrics.count("files_outside_gpx")
         logger.warning(
             f"Cannot compute position for file {img_path.name} ({time_corrected} "
             f"is outside GPX range + tolerance)"
         )
-        if is_update_images and is_clear:
-            to_flush = clear_gps_from_exif(exif_data) or to_flush
+        if options.is_update_images and options.is_clear:
+            to_flush = clear_gps_from_exif(load_exif()) or to_flush
 
         if to_flush:
             flush_exif(img_path_s, exif_data)
         return None
 
-    lat, lon = pos
+    lat, lon = pos.lat, pos.lon
 
     logger.debug(f"{os.path.basename(img_path)} => {lat}, {lon}")
 
-    if is_update_images:
+    if options.is_update_images:
         gps_ifd = get_gps_ifd(lat, lon)
-        save_exif_with_gps(exif_data, gps_ifd)
+        save_exif_with_gps(load_exif(), gps_ifd)
         to_flush = True
 
     if to_flush:
@@ -257,60 +336,81 @@ def update_original_photo_time(exif_data, dt, delta_tz, is_ignore_offset):
 def synch_gps_exif(
     img_fileordirpath,
     gpx_segments,
-    delta,
-    delta_tz,
-    tolerance,
-    is_ignore_offset,
-    is_clear,
-    is_update_images,
-    is_update_time,
+    options,
+    progress=None,
+    scan_options=None,
+    manifest=None,
 ):
+    """Yield the position and path of the images as they are processed
+
+    progress (if present) is updated for each file and gets the total: For a
+    folder, the files are processed as they are found (see scan_files) and
+    counted in the background. manifest (ManifestWriter, if present) gets the
+    result of each file.
+    """
+    if progress is None:
+        progress = Progress(is_enabled=False)
     if img_fileordirpath.is_file():
-        positions = []
-        pos = process_image(
-            img_fileordirpath,
-            gpx_segments,
-            delta,
-            delta_tz,
-            tolerance,
-            is_ignore_offset,
-            is_clear,
-            is_update_images,
-            is_update_time,
-        )
+        progress.set_total(1)
+        start = time.perf_counter()
+        with metrics.stage("image", is_per_file=True):
+            pos = process_image(img_fileordirpath, gpx_segments, options)
+        progress.update()
+        img_filepath = str(img_fileordirpath.resolve())
+        if manifest is not None:
+            status = STATUS_LOCATED if pos else STATUS_NOT_LOCATED
+            manifest.add(img_filepath, status, pos, time.perf_counter() - start)
         if pos:
-            positions.append((pos, str(img_fileordirpath.resolve())))
-        return positions
+            metrics.count("files_located")
+            yield pos, img_filepath
     elif img_fileordirpath.is_dir():
-        tz_warning = True
-        positions = []
-        for img_filepath in sorted(img_fileordirpath.iterdir()):
-            # do not process hidden files (sometimes used by the OS to store
-            # metadata, like .DS_store on macOS)
-            if img_filepath.is_file() and not img_filepath.name.startswith("."):
-                try:
-                    pos = process_image(
-                        img_filepath,
-                        gpx_segments,
-                        delta,
-                        delta_tz,
-                        tolerance,
-                        is_ignore_offset,
-                        is_clear,
-                        is_update_images,
-                        is_update_time,
-                        tz_warning,
-                    )
-                    # TODO ensure TZ Warning has really been output
-                    tz_warning = False
-                    if pos:
-                        positions.append((pos, str(img_filepath.resolve())))
-                except piexif.InvalidImageDataError:
-                    logger.error(
-                        f"File {img_filepath.name} is not a JPEG or TIFF image"
-                    )
-
-        return positions
+        stop_count = None
+        if progress.is_enabled:
+            # for the bar and the ETA
+            stop_count = count_files_in_background(
+                img_fileordirpath, scan_options, progress.set_total
+            )
+        try:
+            yield from _synch_gps_exif_folder(
+                img_fileordirpath,
+                gpx_segments,
+                options,
+                progress,
+                scan_options,
+                manifest,
+            )
+        finally:
+            if stop_count is not None:
+                stop_count.set()
+
+
+def _synch_gps_exif_folder(
+    img_dirpath, gpx_segments, options, progress, scan_options, manifest
+):
+    tz_warning = True
+    # the folder has been resolved: the paths are absolute
+    for img_filepath in scan_files(
+        img_dirpath, scan_options, lambda _: metrics.count("files_skipped")
+    ):
+        img_filepath = Path(img_filepath)
+        start = time.perf_counter()
+        try:
+            with metrics.stage("image", is_per_file=True):
+                pos = process_image(img_filepath, gpx_segments, options, tz_warning)
+            # TODO ensure TZ Warning has really been output
+            tz_warning = False
+            status = STATUS_LOCATED if pos else STATUS_NOT_LOCATED
+        except piexif.InvalidImageDataError:
+            metrics.count("files_skipped")
+            logger.error(f"File {img_filepath.name} is not a JPEG or TIFF image")
+            pos = None
+            status = STATUS_SKIPPED
+        progress.update()
+        if manifest is not None:
+            manifest.add(img_filepath, status, pos, time.perf_counter() - start)
+        if pos:
+            metrics.count("files_located")
+            yield pos, str(img_filepath)
 
 
 def image_src(x):
@@ -379,6 +479,7 @@ def image_style(x):
     required=False,
 )
 @tolerance_option
+@time_source_option
 @click.option(
     "-o",
     "--ignore-offset",
@@ -393,10 +494,32 @@ def image_style(x):
 )
 @clear_option
 @kml_option
+@output_option
 @update_images_option
 @update_time_option
 @yes_option
 @kml_thumbnail_size_option
+@kml_track_option
+@kml_track_points_option
+@report_option
+@progress_option
+@recursive_option
+@include_option
+@exclude_option
+@extension_option
+@sort_option
+@shard_option
+@manifest_option
+@click.option(
+    "--kmz",
+    "is_kmz",
+    is_flag=True,
+    help=(
+        "Flag to write the --kml output as a KMZ, with thumbnails of the photos "
+        "embedded (instead of links to the photo files)"
+    ),
+    required=False,
+)
 @click.pass_context
 def gpx2exif(
     ctx,
@@ -406,15 +529,33 @@ def gpx2exif(
     delta_tz,
     tz,
     tolerance,
+    time_sources,
     is_ignore_offset,
     is_clear,
     kml_output_path,
+    output_paths,
     kml_thumbnail_size,
+    kml_track,
+    kml_track_points,
     is_update_images,
     is_update_time,
     is_yes,
+    is_kmz,
+    report_path,
+    is_progress,
+    is_recursive,
+    includes,
+    excludes,
+    extensions,
+    is_sorted,
+    shard,
+    manifest_path,
 ):
+    metrics.reset()
     try:
+        if is_kmz and not kml_output_path:
+            raise click.UsageError("--kmz requires --kml")
+
         if delta_tz and tz:
             raise click.UsageError("Cannot use --delta-tz and --tz at the same time")
 
@@ -456,15 +597,25 @@ def gpx2exif(
         else:
             delta_tz = None
 
+        options = GeotagOptions(
+            delta,
+            delta_tz,
+            process_tolerance(tolerance),
+            is_ignore_offset,
+            is_clear,
+            is_update_images,
+            is_update_time,
+            time_sources or DEFAULT_TIME_SOURCES,
+        )
         if delta_tz:
             print_delta(delta_tz, "TZ time")
-            delta_total = delta + delta_tz
-            print_delta(delta_total, "Total time")
-        else:
-            delta_total = delta
+            print_delta(options.delta_total, "Total time")
 
-        tolerance = process_tolerance(tolerance)
         img_fileordirpath = Path(img_fileordirpath)
+        if shard and not img_fileordirpath.is_dir():
+            raise click.UsageError("--shard requires a folder")
+        if shard:
+            logger.info(f"Shard {format_shard(shard)} of the files")
 
         logger.info("Synching EXIF GPS to GPX...")
         if not is_update_images:
@@ -478,26 +629,36 @@ def gpx2exif(
                 if not click.confirm("The images will be updated. Confirm?"):
                     raise UpdateConfirmationAbortedException()
 
-        positions = synch_gps_exif(
-            img_fileordirpath,
-            gpx_segments,
-            delta_total,
-            delta_tz,
-            tolerance,
-            is_ignore_offset,
-            is_clear,
-            is_update_images,
-            is_update_time,
-        )
-
-        process_kml(
-            positions,
-            kml_output_path,
-            kml_thumbnail_size,
-            image_src,
-            image_name,
-            image_style,
-        )
+        manifest = None
+        if manifest_path:
+            manifest = ManifestWriter(manifest_path, "image", img_fileordirpath, shard)
+        with Progress(is_enabled=is_progress) as progress, manifest or nullcontext():
+            # processed while the outputs are written
+            scan_options = ScanOptions(
+                is_recursive, includes, excludes, extensions, is_sorted, shard
+            )
+            positions = synch_gps_exif(
+                img_fileordirpath,
+                gpx_segments,
+                options,
+                progress,
+                scan_options,
+                manifest,
+            )
+
+            process_outputs(
+                positions,
+                kml_output_path,
+                kml_thumbnail_size,
+                image_src,
+                image_name,
+                image_style,
+                is_kmz,
+                output_paths,
+                gpx_segments=gpx_segments,
+                kml_track=kml_track,
+                kml_track_points=kml_track_points,
+            )
 
     except UpdateConfirmationAbortedException:
         logger.error("Update aborted by user!")
@@ -523,3 +684,7 @@ def gpx2exif(
         if err_msg:
             lf(err_msg)
         sys.exit(1)
+
+    finally:
+        if report_path:
+            metrics.write_report(report_path)
@@ -1,16 +1,21 @@
 from collections import namedtuple
-from datetime import timezone
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta, timezone
 import logging
+from pathlib import Path
 import re
 import sys
+import time
 
 from addict import Dict as Addict
 import click
 import click_config_file
 import dateutil.parser
 from flickrapi import FlickrError
+import requests
 
 from .common import (
+    DEFAULT_APP_DIR,
     clear_option,
     compute_pos,
     delta_option,
@@ -18,20 +23,39 @@ from .common import (
     format_timedelta,
     kml_option,
     kml_thumbnail_size_option,
+    kml_track_option,
+    kml_track_points_option,
+    output_option,
+    parse_timedelta,
     print_delta,
     process_delta,
     process_gpx,
-    process_kml,
+    process_outputs,
     process_tolerance,
+    progress_option,
+    report_option,
+    reverse_flag,
     tolerance_option,
     update_images_option,
     update_time_option,
 )
+from .album_cache import ALBUM_CACHE_DIRNAME, AlbumCache
 from .flickr_api_auth import create_flickr_api
+from .flickr_writer import (
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_WORKERS,
+    JOURNAL_DIRNAME,
+    FlickrJournal,
+    FlickrWriter,
+)
+from .metrics import metrics
+from .progress import Progress
 
 logger = logging.getLogger(__package__)
 
 FlickrAlbum = namedtuple("FlickrAlbum", "album_id url")
+# range of date taken (naive datetimes, as on Flickr) for a search of photos
+FlickrTimeRange = namedtuple("FlickrTimeRange", "min_taken max_taken")
 
 
 def create_photopage_url(image, user):
@@ -49,12 +73,60 @@ def parse_album_url(ctx, param, value):
     return None
 
 
-def _get_page_of_images_in_album(flickr, album_id, page, acc, output=False):
+# maximum allowed by the Flickr API for photosets.getPhotos
+ALBUM_PAGE_SIZE = 500
+# number of album pages requested at the same time after the first one
+ALBUM_PAGE_WORKERS = 4
+ALBUM_EXTRAS = "url_m,date_taken,geo,last_update"
+# margin for the clock difference with Flickr when asking for recent updates
+RECENTLY_UPDATED_MARGIN = 300
+
+
+def _iter_pages(get_page, workers, on_total=None):
+    """Yield the photos of a paged Flickr listing, page by page.
+
+    The first page gives the number of pages: The remaining ones are then fetched
+    concurrently while the photos of the first page are consumed. The photos are
+    yielded in listing order. on_total (if present) is called with the total number
+    of photos of the listing once known.
+    """
+
+    def timed_get_page(page):
+        metrics.count("api_calls_list")
+        with metrics.stage("flickr_list_page", is_per_file=True):
+            return get_page(page)
+
+    info = timed_get_page(1)
+    if on_total is not None:
+        on_total(int(info.total or 0))
+    pages = int(info.pages or 1)
+    if pages <= 1 or workers <= 1:
+        yield from info.photo
+        for page in range(2, pages + 1):
+            yield from timed_get_page(page).photo
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(timed_get_page, page) for page in range(2, pages + 1)
+        ]
+        try:
+            yield from info.photo
+            for future in futures:
+                yield from future.result().photo
+        finally:
+            # in case of error or consumer stopping early
+            for future in futures:
+                future.cancel()
+
+
+def _get_page_of_images_in_album(flickr, album_id, page, output=False):
     album_info = Addict(
         flickr.photosets.getPhotos(
             photoset_id=album_id,
             page=page,
-            extras="url_m,date_taken,geo",
+            per_page=ALBUM_PAGE_SIZE,
+            extras=ALBUM_EXTRAS,
         )
     ).photoset
 
@@ -63,51 +135,229 @@ def _get_page_of_images_in_album(flickr, album_id, page, acc, output=False):
             f"Processing album '{album_info.title}' with {album_info.total} photos..."
         )
 
-    acc.extend(album_info.photo)
-
     # return album for data about it
     return album_info
 
 
-def get_images_in_album(flickr, album):
-    flickr_images = []
-    page = 1
-    while True:
-        album_info = _get_page_of_images_in_album(
-            flickr,
-            album.album_id,
-            page,
-            flickr_images,
-            output=(page == 1),
+def get_images_in_album(flickr, album, workers=ALBUM_PAGE_WORKERS, on_total=None):
+    """Yield the images of the album (lazily, see _iter_pages)"""
+
+    def get_page(page):
+        return _get_page_of_images_in_album(
+            flickr, album.album_id, page, output=(page == 1)
         )
 
-        if page >= album_info.pages:
-            break
-        page += 1
+    return _iter_pages(get_page, workers, on_total)
+
+
+def get_recently_updated_images(flickr, min_date, workers=ALBUM_PAGE_WORKERS):
+    """Yield the images of the logged in user updated since min_date (Unix time)"""
+
+    def get_page(page):
+        return Addict(
+            flickr.photos.recentlyUpdated(
+                min_date=int(min_date),
+                page=page,
+                per_page=ALBUM_PAGE_SIZE,
+                extras=ALBUM_EXTRAS,
+            )
+        ).photos
+
+    return _iter_pages(get_page, workers)
+
+
+# Flickr does not return more than that for a single search
+SEARCH_MAX_RESULTS = 4000
+
+
+def compute_search_time_range(gpx_segments, delta_total, tolerance):
+    """Range of date taken for photos that can possibly be matched to the GPX
+
+    The date taken is shifted by delta_total and then must be inside the GPX time
+    range + tolerance (see compute_pos).
+    """
+    gpx_start = min(df.index[0] for df in gpx_segments).tz_convert("utc")
+    gpx_end = max(df.index[-1] for df in gpx_segments).tz_convert("utc")
+    # 1s margin for the rounding of the date taken
+    margin = tolerance + timedelta(seconds=1)
+    min_taken = gpx_start.to_pydatetime() - margin - delta_total
+    max_taken = gpx_end.to_pydatetime() + margin - delta_total
+    return FlickrTimeRange(
+        min_taken.replace(tzinfo=None), max_taken.replace(tzinfo=None)
+    )
+
+
+def search_images_in_time_range(
+    flickr, user, time_range, workers=ALBUM_PAGE_WORKERS, on_total=None
+):
+    """Yield the images of the user taken inside the time range (lazily)"""
+
+    def get_page(page):
+        photos = Addict(
+            flickr.photos.search(
+                user_id=user.id,
+                min_taken_date=format_flickr_date_taken(time_range.min_taken),
+                max_taken_date=format_flickr_date_taken(time_range.max_taken),
+                sort="date-taken-asc",
+                page=page,
+                per_page=ALBUM_PAGE_SIZE,
+                extras=ALBUM_EXTRAS,
+            )
+        ).photos
+
+        if page == 1:
+            logger.info(
+                f"Processing {photos.total} photos taken between "
+                f"{time_range.min_taken} and {time_range.max_taken}..."
+            )
+            if int(photos.total or 0) > SEARCH_MAX_RESULTS:
+                logger.warning(
+                    f"Flickr only returns the first {SEARCH_MAX_RESULTS} photos of a "
+                    "search: Some photos will not be processed!"
+                )
+
+        return photos
 
-    return flickr_images
+    return _iter_pages(get_page, workers, on_total)
 
 
-def clear_location_from_flickr(flickr, image):
+def _get_album_date_update(flickr, album):
+    album_info = Addict(flickr.photosets.getInfo(photoset_id=album.album_id)).photoset
+    # changes when photos are added to or removed from the album
+    return str(album_info.date_update)
+
+
+def _list_images_in_album(flickr, album, entry, on_total=None):
+    # accumulate for the cache while streaming to the caller
+    for image in get_images_in_album(flickr, album, on_total=on_total):
+        entry["photos"].append(image)
+        yield image
+
+
+def _refresh_album_entry(flickr, album, entry):
+    images_by_id = {image.id: i for i, image in enumerate(entry["photos"])}
+    min_date = entry["refreshed"] - RECENTLY_UPDATED_MARGIN
+    num_updated = 0
+    for image in get_recently_updated_images(flickr, min_date):
+        i = images_by_id.get(image.id)
+        if i is None:
+            # not in the album
+            continue
+        if str(image.lastupdate) != str(entry["photos"][i].lastupdate):
+            entry["photos"][i] = image
+            num_updated += 1
+    logger.info(f"Album cache refreshed: {num_updated} images updated on Flickr")
+
+
+def get_images_in_album_cached(
+    flickr, album, album_cache, on_total=None, is_refresh=False
+):
+    """Return the album cache entry and an iterable on its images
+
+    The entry is complete only after the iterable has been consumed. It should then
+    be saved to the cache. on_total is only called for a listing: Otherwise the
+    images are a list.
+
+    With is_refresh, a fresh entry is still checked against Flickr (incrementally):
+    for the updates, which are skipped if the cached location and date are the
+    same.
+    """
+    now = time.time()
+    entry = album_cache.load(album.album_id)
+    if entry is not None:
+        if not is_refresh and album_cache.is_fresh(entry):
+            logger.info(
+                f"Processing album with {len(entry['photos'])} photos (from cache)..."
+            )
+            return entry, entry["photos"]
+
+        date_update = _get_album_date_update(flickr, album)
+        if date_update == entry["date_update"]:
+            # same photos in the album: only fetch the ones that have changed
+            _refresh_album_entry(flickr, album, entry)
+            entry["refreshed"] = now
+            logger.info(f"Processing album with {len(entry['photos'])} photos...")
+            return entry, entry["photos"]
+        logger.info("Album has changed since cached: Full listing")
+    else:
+        date_update = _get_album_date_update(flickr, album)
+
+    entry = {"date_update": date_update, "refreshed": now, "photos": []}
+    return entry, _list_images_in_album(flickr, album, entry, on_total)
+
+
+# Flickr keeps 6 decimals for the location: below that, no change
+LOCATION_EPSILON = 1e-6
+# Flickr date taken has a resolution of 1 second
+DATE_TAKEN_EPSILON = timedelta(seconds=1)
+
+
+def _float_or_zero(value):
+    # the geo extras are 0 if not georeferenced (and missing if not requested)
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def is_same_flickr_location(image, pos):
+    lat = _float_or_zero(getattr(image, "latitude", 0))
+    lon = _float_or_zero(getattr(image, "longitude", 0))
+    if not lat and not lon:
+        return False
+    return abs(lat - pos[0]) < LOCATION_EPSILON and abs(lon - pos[1]) < LOCATION_EPSILON
+
+
+def is_same_flickr_date_taken(image, dt):
+    date_taken = dateutil.parser.isoparse(image.datetaken)
+    return abs(date_taken - dt.replace(tzinfo=None)) < DATE_TAKEN_EPSILON
+
+
+def clear_location_from_flickr(writer, image):
     # only clear if alread georeferenced
     # is 0 if not georeferenced
     if image.latitude:
-        flickr.photos.geo.removeLocation(photo_id=image.id)
 
+        def on_success():
+            # keep the image in sync with what is now on Flickr
+            image.latitude = 0
+            image.longitude = 0
 
-def set_flickr_location(flickr, image, pos):
-    flickr.photos.geo.setLocation(photo_id=image.id, lat=pos[0], lon=pos[1])
+        writer.call("photos.geo.removeLocation", {"photo_id": image.id}, on_success)
+        return True
+    return False
+
+
+def set_flickr_location(writer, image, pos):
+    def on_success():
+        image.latitude = pos[0]
+        image.longitude = pos[1]
+
+    writer.call(
+        "photos.geo.setLocation",
+        {"photo_id": image.id, "lat": pos[0], "lon": pos[1]},
+        on_success,
+    )
 
 
 def format_flickr_date_taken(dt):
     return dt.strftime("%Y-%m-%d %H:%M:%S")
 
 
-def set_flickr_date_taken(flickr, image, dt):
-    flickr.photos.setDates(
-        photo_id=image.id,
-        date_taken=format_flickr_date_taken(dt),
-        date_taken_granularity=0,
+def set_flickr_date_taken(writer, image, dt):
+    date_taken = format_flickr_date_taken(dt)
+
+    def on_success():
+        image.datetaken = date_taken
+
+    writer.call(
+        "photos.setDates",
+        {
+            "photo_id": image.id,
+            "date_taken": date_taken,
+            "date_taken_granularity": 0,
+        },
+        on_success,
     )
 
 
@@ -122,7 +372,15 @@ def process_image(
     is_clear,
     is_update_images,
     is_update_time,
+    stats=None,
+    writer=None,
 ):
+    # stats: optional Counter of the API calls made and saved
+    # writer: optional FlickrWriter for the updates (default: direct calls)
+    if writer is None:
+        writer = FlickrWriter(flickr, stats=stats)
+    stats = writer.stats
+
     time_original = dateutil.parser.isoparse(image.datetaken)
     time_original = time_original.replace(tzinfo=timezone.utc)
     time_corrected = time_original + delta_total
@@ -134,23 +392,33 @@ def process_image(
     logger.debug(f"Time corrected {time_corrected.isoformat()}")
 
     if is_update_images and is_update_time:
-        set_flickr_date_taken(flickr, image, time_updated)
+        if is_same_flickr_date_taken(image, time_updated):
+            logger.debug("Date taken unchanged: Not updated")
+            stats["api_calls_saved"] += 1
+        else:
+            set_flickr_date_taken(writer, image, time_updated)
 
-    pos = compute_pos(time_corrected, gpx_segments, tolerance)
+    with metrics.stage("interpolation"):
+        pos = compute_pos(time_corrected, gpx_segments, tolerance)
     if not pos:
         logger.warning(
             f"Cannot compute position for image {image_url} ({time_corrected} "
             f"is outside GPX range + tolerance)"
         )
         if is_clear and is_update_images:
-            clear_location_from_flickr(flickr, image)
+            if not clear_location_from_flickr(writer, image):
+                stats["api_calls_saved"] += 1
 
         return
 
     logger.debug(f"Pos: {pos}")
 
     if is_update_images:
-        set_flickr_location(flickr, image, pos)
+        if is_same_flickr_location(image, pos):
+            logger.debug("Location unchanged: Not updated")
+            stats["api_calls_saved"] += 1
+        else:
+            set_flickr_location(writer, image, pos)
 
     return pos
 
@@ -167,38 +435,93 @@ def synch_gps_flickr(
     is_update_images,
     is_update_time,
     is_debug,
+    album_cache=None,
+    time_range=None,
+    writer=None,
+    progress=None,
 ):
-    images = get_images_in_album(flickr, album)
+    # either album or time_range (search among the photos of user)
+    if writer is None:
+        writer = FlickrWriter(flickr, is_debug=is_debug)
+    stats = writer.stats
+    if progress is None:
+        progress = Progress(is_enabled=False)
+    # the update calls are only merged into metrics at the end
+    progress.stats = stats
 
     logger.warning("Flickr images do not have a timezone! Assumes UTC (+00:00)")
 
+    if album is None:
+        images = search_images_in_time_range(
+            flickr, user, time_range, on_total=progress.set_total
+        )
+        # only album listings are cached
+        album_cache = None
+    elif album_cache is not None:
+        # a change made on Flickr since the listing would be ignored by the updates
+        album_entry, images = get_images_in_album_cached(
+            flickr,
+            album,
+            album_cache,
+            on_total=progress.set_total,
+            is_refresh=is_update_images,
+        )
+        if isinstance(images, list):
+            progress.set_total(len(images))
+    else:
+        # lazy: processing starts as soon as the first page has been received
+        images = get_images_in_album(flickr, album, on_total=progress.set_total)
+
     positions = []
     for image in images:
+        stats["images"] += 1
         try:
-            pos = process_image(
-                flickr,
-                image,
-                user,
-                gpx_segments,
-                delta_total,
-                delta_time,
-                tolerance,
-                is_clear,
-                is_update_images,
-                is_update_time,
-            )
+            with metrics.stage("flickr_image", is_per_file=True):
+                pos = process_image(
+                    flickr,
+                    image,
+                    user,
+                    gpx_segments,
+                    delta_total,
+                    delta_time,
+                    tolerance,
+                    is_clear,
+                    is_update_images,
+                    is_update_time,
+                    writer=writer,
+                )
             if pos:
                 positions.append((pos, image))
-        except FlickrError:
+        except (FlickrError, requests.exceptions.RequestException):
             msg = f"Image {image.id} could not be processed!"
             lf = logger.error if not is_debug else logger.exception
             lf(msg)
+        progress.update()
+
+    with metrics.stage("flickr_flush"):
+        writer.flush()
+    metrics.update(stats)
+    # now counted in metrics
+    progress.stats = None
+
+    logger.info(
+        f"{stats['images']} Flickr images processed: {stats['api_calls']} API "
+        f"update calls made, {stats['api_calls_saved']} saved (already up to date)"
+    )
+    if stats["api_calls_retried"] or stats["api_calls_failed"]:
+        logger.info(
+            f"{stats['api_calls_retried']} API calls retried, "
+            f"{stats['api_calls_failed']} failed"
+        )
+
+    if album_cache is not None:
+        # the images have been kept in sync with the updates made on Flickr
+        album_cache.save(album.album_id, album_entry)
 
     return positions
 
 
 DEFAULT_CONFIG_FILENAME = "flickr_api_credentials.txt"
-DEFAULT_APP_DIR = "gpx2exif"
 DEFAULT_CONFIG_PATH = f"{click.get_app_dir(DEFAULT_APP_DIR)}/{DEFAULT_CONFIG_FILENAME}"
 
 CONFIG_FILE_HELP = (
@@ -217,15 +540,89 @@ CONFIG_FILE_HELP = (
     metavar="GPX_FILE",
     type=click.Path(exists=True, resolve_path=True, dir_okay=False),
 )
-@click.argument("flickr_album", metavar="FLICKR_ALBUM_URL", callback=parse_album_url)
+@click.argument(
+    "flickr_album",
+    metavar="[FLICKR_ALBUM_URL]",
+    callback=parse_album_url,
+    required=False,
+)
+@click.option(
+    "--user",
+    "flickr_user_url",
+    help=(
+        "Flickr URL of a user (eg https://www.flickr.com/photos/<user>/) to use "
+        "instead of FLICKR_ALBUM_URL: The photos of the user taken inside the time "
+        "range of the GPX (+ tolerance, with the delta applied) are searched and "
+        "processed"
+    ),
+    required=False,
+)
 @delta_option
 @delta_tz_option
 @tolerance_option
 @clear_option
 @kml_option
+@output_option
 @update_images_option
 @update_time_option
 @kml_thumbnail_size_option
+@kml_track_option
+@kml_track_points_option
+@report_option
+@progress_option
+@click.option(
+    "--album-cache-ttl",
+    "album_cache_ttl",
+    help=(
+        "Duration during which a cached album listing is used without checking "
+        "Flickr for updates (same format as --tolerance). After that, the listing is "
+        "refreshed incrementally. When the Flickr images are updated, the listing is "
+        "always refreshed."
+    ),
+    required=False,
+    default="1h",
+    show_default=True,
+)
+@click.option(
+    "--no-album-cache",
+    "is_album_cache",
+    is_flag=True,
+    default=False,
+    callback=reverse_flag,
+    help="Flag to indicate that the album listing should not be cached on disk",
+    required=False,
+)
+@click.option(
+    "--retries",
+    "max_retries",
+    type=click.INT,
+    default=DEFAULT_MAX_RETRIES,
+    show_default=True,
+    help=(
+        "Number of times an update call failing with a temporary error (eg HTTP 502) "
+        "is retried, with exponential backoff"
+    ),
+    required=False,
+)
+@click.option(
+    "--workers",
+    "workers",
+    type=click.IntRange(min=1),
+    default=DEFAULT_WORKERS,
+    show_default=True,
+    help="Number of update calls sent to Flickr concurrently (1: sequential)",
+    required=False,
+)
+@click.option(
+    "--resume",
+    "is_resume",
+    is_flag=True,
+    help=(
+        "Flag to indicate that the updates already completed in the previous run for "
+        "the same album or user (according to its journal) should not be sent again"
+    ),
+    required=False,
+)
 @click.option(
     "--api_key",
     "api_key",
@@ -252,17 +649,34 @@ def gpx2flickr(
     ctx,
     gpx_filepath,
     flickr_album,
+    flickr_user_url,
     delta,
     delta_tz,
     tolerance,
     is_clear,
     kml_output_path,
+    output_paths,
     kml_thumbnail_size,
+    kml_track,
+    kml_track_points,
     is_update_images,
     is_update_time,
+    album_cache_ttl,
+    is_album_cache,
+    max_retries,
+    workers,
+    is_resume,
     api_key,
     api_secret,
+    report_path,
+    is_progress,
 ):
+    # outside of the try: reported by click as a usage error
+    if (flickr_album is None) == (flickr_user_url is None):
+        raise click.UsageError("Either FLICKR_ALBUM_URL or --user must be set")
+
+    writer = None
+    metrics.reset()
     try:
         logger.info("Parsing time shift...")
         delta = process_delta(delta)
@@ -280,14 +694,44 @@ def gpx2flickr(
         tolerance = process_tolerance(tolerance)
         gpx_segments = process_gpx(gpx_filepath)
 
-        token_cache_location = click.get_app_dir(DEFAULT_APP_DIR)
+        app_dir = click.get_app_dir(DEFAULT_APP_DIR)
+        token_cache_location = app_dir
+
+        if is_album_cache:
+            album_cache_ttl = abs(parse_timedelta(album_cache_ttl).total_seconds())
+            album_cache_dir = Path(app_dir) / ALBUM_CACHE_DIRNAME
+            album_cache = AlbumCache(album_cache_dir, album_cache_ttl)
+        else:
+            album_cache = None
 
         logger.info("Logging in to Flickr...")
         flickr = create_flickr_api(
-            api_key, api_secret, token_cache_location=token_cache_location
+            api_key,
+            api_secret,
+            token_cache_location=token_cache_location,
+            # connections for the listing and the updates
+            pool_size=ALBUM_PAGE_WORKERS + workers,
         )
 
-        user = Addict(flickr.urls.lookupUser(url=flickr_album.url)).user
+        if flickr_album is not None:
+            user = Addict(flickr.urls.lookupUser(url=flickr_album.url)).user
+            time_range = None
+        else:
+            user = Addict(flickr.urls.lookupUser(url=flickr_user_url)).user
+            time_range = compute_search_time_range(gpx_segments, delta_total, tolerance)
+
+        journal = None
+        if is_update_images:
+            if flickr_album is not None:
+                journal_name = f"album-{flickr_album.album_id}.jsonl"
+            else:
+                journal_name = f"user-{user.id}.jsonl"
+            journal_path = Path(app_dir) / JOURNAL_DIRNAME / journal_name
+            logger.debug(f"Journal of the Flickr updates: {journal_path}")
+            journal = FlickrJournal(journal_path, is_resume)
+        writer = FlickrWriter(
+            flickr, journal, max_retries, is_debug=ctx.obj["DEBUG"], workers=workers
+        )
 
         logger.info("Synching Flickr images to GPX...")
         if not is_update_images:
@@ -296,19 +740,24 @@ def gpx2flickr(
             fdt = format_timedelta(delta)
             logger.warning(f"The times in the Flickr images will be shifted: {fdt}!")
 
-        positions = synch_gps_flickr(
-            flickr,
-            user,
-            flickr_album,
-            gpx_segments,
-            delta_total,
-            delta,
-            tolerance,
-            is_clear,
-            is_update_images,
-            is_update_time,
-            ctx.obj["DEBUG"],
-        )
+        with Progress(unit="photos", is_enabled=is_progress) as progress:
+            positions = synch_gps_flickr(
+                flickr,
+                user,
+                flickr_album,
+                gpx_segments,
+                delta_total,
+                delta,
+                tolerance,
+                is_clear,
+                is_update_images,
+                is_update_time,
+                ctx.obj["DEBUG"],
+                album_cache,
+                time_range,
+                writer,
+                progress,
+            )
 
         def image_src(x):
             return x.url_m
@@ -316,8 +765,17 @@ def gpx2flickr(
         def image_name(x):
             return create_photopage_url(x, user)
 
-        process_kml(
-            positions, kml_output_path, kml_thumbnail_size, image_src, image_name
+        process_outputs(
+            positions,
+            kml_output_path,
+            kml_thumbnail_size,
+            image_src,
+            image_name,
+            output_paths=output_paths,
+            image_path=image_name,
+            gpx_segments=gpx_segments,
+            kml_track=kml_track,
+            kml_track_points=kml_track_points,
         )
 
     except Exception as ex:
@@ -325,3 +783,9 @@ def gpx2flickr(
         lf = logger.error if not ctx.obj["DEBUG"] else logger.exception
         lf(str(ex))
         sys.exit(1)
+
+    finally:
+        if writer is not None:
+            writer.close()
+        if report_path:
+            metrics.write_report(report_path)
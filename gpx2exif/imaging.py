@@ -0,0 +1,133 @@
+from io import BytesIO
+import logging
+import math
+import struct
+
+import piexif
+
+try:
+    from PIL import Image, ImageOps
+
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+logger = logging.getLogger(__package__)
+
+JPEG_QUALITY = 85
+# the EXIF (APP1 segment) is at most 64 KB, at the start of the file
+EXIF_HEADER_SIZE = 128 * 1024
+# EXIF orientation => transposition to display the image upright
+ORIENTATION_TRANSPOSE = {
+    2: "FLIP_LEFT_RIGHT",
+    3: "ROTATE_180",
+    4: "FLIP_TOP_BOTTOM",
+    5: "TRANSPOSE",
+    6: "ROTATE_270",
+    7: "TRANSVERSE",
+    8: "ROTATE_90",
+}
+
+
+def read_exif_thumbnail(content):
+    """Return the JPEG thumbnail embedded in the EXIF (or None)
+
+    Does not decode the image itself.
+    """
+    try:
+        return piexif.load(content).get("thumbnail") or None
+    except (piexif.InvalidImageDataError, ValueError):
+        return None
+
+
+def open_reduced(source, max_size):
+    """Open a JPEG decoded at a reduced size, with the EXIF orientation applied
+
+    source is a path or the content of the file. With draft, libjpeg only decodes
+    at the smallest scale (1/2, 1/4 or 1/8) still larger than max_size, which is
+    much faster than a full decode for large photos.
+    """
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    image = Image.open(source)
+    image.draft("RGB", (max_size, max_size))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+def crop_relative(image, crop):
+    """Crop to (left, top, right, bottom) given as fractions of the image size"""
+    left, top, right, bottom = crop
+    width, height = image.size
+    return image.crop(
+        (
+            round(left * width),
+            round(top * height),
+            round(right * width),
+            round(bottom * height),
+        )
+    )
+
+
+def encode_jpeg(image, quality=JPEG_QUALITY):
+    output = BytesIO()
+    image.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+def reduce_image(source, max_size, crop=None):
+    """JPEG content of the image reduced to fit in max_size (optionally cropped)"""
+    if crop:
+        # decode larger so the cropped region still fills max_size
+        left, top, right, bottom = crop
+        scale = max(right - left, bottom - top)
+        image = open_reduced(source, math.ceil(max_size / scale))
+        image = crop_relative(image, crop)
+    else:
+        image = open_reduced(source, max_size)
+    image.thumbnail((max_size, max_size))
+    return encode_jpeg(image)
+
+
+def apply_orientation(image, orientation):
+    method = ORIENTATION_TRANSPOSE.get(orientation)
+    if method is None:
+        return image
+    return image.transpose(getattr(Image.Transpose, method))
+
+
+def read_exif_header(path):
+    """EXIF of a photo read from the start of the file only (None if incomplete)"""
+    with open(path, "rb") as f:
+        header = f.read(EXIF_HEADER_SIZE)
+    try:
+        return piexif.load(header)
+    except (piexif.InvalidImageDataError, ValueError, IndexError, struct.error):
+        return None
+
+
+def make_thumbnail(path, max_size):
+    """JPEG thumbnail of the photo, upright
+
+    The thumbnail embedded in the EXIF is used if present (the photo is not even
+    read entirely), otherwise the photo is reduced (requires Pillow: None without).
+    Without Pillow, the EXIF thumbnail is returned as is, without the orientation
+    applied.
+    """
+    exif_data = read_exif_header(path)
+    if exif_data is None:
+        exif_data = piexif.load(str(path))
+
+    thumbnail = exif_data.get("thumbnail")
+    if thumbnail:
+        orientation = exif_data["0th"].get(piexif.ImageIFD.Orientation, 1)
+        if orientation == 1 or not PIL_AVAILABLE:
+            return thumbnail
+        image = apply_orientation(Image.open(BytesIO(thumbnail)), orientation)
+        return encode_jpeg(image)
+
+    if not PIL_AVAILABLE:
+        return None
+    return reduce_image(path, max_size)
@@ -0,0 +1,317 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timezone
+from html import escape
+import logging
+import os
+import zipfile
+
+import numpy as np
+import piexif
+
+from .imaging import PIL_AVAILABLE, make_thumbnail
+from .metrics import metrics
+from .output_writers import PositionWriter
+
+logger = logging.getLogger(__package__)
+
+PHOTO_STYLE_ID = "photo"
+TRACK_STYLE_ID = "track"
+# line: LineString with the TimeSpan of the segment; gx-track: gx:Track with the
+# time of each point (animated with the time slider in Google Earth)
+TRACK_MODES = ["line", "gx-track"]
+# for the whole track: Google Earth gets slow with much more
+DEFAULT_TRACK_POINTS = 5000
+KML_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+# folder inside the KMZ
+THUMBNAILS_DIRNAME = "files"
+DEFAULT_THUMBNAIL_JOBS = min(8, os.cpu_count() or 1)
+
+KML_HEADER = f"""<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">
+    <Document>
+        <Style id="{PHOTO_STYLE_ID}">
+            <BalloonStyle>
+                <text>$[description]</text>
+                <displayMode>default</displayMode>
+            </BalloonStyle>
+        </Style>
+"""
+
+KML_TRACK_STYLE = f"""        <Style id="{TRACK_STYLE_ID}">
+            <LineStyle>
+                <color>ff0000ff</color>
+                <width>3</width>
+            </LineStyle>
+        </Style>
+"""
+
+KML_FOOTER = """    </Document>
+</kml>
+"""
+
+
+def cdata(text):
+    # ]]> cannot appear inside a CDATA section: split it over 2 sections
+    return "<![CDATA[" + text.replace("]]>", "]]]]><![CDATA[>") + "]]>"
+
+
+def decimate_track(lats, lons, max_points):
+    """Indices of at most max_points points of the track, keeping its shape
+
+    Largest-Triangle-Three-Buckets: The first and last points are kept, and one
+    point per bucket in between, the one that forms the largest triangle with the
+    point kept in the previous bucket and the mean of the next bucket.
+    """
+    n = len(lats)
+    if n <= max_points:
+        return np.arange(n)
+    if max_points <= 2:
+        return np.array([0, n - 1])
+
+    x = np.asarray(lons, dtype=float)
+    y = np.asarray(lats, dtype=float)
+    # bucket i is edges[i]:edges[i + 1] (first and last points excluded)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(int)
+    indices = np.empty(max_points, dtype=int)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        cx = x[end:next_end].mean()
+        cy = y[end:next_end].mean()
+        bx = x[start:end]
+        by = y[start:end]
+        areas = np.abs((x[a] - cx) * (by - y[a]) - (x[a] - bx) * (cy - y[a]))
+        a = start + int(areas.argmax())
+        indices[i + 1] = a
+    return indices
+
+
+def format_kml_times(index):
+    if index.tz is None:
+        index = index.tz_localize("utc")
+    return index.tz_convert("utc").strftime(KML_TIME_FORMAT)
+
+
+def track_placemarks(gpx_segments, track_mode, max_points):
+    """KML of the GPX segments (in memory) as placemarks, decimated to max_points"""
+    total = sum(len(df) for df in gpx_segments)
+    for i, df in enumerate(gpx_segments):
+        if len(df) == 0:
+            continue
+        lats = df["lat"].to_numpy()
+        lons = df["lon"].to_numpy()
+        # budget shared between segments according to their number of points
+        budget = max(2, round(max_points * len(df) / total))
+        indices = decimate_track(lats, lons, budget)
+        times = format_kml_times(df.index[indices])
+        lats = lats[indices]
+        lons = lons[indices]
+
+        if track_mode == "gx-track":
+            whens = "".join(f"<when>{t}</when>" for t in times)
+            coords = "".join(
+                f"<gx:coord>{lon} {lat} 0</gx:coord>"
+                for lat, lon in zip(lats, lons, strict=True)
+            )
+            geometry = f"<gx:Track>{whens}{coords}</gx:Track>"
+            time_element = ""
+        else:
+            coords = " ".join(
+                f"{lon},{lat},0" for lat, lon in zip(lats, lons, strict=True)
+            )
+            geometry = (
+                "<LineString><tessellate>1</tessellate>"
+                f"<coordinates>{coords}</coordinates></LineString>"
+            )
+            time_element = (
+                f"<TimeSpan><begin>{times[0]}</begin><end>{times[-1]}</end></TimeSpan>"
+            )
+
+        yield f"""            <Placemark>
+                <name>Segment {i + 1}</name>
+                {time_element}
+                <styleUrl>#{TRACK_STYLE_ID}</styleUrl>
+                {geometry}
+            </Placemark>
+"""
+
+
+class KmlWriter(PositionWriter):
+    """Write the KML of the photos one placemark at a time"""
+
+    format_name = "KML"
+
+    def __init__(
+        self,
+        path,
+        thumbnail_size,
+        image_src,
+        image_name,
+        image_style=None,
+        gpx_segments=None,
+        track_mode=None,
+        track_points=DEFAULT_TRACK_POINTS,
+    ):
+        """With track_mode (one of TRACK_MODES), the GPX segments are added"""
+        super().__init__(path)
+        self.thumbnail_size = thumbnail_size
+        self.image_src = image_src
+        self.image_name = image_name
+        self.image_style = image_style
+        self.gpx_segments = gpx_segments
+        self.track_mode = track_mode
+        self.track_points = track_points
+
+    def write_header(self):
+        self._file.write(KML_HEADER)
+        if self.track_mode and self.gpx_segments:
+            self._file.write(KML_TRACK_STYLE)
+            self._file.write("        <Folder>\n            <name>Track</name>\n")
+            for placemark in track_placemarks(
+                self.gpx_segments, self.track_mode, self.track_points
+            ):
+                self._file.write(placemark)
+            self._file.write("        </Folder>\n")
+
+    def write_footer(self):
+        self._file.write(KML_FOOTER)
+
+    def description(self, image, src=None, is_upright=False):
+        css_style = ""
+        if self.image_style and not is_upright:
+            css_style = f'style="{escape(self.image_style(image))}"'
+        name = escape(self.image_name(image), quote=False)
+        src = escape(src or self.image_src(image))
+        return cdata(
+            f"""
+{name}<br/><br/>
+<img src="{src}" width="{self.thumbnail_size}" {css_style} />
+ """
+        )
+
+    def write_position(self, latlon, image, src=None, is_upright=False):
+        """src: overrides image_src; is_upright: image_style is not needed"""
+        lat, lon = latlon[:2]
+        description = self.description(image, src, is_upright)
+        # for the time slider (the position can also be a simple (lat, lon))
+        time_element = ""
+        if getattr(latlon, "time", None) is not None:
+            when = latlon.time.astimezone(timezone.utc).strftime(KML_TIME_FORMAT)
+            time_element = f"""
+            <TimeStamp><when>{when}</when></TimeStamp>"""
+        self._file.write(
+            f"""        <Placemark>{time_element}
+            <description>{description}</description>
+            <styleUrl>#{PHOTO_STYLE_ID}</styleUrl>
+            <Point>
+                <coordinates>{lon},{lat},0.0</coordinates>
+            </Point>
+        </Placemark>
+"""
+        )
+
+
+class KmzWriter(KmlWriter):
+    """Write a KMZ with the thumbnails of the photos embedded
+
+    Self-contained (the photos can be moved) and fast to display: Only small
+    thumbnails are decoded by Google Earth. The thumbnails are made concurrently
+    by jobs threads (with a bounded number pending so the memory stays constant)
+    and the placemarks are written as their thumbnail is ready.
+    """
+
+    format_name = "KMZ"
+
+    def __init__(
+        self,
+        path,
+        thumbnail_size,
+        image_src,
+        image_name,
+        image_style=None,
+        gpx_segments=None,
+        track_mode=None,
+        track_points=DEFAULT_TRACK_POINTS,
+        jobs=DEFAULT_THUMBNAIL_JOBS,
+    ):
+        super().__init__(
+            path,
+            thumbnail_size,
+            image_src,
+            image_name,
+            image_style,
+            gpx_segments,
+            track_mode,
+            track_points,
+        )
+        self.jobs = jobs
+        # the KML is copied to the KMZ at the end
+        self._tmp_path = f"{path}.kml.part"
+        self._kmz_tmp_path = f"{path}.part"
+        self._zip = None
+        self._executor = None
+        self._pending = {}
+
+    def open(self):
+        super().open()
+        self._zip = zipfile.ZipFile(self._kmz_tmp_path, "w")
+        self._executor = ThreadPoolExecutor(max_workers=self.jobs)
+        if not PIL_AVAILABLE:
+            logger.warning(
+                "Pillow is not installed: Only the thumbnails in the EXIF are embedded"
+            )
+        return self
+
+    def add(self, latlon, image):
+        if len(self._pending) >= 2 * self.jobs:
+            done, _ = wait(self._pending, return_when=FIRST_COMPLETED)
+            self._write_done(done)
+        future = self._executor.submit(make_thumbnail, image, self.thumbnail_size)
+        self._pending[future] = (latlon, image)
+
+    def _write_done(self, futures):
+        for future in futures:
+            latlon, image = self._pending.pop(future)
+            try:
+                thumbnail = future.result()
+            except (OSError, piexif.InvalidImageDataError) as ex:
+                logger.warning(f"No thumbnail for {self.image_name(image)}: {ex}")
+                thumbnail = None
+
+            if thumbnail is None:
+                # link to the photo like in the KML
+                self.write_position(latlon, image)
+            else:
+                # JPEG: no gain compressing
+                name = f"{THUMBNAILS_DIRNAME}/{self.count:06d}.jpg"
+                self._zip.writestr(name, thumbnail)
+                self.write_position(latlon, image, name, is_upright=PIL_AVAILABLE)
+            self.count += 1
+
+    def close(self):
+        self._write_done(list(self._pending))
+        self._executor.shutdown()
+        self.write_footer()
+        self._file.close()
+        if self.count == 0:
+            self._zip.close()
+            os.remove(self._tmp_path)
+            os.remove(self._kmz_tmp_path)
+            logger.error(f"No {self.format_name} output (no georeferenced photos)!")
+            return False
+        self._zip.write(self._tmp_path, "doc.kml", zipfile.ZIP_DEFLATED)
+        self._zip.close()
+        os.remove(self._tmp_path)
+        os.replace(self._kmz_tmp_path, self.path)
+        metrics.count("output_bytes_written", os.path.getsize(self.path))
+        logger.info(f"{self.count} photos written to {self.format_name} {self.path}")
+        return True
+
+    def abort(self):
+        self._executor.shutdown(cancel_futures=True)
+        self._zip.close()
+        os.remove(self._kmz_tmp_path)
+        super().abort()
@@ -7,7 +7,11 @@ from colorama import Fore, Style
 from .exiftool import exiftool_command
 from .gpx2exif import gpx2exif
 from .gpx2flickr import gpx2flickr
+from .merge import merge_command
+from .profiling import DEFAULT_PROFILE_TOP, PROFILE_MODES, create_profiler
+from .server import serve_command
 from .time_extractor import extract_time
+from .watch import watch_command
 
 logger = logging.getLogger(__package__)
 
@@ -48,18 +52,56 @@ def setup_logging(is_debug):
     help=("Flag to activate debug mode"),
     required=False,
 )
+@click.option(
+    "--profile",
+    "profile_mode",
+    type=click.Choice(PROFILE_MODES),
+    help=(
+        "Profile the subcommand: cpu (cProfile of the main thread) or mem "
+        "(tracemalloc). The top functions or allocation sites and the time of the "
+        "stages are printed at exit"
+    ),
+    required=False,
+)
+@click.option(
+    "--profile-output",
+    "profile_output_path",
+    help=(
+        "Path for the profile (pstats for cpu, tracemalloc snapshot for mem). "
+        "Default: gpx2exif.pstats or gpx2exif.snapshot"
+    ),
+    required=False,
+)
+@click.option(
+    "--profile-top",
+    "profile_top",
+    type=click.IntRange(min=1),
+    default=DEFAULT_PROFILE_TOP,
+    show_default=True,
+    help="Number of functions or allocation sites printed",
+    required=False,
+)
 @click.pass_context
-def main(ctx, is_debug):
+def main(ctx, is_debug, profile_mode, profile_output_path, profile_top):
     """Add location information to images on disk or on Flickr based on a GPX file"""
     setup_logging(is_debug)
     # special attribute of context
     ctx.obj = {"DEBUG": is_debug}
 
+    if profile_mode:
+        profiler = create_profiler(profile_mode, profile_output_path, profile_top)
+        # the context is closed after the subcommand (even if it fails)
+        ctx.call_on_close(profiler.finish)
+        profiler.start()
+
 
 main.add_command(gpx2exif)
 main.add_command(gpx2flickr)
 main.add_command(extract_time)
 main.add_command(exiftool_command)
+main.add_command(watch_command)
+main.add_command(serve_command)
+main.add_command(merge_command)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,243 @@
+"""Manifests of the shards of a run, and their merge
+
+With --shard i/N, a run only processes the files of a folder whose relative path
+hashes to shard i (see scanner.shard_of: the shards do not overlap, whatever the
+host, without coordination). With --manifest, the result of each file is written
+to a manifest (JSON lines): a header, one line per file (status, position, time
+spent) and the report of the run. The merge command combines the manifests of
+the shards into the KML, outputs and report of the whole run.
+"""
+
+from collections import Counter, defaultdict
+from datetime import datetime
+import json
+import logging
+import os
+import socket
+
+import click
+import numpy as np
+
+from .common import GpsPosition
+from .metrics import PERCENTILES, metrics
+
+logger = logging.getLogger(__package__)
+
+MANIFEST_VERSION = 1
+# results of the files in the manifests
+STATUS_LOCATED = "located"
+STATUS_NOT_LOCATED = "not_located"
+STATUS_SKIPPED = "skipped"
+
+
+def format_shard(shard):
+    return f"{shard[0]}/{shard[1]}" if shard else "all"
+
+
+def position_fields(pos):
+    return {
+        "time": pos.time.isoformat(),
+        "lat": float(pos.lat),
+        "lon": float(pos.lon),
+        "quality": pos.quality,
+        "gap": pos.gap,
+    }
+
+
+class ManifestWriter:
+    """Manifest of a shard, written one file at a time
+
+    Written to a temporary file, renamed at the end (with the report of the
+    metrics of the run): a manifest is complete if it exists.
+    """
+
+    def __init__(self, path, command, root, shard=None):
+        self.path = path
+        self.command = command
+        self.root = str(root)
+        self.shard = shard
+        self.count = 0
+        self._tmp_path = f"{path}.part"
+        self._file = None
+
+    def _write(self, record):
+        self._file.write(json.dumps(record))
+        self._file.write("\n")
+
+    def open(self):
+        self._file = open(self._tmp_path, "w", encoding="utf-8", buffering=1024 * 1024)
+        self._write(
+            {
+                "type": "header",
+                "version": MANIFEST_VERSION,
+                "command": self.command,
+                "root": self.root,
+                "shard": list(self.shard) if self.shard else None,
+                "host": socket.gethostname(),
+                "started": datetime.now().astimezone().isoformat(),
+            }
+        )
+        return self
+
+    def add(self, path, status, pos=None, seconds=None):
+        record = {"type": "file", "path": str(path), "status": status}
+        if pos is not None:
+            record.update(position_fields(pos))
+        record["seconds"] = seconds
+        self._write(record)
+        self.count += 1
+
+    def close(self):
+        self._write({"type": "report", **metrics.report()})
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        logger.info(f"Manifest of {self.count} files written to {self.path}")
+
+    def abort(self):
+        self._file.close()
+        os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_manifest(path):
+    """Yield the records of a manifest (header first, report last)"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def check_shards(headers):
+    """Error if the manifests are not from shards of the same split; warning if
+    some shards are missing"""
+    shards = [tuple(h["shard"]) if h["shard"] else None for h in headers.values()]
+    if len(shards) > 1 and None in shards:
+        raise click.UsageError("A manifest of an unsharded run cannot be merged")
+    shards = [shard for shard in shards if shard]
+    if not shards:
+        return
+    counts = {count for _, count in shards}
+    if len(counts) > 1:
+        raise click.UsageError(
+            f"Manifests of different splits: {', '.join(map(format_shard, shards))}"
+        )
+    (count,) = counts
+    duplicates = [format_shard(shard) for shard, n in Counter(shards).items() if n > 1]
+    if duplicates:
+        raise click.UsageError(
+            f"Shard(s) present more than once: {', '.join(duplicates)}"
+        )
+    missing = sorted(set(range(1, count + 1)) - {index for index, _ in shards})
+    if missing:
+        logger.warning(
+            "Missing shard(s): "
+            f"{', '.join(format_shard((index, count)) for index in missing)}"
+        )
+
+
+def merge_reports(reports, file_seconds):
+    """Report of the whole run (same format as Metrics.report)
+
+    The shards are assumed to run in parallel: the wall time is the longest. The
+    latencies per file are computed from the times in the manifests.
+    """
+    wall_seconds = max((r["wall_seconds"] for r in reports), default=0)
+    counters = Counter()
+    stage_seconds = defaultdict(float)
+    stage_calls = Counter()
+    for report in reports:
+        counters.update(report["counters"])
+        for name, stage in report["stages"].items():
+            stage_seconds[name] += stage["seconds"]
+            stage_calls[name] += stage["calls"]
+
+    stages = {}
+    for name, seconds in stage_seconds.items():
+        calls = stage_calls[name]
+        stages[name] = {
+            "seconds": seconds,
+            "calls": calls,
+            "calls_per_sec": calls / seconds if seconds else None,
+        }
+
+    def per_sec(value):
+        return value / wall_seconds if wall_seconds else None
+
+    report = {
+        "wall_seconds": wall_seconds,
+        "counters": dict(counters),
+        "throughput": {
+            "files_per_sec": per_sec(counters.get("files_read", 0)),
+            "mb_read_per_sec": per_sec(counters.get("bytes_read", 0) / 1e6),
+            "mb_written_per_sec": per_sec(counters.get("bytes_written", 0) / 1e6),
+        },
+        "stages": stages,
+        "shards": len(reports),
+    }
+    if file_seconds:
+        latencies = np.array(file_seconds)
+        values = np.percentile(latencies, PERCENTILES)
+        report["file_latency"] = {
+            **{f"p{q}": float(v) for q, v in zip(PERCENTILES, values, strict=True)},
+            "mean": float(latencies.mean()),
+            "max": float(latencies.max()),
+        }
+    return report
+
+
+class ManifestMerger:
+    """Positions of the located files of the manifests (as they are read), then
+    the statuses and the merged report"""
+
+    def __init__(self, manifest_paths):
+        self.manifest_paths = manifest_paths
+        self.headers = {}
+        self.reports = []
+        self.statuses = Counter()
+        self.file_seconds = []
+
+    def read_headers(self):
+        for path in self.manifest_paths:
+            header = next(read_manifest(path), None)
+            if not header or header.get("type") != "header":
+                raise click.UsageError(f"{path} is not a manifest")
+            if header["version"] > MANIFEST_VERSION:
+                raise click.UsageError(f"Manifest {path} from a newer version")
+            self.headers[path] = header
+        check_shards(self.headers)
+
+    def positions(self):
+        for path in self.manifest_paths:
+            is_complete = False
+            for record in read_manifest(path):
+                if record["type"] == "report":
+                    self.reports.append(record)
+                    is_complete = True
+                elif record["type"] == "file":
+                    self.statuses[record["status"]] += 1
+                    if record["seconds"] is not None:
+                        self.file_seconds.append(record["seconds"])
+                    if record["status"] == STATUS_LOCATED:
+                        pos = GpsPosition(
+                            record["lat"],
+                            record["lon"],
+                            datetime.fromisoformat(record["time"]),
+                            record["quality"],
+                            record["gap"],
+                        )
+                        yield pos, record["path"]
+            if not is_complete:
+                logger.warning(f"Manifest {path} has no report (incomplete run?)")
+
+    def report(self):
+        report = merge_reports(self.reports, self.file_seconds)
+        report["statuses"] = dict(self.statuses)
+        return report
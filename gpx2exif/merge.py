@@ -0,0 +1,72 @@
+import json
+import logging
+import sys
+
+import click
+
+from .common import (
+    kml_option,
+    kml_thumbnail_size_option,
+    output_option,
+    process_outputs,
+    report_option,
+)
+from .gpx2exif import image_name, image_src
+from .manifest import ManifestMerger, format_shard
+
+logger = logging.getLogger(__package__)
+
+
+@click.command(
+    name="merge",
+    help=(
+        "Merge the manifests written by the shards of a run (--shard and "
+        "--manifest) into a KML, outputs and a report"
+    ),
+)
+@click.argument(
+    "manifest_paths",
+    metavar="MANIFEST...",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, dir_okay=False),
+)
+@kml_option
+@kml_thumbnail_size_option
+@output_option
+@report_option
+@click.pass_context
+def merge_command(
+    ctx, manifest_paths, kml_output_path, kml_thumbnail_size, output_paths, report_path
+):
+    try:
+        merger = ManifestMerger(manifest_paths)
+        merger.read_headers()
+        for path, header in merger.headers.items():
+            logger.info(
+                f"{path}: {header['command']} shard {format_shard(header['shard'])} "
+                f"on {header['host']} ({header['started']})"
+            )
+
+        process_outputs(
+            merger.positions(),
+            kml_output_path,
+            kml_thumbnail_size,
+            image_src,
+            image_name,
+            output_paths=output_paths,
+        )
+
+        report = merger.report()
+        statuses = ", ".join(f"{n} {status}" for status, n in merger.statuses.items())
+        logger.info(f"{sum(merger.statuses.values())} files: {statuses}")
+        if report_path:
+            with open(report_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            logger.info(f"Report written to {report_path}")
+
+    except Exception as ex:
+        logger.error("*** An unrecoverable error occured ***")
+        lf = logger.error if not ctx.obj["DEBUG"] else logger.exception
+        lf(str(ex))
+        sys.exit(1)
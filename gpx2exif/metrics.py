@@ -0,0 +1,114 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import json
+import logging
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__package__)
+
+PERCENTILES = [50, 95, 99]
+
+
+class Metrics:
+    """Stage timers, counters and per-file latencies of a run
+
+    Stages are timed with the stage context manager: For the per-file stages (one
+    call for each file), the latency of each call is kept for the percentiles in
+    the report. Counters are free-form (files_read, bytes_read, api_calls...).
+
+    stage_listener (used by the profilers) is notified when entering and exiting
+    a stage: None if not profiling.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_listener = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.start_time = time.perf_counter()
+            self.counters = Counter()
+            self.stage_seconds = defaultdict(float)
+            self.stage_calls = Counter()
+            # in seconds
+            self.latencies = defaultdict(list)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def update(self, counters):
+        with self._lock:
+            self.counters.update(counters)
+
+    def add_time(self, stage, seconds, is_per_file=False):
+        with self._lock:
+            self.stage_seconds[stage] += seconds
+            self.stage_calls[stage] += 1
+            if is_per_file:
+                self.latencies[stage].append(seconds)
+
+    @contextmanager
+    def stage(self, name, is_per_file=False):
+        listener = self.stage_listener
+        if listener is not None:
+            listener.enter(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start, is_per_file)
+            if listener is not None:
+                listener.exit(name)
+
+    def report(self):
+        with self._lock:
+            wall_seconds = time.perf_counter() - self.start_time
+            counters = dict(self.counters)
+
+            stages = {}
+            for name, seconds in self.stage_seconds.items():
+                calls = self.stage_calls[name]
+                stage = {
+                    "seconds": seconds,
+                    "calls": calls,
+                    "calls_per_sec": calls / seconds if seconds else None,
+                }
+                if self.latencies.get(name):
+                    latencies = np.array(self.latencies[name])
+                    values = np.percentile(latencies, PERCENTILES)
+                    stage["latency"] = {
+                        **{
+                            f"p{q}": float(v)
+                            for q, v in zip(PERCENTILES, values, strict=True)
+                        },
+                        "mean": float(latencies.mean()),
+                        "max": float(latencies.max()),
+                    }
+                stages[name] = stage
+
+        return {
+            "wall_seconds": wall_seconds,
+            "counters": counters,
+            "throughput": {
+                "files_per_sec": counters.get("files_read", 0) / wall_seconds,
+                "mb_read_per_sec": counters.get("bytes_read", 0) / 1e6 / wall_seconds,
+                "mb_written_per_sec": (
+                    counters.get("bytes_written", 0) / 1e6 / wall_seconds
+                ),
+            },
+            "stages": stages,
+        }
+
+    def write_report(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+        logger.info(f"Report written to {path}")
+
+
+# for the whole process (the commands reset it when they start)
+metrics = Metrics()
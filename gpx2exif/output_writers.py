@@ -0,0 +1,214 @@
+from abc import ABC, abstractmethod
+import csv
+from datetime import timezone
+import json
+import logging
+import os
+from xml.sax.saxutils import escape
+
+from .metrics import metrics
+
+logger = logging.getLogger(__package__)
+
+# the positions are written as they come so a large buffer limits the writes
+BUFFER_SIZE = 1024 * 1024
+POSITION_FIELDS = ["path", "time", "lat", "lon", "quality", "gap"]
+
+
+class PositionWriter(ABC):
+    """Output of the positions of the photos, written one photo at a time
+
+    Nothing is kept in memory so it can be used for any number of photos. The
+    output is written to a temporary file, renamed at the end: path is only
+    created if there is at least one position.
+
+    Subclasses implement write_position (and write_header / write_footer if
+    needed). image_path gives the identifier of an image for the output (the
+    path of the file or the URL of the Flickr photo).
+    """
+
+    format_name = None
+
+    def __init__(self, path, image_path=str):
+        self.path = path
+        self.image_path = image_path
+        self.count = 0
+        self._tmp_path = f"{path}.part"
+        self._file = None
+
+    def open(self):
+        self._file = open(
+            self._tmp_path, "w", encoding="utf-8", newline="", buffering=BUFFER_SIZE
+        )
+        self.write_header()
+        return self
+
+    # optional: nothing by default
+    def write_header(self):  # noqa: B027
+        pass
+
+    def write_footer(self):  # noqa: B027
+        pass
+
+    @abstractmethod
+    def write_position(self, pos, image):
+        pass
+
+    def add(self, pos, image):
+        self.write_position(pos, image)
+        self.count += 1
+
+    def close(self):
+        self.write_footer()
+        self._file.close()
+        if self.count == 0:
+            os.remove(self._tmp_path)
+            logger.error(f"No {self.format_name} output (no georeferenced photos)!")
+            return False
+        os.replace(self._tmp_path, self.path)
+        metrics.count("output_bytes_written", os.path.getsize(self.path))
+        logger.info(f"{self.count} photos written to {self.format_name} {self.path}")
+        return True
+
+    def abort(self):
+        self._file.close()
+        os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def record(self, pos, image):
+        """Fields of the position of an image (same for all the formats)"""
+        return {
+            "path": self.image_path(image),
+            "time": pos.time.isoformat(),
+            "lat": float(pos.lat),
+            "lon": float(pos.lon),
+            "quality": pos.quality,
+            "gap": pos.gap,
+        }
+
+
+def geojson_feature(record):
+    properties = {k: v for k, v in record.items() if k not in ("lat", "lon")}
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [record["lon"], record["lat"]]},
+        "properties": properties,
+    }
+
+
+class GeoJsonWriter(PositionWriter):
+    """GeoJSON FeatureCollection, written feature by feature"""
+
+    format_name = "GeoJSON"
+
+    def write_header(self):
+        self._file.write('{"type": "FeatureCollection", "features": [\n')
+
+    def write_position(self, pos, image):
+        if self.count:
+            self._file.write(",\n")
+        self._file.write(json.dumps(geojson_feature(self.record(pos, image))))
+
+    def write_footer(self):
+        self._file.write("\n]}\n")
+
+
+class GeoJsonLinesWriter(PositionWriter):
+    """Newline-delimited GeoJSON: one Feature per line (can be read in chunks)"""
+
+    format_name = "GeoJSON lines"
+
+    def write_position(self, pos, image):
+        self._file.write(json.dumps(geojson_feature(self.record(pos, image))))
+        self._file.write("\n")
+
+
+class CsvWriter(PositionWriter):
+    format_name = "CSV"
+
+    def write_header(self):
+        self._writer = csv.DictWriter(self._file, POSITION_FIELDS)
+        self._writer.writeheader()
+
+    def write_position(self, pos, image):
+        self._writer.writerow(self.record(pos, image))
+
+
+class GpxWriter(PositionWriter):
+    """GPX with a waypoint for each photo"""
+
+    format_name = "GPX"
+
+    def write_header(self):
+        self._file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<gpx version="1.1" creator="gpx2exif" '
+            'xmlns="http://www.topografix.com/GPX/1/1">\n'
+        )
+
+    def write_position(self, pos, image):
+        record = self.record(pos, image)
+        name = escape(os.path.basename(record["path"].rstrip("/")))
+        time_utc = pos.time.astimezone(timezone.utc)
+        self._file.write(
+            f'  <wpt lat="{record["lat"]}" lon="{record["lon"]}">\n'
+            f"    <time>{time_utc.strftime('%Y-%m-%dT%H:%M:%SZ')}</time>\n"
+            f"    <name>{name}</name>\n"
+            f"    <desc>{escape(record['path'])}</desc>\n"
+            f"    <type>{record['quality']}</type>\n"
+            "  </wpt>\n"
+        )
+
+    def write_footer(self):
+        self._file.write("</gpx>\n")
+
+
+# extension of the output path => writer
+OUTPUT_WRITERS = {
+    ".geojson": GeoJsonWriter,
+    ".geojsonl": GeoJsonLinesWriter,
+    ".ndjson": GeoJsonLinesWriter,
+    ".csv": CsvWriter,
+    ".gpx": GpxWriter,
+}
+
+
+def create_output_writer(path, image_path=str):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in OUTPUT_WRITERS:
+        raise ValueError(
+            f"Unknown output format for {path} (extension must be one of "
+            f"{', '.join(OUTPUT_WRITERS)})"
+        )
+    return OUTPUT_WRITERS[ext](path, image_path)
+
+
+def write_outputs(positions, writers):
+    """Write the positions to all the writers as they are produced
+
+    positions can be an iterator (the photos are then processed as the outputs
+    are written): It is consumed even if there is no writer.
+    """
+    opened = []
+    try:
+        for writer in writers:
+            opened.append(writer.open())
+        for pos, image in positions:
+            with metrics.stage("outputs"):
+                for writer in writers:
+                    writer.add(pos, image)
+    except BaseException:
+        for writer in opened:
+            writer.abort()
+        raise
+    with metrics.stage("outputs_close"):
+        for writer in writers:
+            writer.close()
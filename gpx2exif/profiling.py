@@ -0,0 +1,169 @@
+from abc import ABC, abstractmethod
+import cProfile
+import io
+import pstats
+import tracemalloc
+
+import click
+
+from .metrics import metrics
+
+PROFILE_MODES = ["cpu", "mem"]
+DEFAULT_PROFILE_TOP = 20
+# frames kept for each allocation by tracemalloc
+MEM_TRACEBACK_FRAMES = 10
+# growth of the traced memory before a new snapshot is taken at the end of a stage
+SNAPSHOT_GROWTH = 1.1
+
+
+def echo_header(title):
+    click.echo(f"\n--- {title} ---", err=True)
+
+
+class StageMemory:
+    """Memory retained by each stage of the run (markers for the mem profile)
+
+    The allocations traced by tracemalloc are measured when entering and exiting
+    the stages timed by metrics. The stages can be nested (exif_read inside image)
+    so each stage has its own stack.
+
+    A snapshot is kept at the end of the stage with the most memory allocated: At
+    the end of the run, the data of the subcommand (GPX segments...) is freed.
+    """
+
+    def __init__(self):
+        self.net_bytes = {}
+        self._starts = {}
+        self.snapshot = None
+        self.snapshot_size = 0
+        self.snapshot_stage = None
+
+    def enter(self, name):
+        self._starts.setdefault(name, []).append(tracemalloc.get_traced_memory()[0])
+
+    def exit(self, name):
+        start = self._starts[name].pop()
+        size = tracemalloc.get_traced_memory()[0]
+        self.net_bytes[name] = self.net_bytes.get(name, 0) + size - start
+        # only when the memory has grown enough: a snapshot is slow
+        if size > self.snapshot_size * SNAPSHOT_GROWTH:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.snapshot_size = size
+            self.snapshot_stage = name
+
+
+class Profiler(ABC):
+    """Profile of the subcommand, started by the main group and stopped at exit
+
+    Subclasses implement start, stop (with the save of the profile to
+    output_path) and print_top.
+    """
+
+    default_output = None
+
+    def __init__(self, output_path=None, top=DEFAULT_PROFILE_TOP):
+        self.output_path = output_path or self.default_output
+        self.top = top
+
+    @abstractmethod
+    def start(self):
+        pass
+
+    @abstractmethod
+    def stop(self):
+        pass
+
+    @abstractmethod
+    def print_top(self):
+        pass
+
+    def stage_columns(self, name):
+        return ""
+
+    def print_stages(self):
+        """Time of the stages of the run so the profile can be related to them"""
+        stages = metrics.report()["stages"]
+        if not stages:
+            return
+        echo_header("Stages")
+        for name, stage in sorted(
+            stages.items(), key=lambda item: item[1]["seconds"], reverse=True
+        ):
+            click.echo(
+                f"{name:<20} {stage['seconds']:>9.3f}s {stage['calls']:>8} calls"
+                f"{self.stage_columns(name)}",
+                err=True,
+            )
+
+    def finish(self):
+        self.stop()
+        self.print_top()
+        self.print_stages()
+        click.echo(f"\nProfile written to {self.output_path}", err=True)
+
+
+class CpuProfiler(Profiler):
+    """cProfile of the main thread (the worker threads are not included)"""
+
+    default_output = "gpx2exif.pstats"
+
+    def start(self):
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+        self._profile.dump_stats(self.output_path)
+
+    def print_top(self):
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=stream)
+        stats.strip_dirs().sort_stats("cumulative").print_stats(self.top)
+        echo_header(f"Top {self.top} functions (cumulative time)")
+        click.echo(stream.getvalue().strip(), err=True)
+
+
+class MemProfiler(Profiler):
+    """tracemalloc snapshot at the end of the stage with the most memory allocated
+
+    If there is no stage (eg extract-time), the snapshot is at the end of the run.
+    """
+
+    default_output = "gpx2exif.snapshot"
+
+    def start(self):
+        self._stage_memory = StageMemory()
+        metrics.stage_listener = self._stage_memory
+        tracemalloc.start(MEM_TRACEBACK_FRAMES)
+
+    def stop(self):
+        self._snapshot = self._stage_memory.snapshot or tracemalloc.take_snapshot()
+        _, self._peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        metrics.stage_listener = None
+        self._snapshot.dump(self.output_path)
+
+    def print_top(self):
+        snapshot = self._snapshot.filter_traces(
+            [
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+            ]
+        )
+        title = f"Top {self.top} allocation sites"
+        if self._stage_memory.snapshot_stage:
+            title += f" (end of {self._stage_memory.snapshot_stage})"
+        echo_header(f"{title}, peak {self._peak / 1e6:.1f} MB")
+        for stat in snapshot.statistics("lineno")[: self.top]:
+            click.echo(str(stat), err=True)
+
+    def stage_columns(self, name):
+        net_bytes = self._stage_memory.net_bytes.get(name, 0)
+        return f" {net_bytes / 1e6:>+10.2f} MB retained"
+
+
+PROFILERS = {"cpu": CpuProfiler, "mem": MemProfiler}
+
+
+def create_profiler(mode, output_path=None, top=DEFAULT_PROFILE_TOP):
+    return PROFILERS[mode](output_path, top)
@@ -0,0 +1,138 @@
+from datetime import timedelta
+import logging
+import sys
+import time
+
+from .metrics import metrics
+
+logger = logging.getLogger(__package__)
+
+# seconds between 2 refreshes of the bar (terminal) or 2 log lines (otherwise)
+TTY_INTERVAL = 0.25
+LOG_INTERVAL = 30.0
+BAR_WIDTH = 24
+# counters of metrics (or stats) with the API calls made
+API_CALL_COUNTERS = ["api_calls", "api_calls_list"]
+
+
+def format_eta(seconds):
+    return str(timedelta(seconds=round(seconds)))
+
+
+class Progress:
+    """Progress of the files of a run: live bar on a terminal, log lines otherwise
+
+    update is called for each file in the loop over the files: It only counts, the
+    progress is output at most every interval seconds. The MB/s written and the API
+    calls/s come from the counters of metrics, added to stats (if present) for the
+    counters only merged into metrics at the end of the run (Flickr writer).
+
+    On a terminal, the bar is erased before the log messages of the package so
+    they are not mixed. If not is_enabled, nothing is ever output.
+    """
+
+    def __init__(
+        self, total=None, unit="files", stats=None, is_enabled=True, stream=None
+    ):
+        self.total = total
+        self.unit = unit
+        self.stats = stats
+        self.stream = stream or sys.stderr
+        self.is_enabled = is_enabled
+        self.is_tty = is_enabled and self.stream.isatty()
+        if not is_enabled:
+            self.interval = float("inf")
+        elif self.is_tty:
+            self.interval = TTY_INTERVAL
+        else:
+            self.interval = LOG_INTERVAL
+        self.done = 0
+        self._start = time.monotonic()
+        self._next = self._start + self.interval
+        self._is_drawn = False
+        self._is_output = False
+
+    def __enter__(self):
+        if self.is_tty:
+            logger.addFilter(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def set_total(self, total):
+        # can be called from another thread (count of the files of a folder)
+        self.total = total
+
+    def update(self, n=1):
+        self.done += n
+        now = time.monotonic()
+        if now >= self._next:
+            self._next = now + self.interval
+            self._output(now)
+
+    def close(self):
+        if self.is_tty:
+            logger.removeFilter(self)
+            if self._is_output:
+                self._draw(time.monotonic())
+                self.stream.write("\n")
+                self.stream.flush()
+        elif self._is_output:
+            # only for the long runs (with at least a periodic line)
+            self._output(time.monotonic())
+
+    def filter(self, record):
+        # called before a log message is output
+        if self._is_drawn:
+            self.stream.write("\r\x1b[K")
+            self.stream.flush()
+            self._is_drawn = False
+            # redrawn at the next update
+            self._next = 0
+        return True
+
+    def counter(self, name):
+        value = metrics.counters.get(name, 0)
+        if self.stats is not None:
+            value += self.stats.get(name, 0)
+        return value
+
+    def status(self, now):
+        elapsed = max(now - self._start, 1e-9)
+        rate = self.done / elapsed
+        if self.total:
+            parts = [f"{self.done}/{self.total} {self.unit}"]
+        else:
+            parts = [f"{self.done} {self.unit}"]
+        parts.append(f"{rate:.1f} {self.unit}/s")
+
+        bytes_written = self.counter("bytes_written")
+        if bytes_written:
+            parts.append(f"{bytes_written / 1e6 / elapsed:.1f} MB/s written")
+        api_calls = sum(self.counter(name) for name in API_CALL_COUNTERS)
+        if api_calls:
+            parts.append(f"{api_calls / elapsed:.1f} API calls/s")
+
+        if self.total and rate > 0:
+            remaining = max(self.total - self.done, 0) / rate
+            parts.append(f"ETA {format_eta(remaining)}")
+        return " | ".join(parts)
+
+    def _draw(self, now):
+        line = self.status(now)
+        if self.total:
+            ratio = min(self.done / self.total, 1)
+            filled = round(ratio * BAR_WIDTH)
+            bar = "#" * filled + "-" * (BAR_WIDTH - filled)
+            line = f"[{bar}] {ratio:>4.0%} {line}"
+        self.stream.write(f"\r{line}\x1b[K")
+        self.stream.flush()
+        self._is_drawn = True
+
+    def _output(self, now):
+        self._is_output = True
+        if self.is_tty:
+            self._draw(now)
+        else:
+            logger.info(f"Progress: {self.status(now)}")
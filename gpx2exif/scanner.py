@@ -0,0 +1,157 @@
+"""Scan of the folders of images: streaming, with filters on the paths"""
+
+from dataclasses import dataclass
+import fnmatch
+import hashlib
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__package__)
+
+# first bytes of the formats read by piexif
+JPEG_MAGIC = b"\xff\xd8"
+TIFF_MAGICS = (b"II*\x00", b"MM\x00*")
+RIFF_MAGIC = b"RIFF"
+WEBP_MAGIC = b"WEBP"
+
+
+@dataclass(frozen=True)
+class ScanOptions:
+    """Filters of the files of a folder
+
+    includes and excludes are glob patterns matched against the name of the files
+    and their path relative to the folder (with /). The excluded folders are not
+    scanned. extensions are without the dot, case insensitive. Without is_sorted,
+    the files are in the order of the file system. shard (i, N): only the files
+    of part i (see shard_of).
+    """
+
+    is_recursive: bool = False
+    includes: tuple = ()
+    excludes: tuple = ()
+    extensions: tuple = ()
+    is_sorted: bool = False
+    shard: tuple | None = None
+
+    def __post_init__(self):
+        extensions = tuple(ext.lower().lstrip(".") for ext in self.extensions)
+        object.__setattr__(self, "extensions", extensions)
+
+
+def is_hidden(name):
+    # sometimes used by the OS to store metadata, like .DS_store on macOS
+    return name.startswith(".")
+
+
+def _matches(patterns, name, rel_path):
+    return any(
+        fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(rel_path, pattern)
+        for pattern in patterns
+    )
+
+
+def shard_of(rel_path, count):
+    """Part (1 to count) of a relative path (with /): the same on every host and in
+    every process (unlike hash)"""
+    digest = hashlib.blake2b(rel_path.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count + 1
+
+
+def is_in_shard(rel_path, shard):
+    return shard is None or shard_of(rel_path, shard[1]) == shard[0]
+
+
+def is_selected(name, rel_path, options):
+    if options.extensions:
+        ext = os.path.splitext(name)[1].lower().lstrip(".")
+        if ext not in options.extensions:
+            return False
+    if options.includes and not _matches(options.includes, name, rel_path):
+        return False
+    return not _matches(options.excludes, name, rel_path)
+
+
+def scan_files(dirpath, options=None, on_skip=None):
+    """Yield the paths (str) of the files in the folder, as they are found
+
+    The hidden files and folders are skipped. on_skip (if present) is called with
+    the path of the files skipped or not selected by the filters.
+
+    The folders are scanned with os.scandir (type of the entries without a stat
+    on most platforms) and sorted by name only if is_sorted (then the order is
+    deterministic, depth-first for the subfolders). The symlinks to folders are
+    not followed.
+    """
+    if options is None:
+        options = ScanOptions()
+    # (folder, relative path of the folder)
+    stack = [(str(dirpath), "")]
+    while stack:
+        folder, rel_folder = stack.pop()
+        with os.scandir(folder) as it:
+            entries = sorted(it, key=lambda e: e.name) if options.is_sorted else it
+            subfolders = []
+            for entry in entries:
+                rel_path = rel_folder + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if (
+                        options.is_recursive
+                        and not is_hidden(entry.name)
+                        and not _matches(options.excludes, entry.name, rel_path)
+                    ):
+                        subfolders.append((entry.path, rel_path + "/"))
+                elif not entry.is_file() or not is_in_shard(rel_path, options.shard):
+                    # files of another shard: not counted as skipped
+                    continue
+                elif not is_hidden(entry.name) and is_selected(
+                    entry.name, rel_path, options
+                ):
+                    yield entry.path
+                elif on_skip is not None:
+                    on_skip(entry.path)
+        # popped in order of name
+        stack.extend(reversed(subfolders))
+
+
+def count_files_in_background(dirpath, options, on_count):
+    """Count the files of scan_files(dirpath, options) in a daemon thread
+
+    on_count is called with the number once the folder has been scanned: eg the
+    total of the progress, without delaying the processing of the first files.
+    Return an Event to set to stop the count early (eg at the end of the run).
+    """
+    stop = threading.Event()
+
+    def count():
+        num_files = 0
+        try:
+            for _ in scan_files(dirpath, options):
+                if stop.is_set():
+                    return
+                num_files += 1
+        except OSError as ex:
+            logger.debug(f"Files not counted: {ex}")
+            return
+        if not stop.is_set():
+            on_count(num_files)
+
+    threading.Thread(target=count, name="count-files", daemon=True).start()
+    return stop
+
+
+def is_image_file(path):
+    """If the first bytes are those of a JPEG, TIFF or WebP (formats of piexif)
+
+    Cheaper than piexif.load for the other files (read entirely by piexif).
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(12)
+    except OSError:
+        return False
+    return (
+        head.startswith(JPEG_MAGIC)
+        or head[:4] in TIFF_MAGICS
+        or (head.startswith(RIFF_MAGIC) and head[8:12] == WEBP_MAGIC)
+    )
@@ -0,0 +1,348 @@
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import socketserver
+import sys
+import threading
+
+import click
+import pandas as pd
+
+from .common import (
+    GeotagOptions,
+    clear_option,
+    delta_option,
+    delta_tz_option,
+    print_delta,
+    process_delta,
+    process_tolerance,
+    time_source_option,
+    tolerance_option,
+    update_images_option,
+    update_time_option,
+)
+from .time_sources import DEFAULT_TIME_SOURCES
+from .track_index import DEFAULT_RELOAD_INTERVAL, TrackIndex
+
+logger = logging.getLogger(__package__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8642
+DEFAULT_SERVER_JOBS = 4
+# maximum size of a request body
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+
+class RequestError(Exception):
+    """Invalid request: returned to the client with an HTTP 400"""
+
+    pass
+
+
+def position_record(pos):
+    if pos is None:
+        return None
+    return {
+        "lat": float(pos.lat),
+        "lon": float(pos.lon),
+        "time": pos.time.isoformat(),
+        "quality": pos.quality,
+        "gap": pos.gap,
+    }
+
+
+def parse_times(values):
+    """DatetimeIndex (UTC) for ISO 8601 strings (naive: UTC) or Unix times"""
+    if not isinstance(values, list):
+        raise RequestError("times must be a list")
+    if not values:
+        return pd.DatetimeIndex([], tz="utc")
+    try:
+        if all(isinstance(v, int | float) for v in values):
+            return pd.to_datetime(values, unit="s", utc=True)
+        return pd.to_datetime(values, utc=True, format="ISO8601")
+    except (ValueError, TypeError) as ex:
+        raise RequestError(f"Invalid times: {ex}") from ex
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+
+    class ThreadingUnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+class GeotagServer:
+    """HTTP server (TCP or Unix socket) for the lookups and the tagging of files
+
+    POST /locate {"times": [...]}: positions for the times (ISO 8601 strings or
+        Unix times, same semantics as the times read from the EXIF)
+    POST /tag {"paths": [...]}: geotag the files (on the machine of the server)
+    GET /health: info on the GPX loaded
+
+    Run in the foreground with serve_forever or in a background thread with
+    start / stop.
+    """
+
+    def __init__(
+        self,
+        index,
+        host=DEFAULT_HOST,
+        port=DEFAULT_PORT,
+        socket_path=None,
+        jobs=DEFAULT_SERVER_JOBS,
+    ):
+        self.index = index
+        self.socket_path = socket_path
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+        if socket_path:
+            if not hasattr(socketserver, "ThreadingUnixStreamServer"):
+                raise ValueError("Unix sockets are not supported on this platform")
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            self.httpd = ThreadingUnixHTTPServer(socket_path, self._make_handler())
+        else:
+            self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+            self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def address(self):
+        if self.socket_path:
+            return f"unix:{self.socket_path}"
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def locate(self, body):
+        times = parse_times(body.get("times"))
+        positions = self.index.get().locate(times)
+        return {"positions": [position_record(pos) for pos in positions]}
+
+    def _tag_file(self, geotagger, path):
+        # any error is reported for the path: the other files are still tagged
+        try:
+            pos = geotagger.tag_file(path)
+        except Exception as ex:
+            return {"path": path, "position": None, "error": str(ex) or repr(ex)}
+        return {"path": path, "position": position_record(pos)}
+
+    def tag(self, body):
+        paths = body.get("paths")
+        if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+            raise RequestError("paths must be a list of strings")
+        geotagger = self.index.get()
+        results = self.executor.map(lambda p: self._tag_file(geotagger, p), paths)
+        return {"results": list(results)}
+
+    def _make_handler(self):
+        server = self
+        routes = {
+            ("GET", "/health"): lambda body: server.index.info(),
+            ("POST", "/locate"): server.locate,
+            ("POST", "/tag"): server.tag,
+        }
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive connections
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately: no delayed ACK wait (TCP)
+            disable_nagle_algorithm = not server.socket_path
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self, method):
+                route = routes.get((method, self.path.split("?")[0]))
+                length = int(self.headers.get("Content-Length", 0))
+                if length > MAX_BODY_SIZE:
+                    self.close_connection = True
+                    self._reply(413, {"error": "Request too large"})
+                    return
+                data = self.rfile.read(length)
+                if route is None:
+                    self._reply(404, {"error": f"Unknown endpoint {self.path}"})
+                    return
+                try:
+                    body = json.loads(data) if data else {}
+                    if not isinstance(body, dict):
+                        raise RequestError("The body must be a JSON object")
+                    self._reply(200, route(body))
+                except (RequestError, json.JSONDecodeError) as ex:
+                    self._reply(400, {"error": str(ex)})
+                except Exception as ex:
+                    logger.exception(f"Error for {self.path}")
+                    self._reply(500, {"error": str(ex)})
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+        return Handler
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.close()
+
+    def close(self):
+        self.httpd.server_close()
+        self.executor.shutdown()
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+@click.command(
+    name="serve",
+    help=(
+        "Run a local HTTP server for the positions of times and the geotagging of "
+        "images, based on GPX files kept in memory"
+    ),
+)
+@click.argument(
+    "gpx_filepaths",
+    metavar="GPX_FILE...",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, resolve_path=True, dir_okay=False),
+)
+@delta_option
+@delta_tz_option
+@tolerance_option
+@time_source_option
+@click.option(
+    "-o",
+    "--ignore-offset",
+    "is_ignore_offset",
+    is_flag=True,
+    help=(
+        "Flag to indicate that the OffsetTimeOriginal should not be used (time of "
+        "images is assumed UTC)"
+    ),
+    required=False,
+)
+@clear_option
+@update_images_option
+@update_time_option
+@click.option("--host", "host", default=DEFAULT_HOST, show_default=True, required=False)
+@click.option(
+    "--port",
+    "port",
+    type=click.IntRange(min=0, max=65535),
+    default=DEFAULT_PORT,
+    show_default=True,
+    required=False,
+)
+@click.option(
+    "--socket",
+    "socket_path",
+    help="Path of a Unix socket to listen on (instead of --host and --port)",
+    required=False,
+)
+@click.option(
+    "--jobs",
+    "jobs",
+    type=click.IntRange(min=1),
+    default=DEFAULT_SERVER_JOBS,
+    show_default=True,
+    help="Number of files geotagged in parallel for a request",
+    required=False,
+)
+@click.option(
+    "--reload-interval",
+    "reload_interval",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_RELOAD_INTERVAL,
+    show_default=True,
+    help="Seconds between 2 checks of the GPX files for a change (reloaded)",
+    required=False,
+)
+@click.pass_context
+def serve_command(
+    ctx,
+    gpx_filepaths,
+    delta,
+    delta_tz,
+    tolerance,
+    time_sources,
+    is_ignore_offset,
+    is_clear,
+    is_update_images,
+    is_update_time,
+    host,
+    port,
+    socket_path,
+    jobs,
+    reload_interval,
+):
+    server = None
+    try:
+        logger.info("Parsing time shift...")
+        delta = process_delta(delta)
+        print_delta(delta, "Time")
+        delta_tz = process_delta([delta_tz]) if delta_tz else None
+        if delta_tz:
+            print_delta(delta_tz, "TZ time")
+
+        options = GeotagOptions(
+            delta,
+            delta_tz,
+            process_tolerance(tolerance),
+            is_ignore_offset,
+            is_clear,
+            is_update_images,
+            is_update_time,
+            time_sources or DEFAULT_TIME_SOURCES,
+        )
+        logger.info("Parsing GPX...")
+        index = TrackIndex(gpx_filepaths, options, reload_interval)
+        info = index.info()
+        if info["points"]:
+            logger.info(
+                f"{info['points']} points in {info['segments']} segments: "
+                f"{info['start']} => {info['end']}"
+            )
+        else:
+            logger.warning("No GPX point yet: No time will be located until added")
+        if not is_update_images:
+            logger.warning("The images will not be updated!")
+
+        server = GeotagServer(index, host, port, socket_path, jobs)
+        logger.info(f"Listening on {server.address}...")
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        logger.info("Stopped")
+
+    except Exception as ex:
+        logger.error("*** An unrecoverable error occured ***")
+        lf = logger.error if not ctx.obj["DEBUG"] else logger.exception
+        lf(str(ex))
+        sys.exit(1)
+
+    finally:
+        if server is not None:
+            server.close()
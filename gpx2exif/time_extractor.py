@@ -1,9 +1,17 @@
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+import hashlib
+import json
 import logging
 import os
+from pathlib import Path
 import re
+import threading
+import time
 
 import click
+import numpy as np
 
 # Annoying warnings/logs see
 # https://github.com/google-ai-edge/mediapipe/issues/5371#issuecomment-3395225750
@@ -18,10 +26,29 @@ except ImportError:
 
 import piexif
 
+from .common import DEFAULT_APP_DIR, reverse_flag
 from .gpx2exif import read_original_photo_time
+from .imaging import PIL_AVAILABLE, read_exif_thumbnail, reduce_image
 
 logger = logging.getLogger(__name__)
 
+OCR_CACHE_DIRNAME = "ocr_cache"
+# number of photos sent to the Vision API at the same time
+DEFAULT_JOBS = 4
+
+HALF_DAY_SECONDS = 12 * 3600
+# AM / PM alternatives of a clock time: up to a day before or after
+CANDIDATE_HALF_DAYS = np.arange(-2, 3)
+# the scaled MAD estimates the standard deviation (for a normal distribution)
+MAD_SCALE = 1.4826
+MAD_THRESHOLD = 3.0
+# in seconds: a clock is read to the second so a smaller spread is not meaningful
+MIN_SPREAD = 2.0
+
+DeltaConsensus = namedtuple(
+    "DeltaConsensus", "delta spread min_delta max_delta num_photos outliers"
+)
+
 
 def find_most_likely_datetime(ref_dt, time_str_ambiguous):
     time_obj = datetime.strptime(time_str_ambiguous, "%H:%M:%S").time()
@@ -73,27 +100,26 @@ def format_timedelta(td):
     return s
 
 
-def extract_clock_with_vision_api(photo_path):
-    client = vision.ImageAnnotatorClient()
-
-    with open(photo_path, "rb") as image_file:
-        content = image_file.read()
+def detect_texts_with_vision_api(client, content):
     image = vision.Image(content=content)
 
     response = client.text_detection(
         image=image, image_context={"language_hints": ["en"]}
     )
-    texts = response.text_annotations
 
     if response.error.message:
         raise Exception(response.error.message)
 
+    return [text.description for text in response.text_annotations]
+
+
+def find_clock_time(texts):
     time_contenders = []
 
     for text in texts:
-        logger.debug(f'Found "{text.description}"')
-        if re.search("^[0-9]+:[0-9]+:[0-9]+$", text.description):
-            time_contenders.append(text.description)
+        logger.debug(f'Found "{text}"')
+        if re.search("^[0-9]+:[0-9]+:[0-9]+$", text):
+            time_contenders.append(text)
 
     if not time_contenders:
         raise click.ClickException(
@@ -104,48 +130,323 @@ def extract_clock_with_vision_api(photo_path):
     return time_str_clock
 
 
-@click.command(
-    name="extract-time",
-    help="Extract time from a photo and compute a delta with the EXIF time",
-)
-@click.argument(
-    "photo_path",
-    metavar="PHOTO_PATH",
-    type=click.Path(exists=True, resolve_path=True, dir_okay=False),
-)
-@click.option(
-    "--both-am-pm",
-    "is_both_am_pm",
-    is_flag=True,
-    help="Output both AM and PM possibilities for the time",
-    required=False,
-)
-@click.option(
-    "--time-range",
-    "is_time_range",
-    is_flag=True,
-    help="Output time difference as time range (HH:MM:SS-HH:MM:SS) instead of delta",
-    required=False,
-)
-def extract_time(photo_path, is_both_am_pm, is_time_range):
-    if not VISION_AVAILABLE:
-        raise click.ClickException(
-            "Google Cloud Vision is not installed. "
-            "Please install the extra: 'vision' eg pip install gpx2exif[vision]"
-        )
+class VisionOcrBackend:
+    """Text detection with the Google Cloud Vision API
+
+    The client is created at the first detection: not at all (no credentials
+    needed) if the texts of all the photos are in the OCR cache.
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        # the photos are read by several threads
+        with self._lock:
+            if self._client is None:
+                self._client = vision.ImageAnnotatorClient()
+            return self._client
+
+    def detect_texts(self, content):
+        return detect_texts_with_vision_api(self.client, content)
+
+
+class StubOcrBackend:
+    """Offline OCR backend, for tests and benchmarks
+
+    recognize is a function that returns the texts for the image content. The
+    latency of the API call and the upload of the content (at upload_rate in
+    bytes per second) can be simulated.
+    """
+
+    def __init__(self, recognize, latency=0.0, upload_rate=None):
+        self.recognize = recognize
+        self.latency = latency
+        self.upload_rate = upload_rate
+        self.calls = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def detect_texts(self, content):
+        with self._lock:
+            self.calls += 1
+            self.bytes_sent += len(content)
+        delay = self.latency
+        if self.upload_rate:
+            delay += len(content) / self.upload_rate
+        if delay:
+            time.sleep(delay)
+        return self.recognize(content)
+
+
+# what is sent for OCR:
+# image: "reduced" (decoded at reduced size, then re-encoded), "thumbnail" (EXIF
+# thumbnail) or "original" (file as is)
+# max_size: maximum width and height for "reduced"
+# crop: None or region (left, top, right, bottom) as fractions of the size
+OcrOptions = namedtuple("OcrOptions", "image max_size crop")
+OCR_IMAGE_CHOICES = ["reduced", "thumbnail", "original"]
+# enough for a clock that fills a good part of the photo
+DEFAULT_OCR_MAX_SIZE = 1600
+DEFAULT_OCR_OPTIONS = OcrOptions("reduced", DEFAULT_OCR_MAX_SIZE, None)
+
+
+def prepare_ocr_content(content, ocr_options):
+    """Content of the image actually sent for OCR (smaller is faster to upload)"""
+    if ocr_options.image == "original":
+        return content
+
+    if ocr_options.image == "thumbnail":
+        thumbnail = read_exif_thumbnail(content)
+        if thumbnail:
+            return thumbnail
+        logger.debug("No EXIF thumbnail: Use reduced image")
+
+    if not PIL_AVAILABLE:
+        logger.debug("Pillow is not installed: Original image sent")
+        return content
+
+    try:
+        return reduce_image(content, ocr_options.max_size, ocr_options.crop)
+    except OSError as ex:
+        logger.warning(f"Cannot reduce image ({ex}): Original image sent")
+        return content
+
+
+def ocr_cache_key(content, ocr_options):
+    h = hashlib.sha256(content)
+    if ocr_options.image != "original":
+        # same photo prepared differently can give different texts
+        h.update(repr(tuple(ocr_options)).encode("ascii"))
+    return h.hexdigest()
+
+
+def read_clock_time(
+    content, backend, ocr_cache=None, ocr_options=DEFAULT_OCR_OPTIONS, name=""
+):
+    key = ocr_cache_key(content, ocr_options)
+    texts = ocr_cache.get(key) if ocr_cache is not None else None
+    if texts is None:
+        ocr_content = prepare_ocr_content(content, ocr_options)
+        logger.debug(f"{name}: {len(ocr_content)} bytes sent for OCR")
+        texts = backend.detect_texts(ocr_content)
+        if ocr_cache is not None:
+            ocr_cache.set(key, texts)
+    else:
+        logger.debug(f"OCR result for {name} from cache")
+
+    return find_clock_time(texts)
+
+
+def extract_clock_with_vision_api(
+    photo_path, client=None, ocr_cache=None, ocr_options=DEFAULT_OCR_OPTIONS
+):
+    with open(photo_path, "rb") as image_file:
+        content = image_file.read()
+
+    return read_clock_time(
+        content,
+        VisionOcrBackend(client),
+        ocr_cache,
+        ocr_options,
+        os.path.basename(photo_path),
+    )
+
+
+class OcrCache:
+    """Texts found in photos, stored on disk by hash of the image content"""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+
+    def _entry_path(self, key):
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key):
+        try:
+            with open(self._entry_path(key), encoding="utf-8") as f:
+                return json.load(f)["texts"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set(self, key, texts):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._entry_path(key)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"texts": texts}, f)
+        os.replace(tmp_path, path)
+
+
+ClockPhoto = namedtuple("ClockPhoto", "path model dt_exif time_str_clock")
 
-    exif_data = piexif.load(photo_path)
+
+def get_photo_paths(paths):
+    photo_paths = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            # do not process hidden files
+            photo_paths.extend(
+                str(p)
+                for p in sorted(path.iterdir())
+                if p.is_file() and not p.name.startswith(".")
+            )
+        else:
+            photo_paths.append(str(path))
+    return photo_paths
+
+
+def read_camera_model(exif_data):
+    model = exif_data["0th"].get(piexif.ImageIFD.Model)
+    if not model:
+        return "Unknown camera"
+    return model.decode("ascii", errors="replace").strip("\x00 ")
+
+
+def read_clock_photo(
+    photo_path, backend, ocr_cache=None, ocr_options=DEFAULT_OCR_OPTIONS
+):
+    name = os.path.basename(photo_path)
+    with open(photo_path, "rb") as image_file:
+        content = image_file.read()
+
+    exif_data = piexif.load(content)
     # assumes same timezone as the clock read from the image : will set both to UTC
     # in UTC
     dt_exif = read_original_photo_time(
         exif_data, is_ignore_offset=True, tz_warning=False
     )
+    if dt_exif is None:
+        raise click.ClickException(f"No DateTimeOriginal tag found in {name}")
+    time_str_clock = read_clock_time(content, backend, ocr_cache, ocr_options, name)
+    return ClockPhoto(photo_path, read_camera_model(exif_data), dt_exif, time_str_clock)
+
+
+def read_clock_photos(
+    photo_paths, backend, ocr_cache=None, ocr_options=DEFAULT_OCR_OPTIONS, jobs=1
+):
+    """Read the clock photos concurrently (the OCR is the bottleneck)
+
+    Return the ClockPhoto of the photos where a time could be read, in the same
+    order as photo_paths.
+    """
+    clock_photos = []
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(
+                read_clock_photo, photo_path, backend, ocr_cache, ocr_options
+            )
+            for photo_path in photo_paths
+        ]
+        for photo_path, future in zip(photo_paths, futures, strict=True):
+            name = os.path.basename(photo_path)
+            # a photo that fails (eg error of the API) does not stop the others
+            try:
+                clock_photo = future.result()
+            except Exception as ex:
+                msg = ex.message if isinstance(ex, click.ClickException) else str(ex)
+                logger.error(f"{name}: {msg}")
+                continue
+            logger.info(
+                f"{name} ({clock_photo.model}): Found clock time "
+                f"{clock_photo.time_str_clock}"
+            )
+            clock_photos.append(clock_photo)
+    return clock_photos
+
+
+def compute_delta(clock_photo):
+    dt_clock = find_most_likely_datetime(
+        clock_photo.dt_exif, clock_photo.time_str_clock
+    )
+    return dt_clock - clock_photo.dt_exif
 
-    logger.info("Extracting time from photo with Vision API...")
-    time_str_clock = extract_clock_with_vision_api(photo_path)
-    logger.info(f"Found clock time in image: {time_str_clock}")
 
-    logger.info("=====")
+def candidate_deltas(clock_photos):
+    """Possible deltas in seconds of the clock photos (array photos x candidates)
+
+    The clock only gives the time modulo 12 hours (AM / PM unknown): The candidates
+    are the most likely delta shifted by multiples of 12 hours.
+    """
+    deltas = np.array(
+        [compute_delta(clock_photo).total_seconds() for clock_photo in clock_photos]
+    )
+    return deltas[:, np.newaxis] + CANDIDATE_HALF_DAYS * HALF_DAY_SECONDS
+
+
+def compute_consensus_delta(clock_photos):
+    """Delta agreed on by most clock photos, robust to misread clocks
+
+    Each candidate delta is tried as a hypothesis and the one with the smallest
+    median distance to the photos (taking the closest candidate of each photo) is
+    kept, preferring the smallest delta (like find_most_likely_datetime). Then the
+    photos further than MAD_THRESHOLD scaled MAD from the median are rejected and
+    the delta is the median of the remaining photos.
+    """
+    candidates = candidate_deltas(clock_photos)
+    hypotheses = candidates.ravel()
+
+    # hypotheses x photos x candidates
+    distances = np.abs(candidates[np.newaxis] - hypotheses[:, np.newaxis, np.newaxis])
+    closest = distances.argmin(axis=2)
+    scores = np.median(np.take_along_axis(distances, closest[..., np.newaxis], 2), 1)
+    best = np.lexsort((np.abs(hypotheses), scores.ravel()))[0]
+
+    deltas = candidates[np.arange(len(clock_photos)), closest[best]]
+    median = np.median(deltas)
+    mad = np.median(np.abs(deltas - median))
+    threshold = MAD_THRESHOLD * max(MAD_SCALE * mad, MIN_SPREAD)
+    is_inlier = np.abs(deltas - median) <= threshold
+
+    inliers = deltas[is_inlier]
+    median = np.median(inliers)
+    spread = MAD_SCALE * np.median(np.abs(inliers - median))
+    outliers = [
+        (clock_photo, timedelta(seconds=delta))
+        for clock_photo, delta, ok in zip(clock_photos, deltas, is_inlier, strict=True)
+        if not ok
+    ]
+    return DeltaConsensus(
+        timedelta(seconds=round(median)),
+        timedelta(seconds=round(spread)),
+        timedelta(seconds=inliers.min()),
+        timedelta(seconds=inliers.max()),
+        len(inliers),
+        outliers,
+    )
+
+
+def compute_camera_deltas(clock_photos):
+    """One consensus delta per camera model"""
+    clock_photos_by_model = defaultdict(list)
+    for clock_photo in clock_photos:
+        clock_photos_by_model[clock_photo.model].append(clock_photo)
+    return {
+        model: compute_consensus_delta(model_clock_photos)
+        for model, model_clock_photos in clock_photos_by_model.items()
+    }
+
+
+def print_consensus(model, consensus):
+    for clock_photo, delta in consensus.outliers:
+        logger.warning(
+            f"{os.path.basename(clock_photo.path)}: Delta {format_timedelta(delta)} "
+            "rejected (clock probably misread)"
+        )
+    logger.info(
+        f"{model}: {format_timedelta(consensus.delta)} "
+        f"({consensus.num_photos} photos, spread {format_timedelta(consensus.spread)}"
+        f", range {format_timedelta(consensus.min_delta)} to "
+        f"{format_timedelta(consensus.max_delta)})"
+    )
+
+
+def print_clock_photo(clock_photo, is_both_am_pm, is_time_range):
+    dt_exif = clock_photo.dt_exif
+    time_str_clock = clock_photo.time_str_clock
 
     if is_both_am_pm:
         time_clock1 = datetime.strptime(time_str_clock, "%H:%M:%S").time()
@@ -171,3 +472,161 @@ def extract_time(photo_path, is_both_am_pm, is_time_range):
         else:
             delta = dt_clock - dt_exif
             print_delta(delta)
+
+
+def parse_crop(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        crop = tuple(float(v) for v in value.split(","))
+    except ValueError:
+        crop = ()
+    if (
+        len(crop) != 4
+        or not all(0 <= v <= 1 for v in crop)
+        or crop[0] >= crop[2]
+        or crop[1] >= crop[3]
+    ):
+        raise click.BadParameter(
+            "Must be left,top,right,bottom fractions between 0 and 1", ctx
+        )
+    return crop
+
+
+@click.command(
+    name="extract-time",
+    help=(
+        "Extract time from photos of a clock and compute a delta with the EXIF time "
+        "(one per camera model if multiple photos)"
+    ),
+)
+@click.argument(
+    "photo_paths",
+    metavar="PHOTO_PATH...",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, resolve_path=True),
+)
+@click.option(
+    "--both-am-pm",
+    "is_both_am_pm",
+    is_flag=True,
+    help="Output both AM and PM possibilities for the time",
+    required=False,
+)
+@click.option(
+    "--time-range",
+    "is_time_range",
+    is_flag=True,
+    help="Output time difference as time range (HH:MM:SS-HH:MM:SS) instead of delta",
+    required=False,
+)
+@click.option(
+    "-j",
+    "--jobs",
+    "jobs",
+    type=click.IntRange(min=1),
+    default=DEFAULT_JOBS,
+    show_default=True,
+    help="Number of photos sent to the Vision API concurrently",
+    required=False,
+)
+@click.option(
+    "--ocr-image",
+    "ocr_image",
+    type=click.Choice(OCR_IMAGE_CHOICES),
+    default="reduced",
+    show_default=True,
+    help=(
+        "Image sent for OCR: 'reduced' (decoded at a reduced size, requires Pillow), "
+        "'thumbnail' (thumbnail embedded in the EXIF) or 'original' (full file)"
+    ),
+    required=False,
+)
+@click.option(
+    "--ocr-max-size",
+    "ocr_max_size",
+    type=click.IntRange(min=100),
+    default=DEFAULT_OCR_MAX_SIZE,
+    show_default=True,
+    help="Maximum width and height in pixels of the reduced image sent for OCR",
+    required=False,
+)
+@click.option(
+    "--crop",
+    "crop",
+    callback=parse_crop,
+    help=(
+        "Region of the photo with the clock, as left,top,right,bottom fractions of "
+        "the width and height (eg 0.25,0.25,0.75,0.75 for the center). Only for the "
+        "reduced image."
+    ),
+    required=False,
+)
+@click.option(
+    "--no-ocr-cache",
+    "is_ocr_cache",
+    is_flag=True,
+    default=False,
+    callback=reverse_flag,
+    help=(
+        "Flag to indicate that the texts found in the photos should not be cached "
+        "on disk (by default, a photo already processed is not sent again)"
+    ),
+    required=False,
+)
+def extract_time(
+    photo_paths,
+    is_both_am_pm,
+    is_time_range,
+    jobs,
+    ocr_image,
+    ocr_max_size,
+    crop,
+    is_ocr_cache,
+):
+    if not VISION_AVAILABLE:
+        raise click.ClickException(
+            "Google Cloud Vision is not installed. "
+            "Please install the extra: 'vision' eg pip install gpx2exif[vision]"
+        )
+
+    photo_paths = get_photo_paths(photo_paths)
+    if not photo_paths:
+        raise click.ClickException("No photo found")
+
+    ocr_cache = None
+    if is_ocr_cache:
+        ocr_cache = OcrCache(
+            Path(click.get_app_dir(DEFAULT_APP_DIR)) / OCR_CACHE_DIRNAME
+        )
+
+    if crop and ocr_image != "reduced":
+        raise click.UsageError("--crop can only be used with --ocr-image reduced")
+    ocr_options = OcrOptions(ocr_image, ocr_max_size, crop)
+
+    # one client for all the photos (created only if one is not in the cache)
+    backend = VisionOcrBackend()
+
+    if len(photo_paths) == 1:
+        logger.info("Extracting time from photo with Vision API...")
+        clock_photo = read_clock_photo(photo_paths[0], backend, ocr_cache, ocr_options)
+        logger.info(f"Found clock time in image: {clock_photo.time_str_clock}")
+        logger.info("=====")
+        print_clock_photo(clock_photo, is_both_am_pm, is_time_range)
+        return
+
+    logger.info(f"Extracting time from {len(photo_paths)} photos with Vision API...")
+    clock_photos = read_clock_photos(photo_paths, backend, ocr_cache, ocr_options, jobs)
+    if not clock_photos:
+        raise click.ClickException("No time found in any photo")
+
+    if is_both_am_pm or is_time_range:
+        for clock_photo in clock_photos:
+            logger.info("=====")
+            logger.info(os.path.basename(clock_photo.path))
+            print_clock_photo(clock_photo, is_both_am_pm, is_time_range)
+
+    logger.info("=====")
+    for model, consensus in compute_camera_deltas(clock_photos).items():
+        print_consensus(model, consensus)
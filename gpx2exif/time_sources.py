@@ -0,0 +1,59 @@
+"""Sources of the capture time of a photo other than its EXIF
+
+The times are naive (local time of the camera, like DateTimeOriginal without
+OffsetTimeOriginal).
+"""
+
+from datetime import datetime
+import os
+import re
+
+TIME_SOURCE_EXIF = "exif"
+TIME_SOURCE_FILENAME = "filename"
+TIME_SOURCE_MTIME = "mtime"
+# in the order of a chain: the first source with a time is used
+TIME_SOURCES = (TIME_SOURCE_EXIF, TIME_SOURCE_FILENAME, TIME_SOURCE_MTIME)
+DEFAULT_TIME_SOURCES = (TIME_SOURCE_EXIF,)
+
+FILENAME_TIME_PATTERNS = [
+    # IMG_20260205_095943.jpg (Android), PXL_20260205_095943123.jpg (Pixel, with
+    # milliseconds), VID_20260205_095943, Screenshot_20260205-095943,
+    # DJI_20260205095943_0001.JPG
+    re.compile(
+        r"(?<!\d)(?P<Y>\d{4})(?P<m>\d{2})(?P<d>\d{2})[_-]?"
+        r"(?P<H>\d{2})(?P<M>\d{2})(?P<S>\d{2})(?P<ms>\d{3})?(?!\d)"
+    ),
+    # 2026-02-05 09.59.43.jpg (Dropbox camera uploads), 2026-02-05_09-59-43
+    re.compile(
+        r"(?<!\d)(?P<Y>\d{4})-(?P<m>\d{2})-(?P<d>\d{2})[ _T]"
+        r"(?P<H>\d{2})[.:-](?P<M>\d{2})[.:-](?P<S>\d{2})(?!\d)"
+    ),
+]
+
+
+def time_from_filename(name):
+    """Time encoded in the name of a file (without opening it) or None"""
+    for pattern in FILENAME_TIME_PATTERNS:
+        for match in pattern.finditer(name):
+            fields = match.groupdict()
+            try:
+                return datetime(
+                    int(fields["Y"]),
+                    int(fields["m"]),
+                    int(fields["d"]),
+                    int(fields["H"]),
+                    int(fields["M"]),
+                    int(fields["S"]),
+                    int(fields.get("ms") or 0) * 1000,
+                )
+            except ValueError:
+                # not a date (eg a counter)
+                continue
+    return None
+
+
+def time_from_mtime(path):
+    """Time of the last modification of the file, in the local time of the
+    computer (the camera time if the camera was set to the same timezone and the
+    file has not been modified)"""
+    return datetime.fromtimestamp(os.stat(path).st_mtime)
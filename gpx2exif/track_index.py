@@ -0,0 +1,270 @@
+"""Index of GPX tracks kept in memory, updated when the GPX files change
+
+For a GPX that keeps growing (eg synced from a logger during the day), only the
+bytes appended since the last read are parsed.
+"""
+
+import functools
+import logging
+import os
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+from .geotagger import Geotagger
+
+logger = logging.getLogger(__package__)
+
+# seconds between 2 checks of the GPX files for a change
+DEFAULT_RELOAD_INTERVAL = 2.0
+# bytes compared at the start of the file and before the offset, to detect a file
+# that has been replaced (instead of appended to)
+CHECK_SIZE = 256
+INITIAL_CAPACITY = 1024
+# the elements parsed are dropped after each chunk fed to the parser
+FEED_SIZE = 1024 * 1024
+
+# the data is parsed up to the end of the last complete trackpoint: a trackpoint
+# still being written is parsed at the next update
+TRKPT_END_RE = re.compile(rb"</(?:[\w.-]+:)?trkpt\s*>")
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+@functools.cache
+def _local_name(tag):
+    return tag.rpartition("}")[2]
+
+
+class _SegmentBuffer:
+    """Points of a track segment, in arrays grown by doubling their capacity"""
+
+    def __init__(self):
+        self.size = 0
+        # ns since epoch (UTC)
+        self.times = np.empty(INITIAL_CAPACITY, dtype=np.int64)
+        self.lats = np.empty(INITIAL_CAPACITY)
+        self.lons = np.empty(INITIAL_CAPACITY)
+        self._frame = None
+
+    def append(self, times, lats, lons):
+        end = self.size + len(times)
+        if end > len(self.times):
+            capacity = max(end, 2 * len(self.times))
+            for name in ["times", "lats", "lons"]:
+                array = getattr(self, name)
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[: self.size] = array[: self.size]
+                setattr(self, name, grown)
+        # beyond the end of the frames already returned: they do not change
+        self.times[self.size : end] = times
+        self.lats[self.size : end] = lats
+        self.lons[self.size : end] = lons
+        self.size = end
+        self._frame = None
+
+    def frame(self):
+        """DataFrame like in read_gpx (lat and lon are views on the arrays)"""
+        if self._frame is None:
+            n = self.size
+            index = pd.DatetimeIndex(
+                self.times[:n].view("M8[ns]"), dtype="datetime64[ns, UTC]", name="time"
+            )
+            self._frame = pd.DataFrame(
+                {"lat": self.lats[:n], "lon": self.lons[:n]}, index, copy=False
+            )
+        return self._frame
+
+
+class IncrementalGpxReader:
+    """Track segments of a GPX file, read again from the byte offset of the last
+    read when the file has grown
+
+    The state of the XML parser is kept between the reads, so the cost of an
+    update is proportional to the number of new points. The points can be
+    appended to the last segment or in new segments and tracks; the closing tags
+    at the end of the file can be rewritten by the logger for each new point.
+
+    If the file has been replaced (shorter, or different bytes at the start or
+    before the offset), it is read again from the start.
+
+    The points without time are skipped. The segments are the same as read_gpx
+    (but the times are in UTC).
+    """
+
+    def __init__(self, gpx_filepath):
+        self.gpx_filepath = gpx_filepath
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._head = b""
+        self._tail = b""
+        self._buffers = []
+        self._trkseg = None
+
+    @property
+    def segments(self):
+        """DataFrames of the non-empty segments"""
+        return [buffer.frame() for buffer in self._buffers if buffer.size]
+
+    def _is_same_file(self, f, size):
+        if size < self.offset:
+            return False
+        if f.read(len(self._head)) != self._head:
+            return False
+        f.seek(self.offset - len(self._tail))
+        return f.read(len(self._tail)) == self._tail
+
+    def update(self):
+        """Parse the points added since the last update: return their number"""
+        with open(self.gpx_filepath, "rb") as f:
+            if self.offset and not self._is_same_file(f, os.fstat(f.fileno()).st_size):
+                logger.info(f"{self.gpx_filepath} has been replaced: Read again")
+                self._reset()
+            f.seek(self.offset)
+            data = f.read()
+
+        end = None
+        for match in TRKPT_END_RE.finditer(data):
+            end = match.end()
+        if end is None:
+            return 0
+        data = data[:end]
+        points = [], [], [], []
+        try:
+            for i in range(0, end, FEED_SIZE):
+                self._parser.feed(data[i : i + FEED_SIZE])
+                self._read_events(*points)
+            num_points = self._append_points(*points)
+        except Exception:
+            # the parser cannot continue: from the start at the next update
+            self._reset()
+            raise
+        if not self._head:
+            self._head = data[:CHECK_SIZE]
+        self._tail = (self._tail + data)[-CHECK_SIZE:]
+        self.offset += end
+        return num_points
+
+    def _read_events(self, buffers, lats, lons, times):
+        for event, elem in self._parser.read_events():
+            name = _local_name(elem.tag)
+            if event == "start":
+                if name == "trkseg":
+                    self._trkseg = elem
+                    self._buffers.append(_SegmentBuffer())
+                continue
+            if name == "trkseg":
+                self._trkseg = None
+                elem.clear()
+            if name != "trkpt":
+                continue
+
+            if not self._buffers:
+                # invalid GPX (trkpt outside of trkseg)
+                self._buffers.append(_SegmentBuffer())
+            time_str = elem.findtext(elem.tag[: -len("trkpt")] + "time")
+            if time_str:
+                buffers.append(self._buffers[-1])
+                lats.append(float(elem.get("lat")))
+                lons.append(float(elem.get("lon")))
+                times.append(time_str.strip())
+        # the points are only kept in the buffers
+        if self._trkseg is not None:
+            del self._trkseg[:]
+
+    def _append_points(self, buffers, lats, lons, times):
+        if not times:
+            return 0
+        # naive times: UTC (like in the EXIF without offset)
+        times = pd.to_datetime(times, utc=True, format="ISO8601").as_unit("ns").asi8
+        # consecutive points of the same segment appended at once
+        start = 0
+        for i in range(1, len(buffers) + 1):
+            if i == len(buffers) or buffers[i] is not buffers[start]:
+                buffers[start].append(times[start:i], lats[start:i], lons[start:i])
+                start = i
+        return len(times)
+
+
+class TrackIndex:
+    """Geotagger for GPX files, updated when one of the files changes
+
+    The files are checked at most every check_interval seconds, when the
+    geotagger is requested. The points appended to a file are parsed
+    incrementally (see IncrementalGpxReader). If a file cannot be read (eg being
+    rewritten), the previous version of the geotagger is kept.
+    """
+
+    def __init__(self, gpx_paths, options=None, check_interval=DEFAULT_RELOAD_INTERVAL):
+        self.gpx_paths = list(gpx_paths)
+        self.options = options
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._readers = [IncrementalGpxReader(path) for path in self.gpx_paths]
+        self._signatures = self._read_signatures()
+        for reader in self._readers:
+            reader.update()
+        self.geotagger = self._build_geotagger()
+        self.loaded_time = time.time()
+        self._next_check = time.monotonic() + check_interval
+
+    def _read_signatures(self):
+        return [file_signature(path) for path in self.gpx_paths]
+
+    def _build_geotagger(self):
+        segments = [df for reader in self._readers for df in reader.segments]
+        return Geotagger(segments, self.options)
+
+    def get(self):
+        if time.monotonic() >= self._next_check:
+            with self._lock:
+                self._reload_if_changed()
+        return self.geotagger
+
+    def _reload_if_changed(self):
+        self._next_check = time.monotonic() + self.check_interval
+        try:
+            signatures = self._read_signatures()
+            if signatures == self._signatures:
+                return
+            num_points = 0
+            for reader, old, new in zip(
+                self._readers, self._signatures, signatures, strict=True
+            ):
+                if old != new:
+                    num_points += reader.update()
+            geotagger = self._build_geotagger()
+            if self.geotagger.gpx_segments and not geotagger.gpx_segments:
+                # eg rewritten and not complete yet
+                raise ValueError("No GPX point")
+        except Exception as ex:
+            logger.error(f"Cannot reload the GPX (previous version kept): {ex}")
+            return
+        self._signatures = signatures
+        # atomic for the requests in progress
+        self.geotagger = geotagger
+        self.loaded_time = time.time()
+        logger.info(f"GPX reloaded: {num_points} new points")
+
+    def info(self):
+        geotagger = self.get()
+        segments = geotagger.gpx_segments
+        return {
+            "gpx": [str(path) for path in self.gpx_paths],
+            "segments": len(segments),
+            "points": sum(len(df) for df in segments),
+            # no point yet: eg GPX just created
+            "start": segments[0].index[0].isoformat() if segments else None,
+            "end": segments[-1].index[-1].isoformat() if segments else None,
+            "loaded": pd.Timestamp(self.loaded_time, unit="s", tz="utc").isoformat(),
+        }
@@ -0,0 +1,369 @@
+import logging
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+
+import click
+import piexif
+
+from .common import (
+    GeotagOptions,
+    clear_option,
+    delta_option,
+    delta_tz_option,
+    print_delta,
+    process_delta,
+    process_tolerance,
+    time_source_option,
+    tolerance_option,
+    update_images_option,
+    update_time_option,
+)
+from .time_sources import DEFAULT_TIME_SOURCES
+from .track_index import TrackIndex
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    WATCHDOG_AVAILABLE = False
+
+logger = logging.getLogger(__package__)
+
+# a file is processed once its size and mtime have not changed for that long
+DEFAULT_SETTLE = 2.0
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_BATCH_SIZE = 20
+
+
+def is_candidate(path):
+    # hidden files are skipped (OS metadata, temporary files of some copy tools)
+    return not os.path.basename(path).startswith(".")
+
+
+class PendingFiles:
+    """Files created or changed in the folder, waiting to be completely written
+
+    A file is ready when its size and modification time have not changed for
+    settle seconds (a copy in progress changes them). Thread-safe: the files are
+    added by the watchdog thread.
+    """
+
+    def __init__(self, settle=DEFAULT_SETTLE):
+        self.settle = settle
+        self._lock = threading.Lock()
+        # path => (size, mtime_ns) at the last check, time of the last change
+        self._files = {}
+
+    def __len__(self):
+        return len(self._files)
+
+    def add(self, path, now):
+        with self._lock:
+            # the change is confirmed by the stat at the next check
+            self._files[path] = (None, now)
+
+    def pop_ready(self, now):
+        """Paths of the files that are ready (in order of name)"""
+        ready = []
+        with self._lock:
+            for path, (signature, changed) in list(self._files.items()):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    # deleted or renamed (the new name has its own event)
+                    del self._files[path]
+                    continue
+                current = (stat.st_size, stat.st_mtime_ns)
+                if current != signature:
+                    self._files[path] = (current, now)
+                elif now - changed >= self.settle:
+                    del self._files[path]
+                    ready.append(path)
+        return sorted(ready)
+
+
+class FolderWatcher:
+    """Geotagging of the files arriving in a folder, each file once
+
+    The new files come from watchdog (inotify on Linux) if available or from a
+    scan of the folder every poll interval. They are geotagged in batches once
+    they are ready (see PendingFiles).
+
+    geotagger is a Geotagger, or a TrackIndex for a GPX that is still growing (the
+    new points are used for the next batches, and the files that could not be
+    located are tried again with them).
+    """
+
+    def __init__(
+        self,
+        folder,
+        geotagger,
+        settle=DEFAULT_SETTLE,
+        poll_interval=DEFAULT_POLL_INTERVAL,
+        batch_size=DEFAULT_BATCH_SIZE,
+        is_polling=False,
+    ):
+        self.folder = str(folder)
+        self.geotagger = geotagger
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.is_polling = is_polling or not WATCHDOG_AVAILABLE
+        self.pending = PendingFiles(settle)
+        # includes the files present at the start (unless processed)
+        self.seen = set()
+        # files without position => geotagger used: tried again with new points
+        self.unlocated = {}
+        self.num_tagged = 0
+        self._observer = None
+
+    def skip_existing(self):
+        for entry in os.scandir(self.folder):
+            self.seen.add(entry.path)
+
+    def add_existing(self):
+        self.scan(time.monotonic())
+
+    def on_path(self, path, now):
+        if path in self.seen or not is_candidate(path):
+            return
+        self.seen.add(path)
+        self.pending.add(path, now)
+
+    def scan(self, now):
+        for entry in os.scandir(self.folder):
+            if entry.path not in self.seen and entry.is_file():
+                self.on_path(entry.path, now)
+
+    def start(self):
+        if self.is_polling:
+            logger.info(f"Polling {self.folder} every {self.poll_interval}s...")
+            return
+        logger.info(f"Watching {self.folder}...")
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                # moved: eg temporary file renamed at the end of the copy
+                path = getattr(event, "dest_path", "") or event.src_path
+                # also events for the files already seen: ignored
+                watcher.on_path(os.fsdecode(path), time.monotonic())
+
+        self._observer = Observer()
+        self._observer.schedule(Handler(), self.folder, recursive=False)
+        self._observer.start()
+
+    def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+
+    def get_geotagger(self):
+        if isinstance(self.geotagger, TrackIndex):
+            return self.geotagger.get()
+        return self.geotagger
+
+    def _pop_retries(self, geotagger):
+        # eg after the end of the GPX when tagged: the GPX may have grown since
+        retries = [
+            path for path, used in self.unlocated.items() if used is not geotagger
+        ]
+        for path in retries:
+            del self.unlocated[path]
+        return retries
+
+    def process_ready(self, now):
+        ready = self.pending.pop_ready(now)
+        ready = sorted(set(ready + self._pop_retries(self.get_geotagger())))
+        for i in range(0, len(ready), self.batch_size):
+            batch = ready[i : i + self.batch_size]
+            geotagger = self.get_geotagger()
+            for path in batch:
+                name = os.path.basename(path)
+                # one file that cannot be read does not stop the watch
+                try:
+                    pos = geotagger.tag_file(path)
+                except piexif.InvalidImageDataError:
+                    logger.error(f"File {name} is not a JPEG or TIFF image")
+                    continue
+                except Exception as ex:
+                    logger.error(f"File {name} could not be geotagged: {ex}")
+                    continue
+                if pos:
+                    self.num_tagged += 1
+                    logger.info(f"{name} => {pos.lat}, {pos.lon}")
+                else:
+                    self.unlocated[path] = geotagger
+        return len(ready)
+
+    def poll_once(self, now):
+        if self.is_polling:
+            self.scan(now)
+        return self.process_ready(now)
+
+    def run(self, stop_event=None):
+        self.start()
+        try:
+            while stop_event is None or not stop_event.is_set():
+                self.poll_once(time.monotonic())
+                # pending files are checked again at the same interval
+                time.sleep(self.poll_interval)
+        finally:
+            self.stop()
+
+
+@click.command(
+    name="watch",
+    help=(
+        "Watch a folder and add GPS EXIF tags to the images copied to it, based on a "
+        "GPX file (possibly still growing)"
+    ),
+)
+@click.argument(
+    "gpx_filepath",
+    metavar="GPX_FILE",
+    type=click.Path(exists=True, resolve_path=True, dir_okay=False),
+)
+@click.argument(
+    "folder",
+    metavar="DIR",
+    type=click.Path(exists=True, resolve_path=True, file_okay=False),
+)
+@delta_option
+@delta_tz_option
+@tolerance_option
+@time_source_option
+@click.option(
+    "-o",
+    "--ignore-offset",
+    "is_ignore_offset",
+    is_flag=True,
+    help=(
+        "Flag to indicate that the OffsetTimeOriginal should not be used (time of "
+        "images is assumed UTC)"
+    ),
+    required=False,
+)
+@clear_option
+@update_images_option
+@update_time_option
+@click.option(
+    "--existing",
+    "is_existing",
+    is_flag=True,
+    help="Flag to also process the files already in the folder at the start",
+    required=False,
+)
+@click.option(
+    "--settle",
+    "settle",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_SETTLE,
+    show_default=True,
+    help=(
+        "Seconds without change to the size of a new file before it is processed "
+        "(for the files being copied)"
+    ),
+    required=False,
+)
+@click.option(
+    "--poll",
+    "is_polling",
+    is_flag=True,
+    help="Flag to scan the folder periodically instead of using watchdog (inotify)",
+    required=False,
+)
+@click.option(
+    "--interval",
+    "poll_interval",
+    type=click.FloatRange(min=0.1),
+    default=DEFAULT_POLL_INTERVAL,
+    show_default=True,
+    help="Seconds between 2 checks of the new files",
+    required=False,
+)
+@click.option(
+    "--batch-size",
+    "batch_size",
+    type=click.IntRange(min=1),
+    default=DEFAULT_BATCH_SIZE,
+    show_default=True,
+    help="Maximum number of files geotagged at a time",
+    required=False,
+)
+@click.pass_context
+def watch_command(
+    ctx,
+    gpx_filepath,
+    folder,
+    delta,
+    delta_tz,
+    tolerance,
+    time_sources,
+    is_ignore_offset,
+    is_clear,
+    is_update_images,
+    is_update_time,
+    is_existing,
+    settle,
+    is_polling,
+    poll_interval,
+    batch_size,
+):
+    watcher = None
+    try:
+        logger.info("Parsing time shift...")
+        delta = process_delta(delta)
+        print_delta(delta, "Time")
+        delta_tz = process_delta([delta_tz]) if delta_tz else None
+        if delta_tz:
+            print_delta(delta_tz, "TZ time")
+
+        options = GeotagOptions(
+            delta,
+            delta_tz,
+            process_tolerance(tolerance),
+            is_ignore_offset,
+            is_clear,
+            is_update_images,
+            is_update_time,
+            time_sources or DEFAULT_TIME_SOURCES,
+        )
+        logger.info("Parsing GPX...")
+        # the GPX can still be growing (eg synced from a logger)
+        index = TrackIndex([gpx_filepath], options)
+        info = index.info()
+        if info["points"]:
+            logger.info(f"GPX time range: {info['start']} => {info['end']}")
+        else:
+            logger.warning("No GPX point yet: The images will be tagged once added")
+
+        if not is_update_images:
+            logger.warning("The images will not be updated!")
+        if not is_polling and not WATCHDOG_AVAILABLE:
+            logger.warning("watchdog is not installed: Polling the folder")
+
+        watcher = FolderWatcher(
+            Path(folder), index, settle, poll_interval, batch_size, is_polling
+        )
+        if is_existing:
+            watcher.add_existing()
+        else:
+            watcher.skip_existing()
+        watcher.run()
+
+    except KeyboardInterrupt:
+        if watcher is not None:
+            logger.info(f"Stopped: {watcher.num_tagged} images geotagged")
+
+    except Exception as ex:
+        logger.error("*** An unrecoverable error occured ***")
+        lf = logger.error if not ctx.obj["DEBUG"] else logger.exception
+        lf(str(ex))
+        sys.exit(1)
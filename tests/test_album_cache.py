@@ -0,0 +1,141 @@
+import os
+from pathlib import Path
+import tempfile
+import time
+from types import SimpleNamespace
+import unittest
+from unittest.mock import MagicMock
+
+from gpx2exif.album_cache import AlbumCache
+from gpx2exif.gpx2flickr import FlickrAlbum, get_images_in_album_cached
+
+
+def make_entry(photos, refreshed=None):
+    return {
+        "date_update": "100",
+        "refreshed": time.time() if refreshed is None else refreshed,
+        "photos": photos,
+    }
+
+
+class AlbumCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_save_and_load(self):
+        cache = AlbumCache(self.cache_dir, ttl=3600)
+        cache.save("42", make_entry([{"id": "1", "latitude": 0}]))
+
+        entry = cache.load("42")
+
+        self.assertEqual(entry["photos"][0].id, "1")
+        self.assertTrue(cache.is_fresh(entry))
+        self.assertIsNone(cache.load("43"))
+
+    def test_evict_least_recently_used_above_max_bytes(self):
+        cache = AlbumCache(self.cache_dir, ttl=3600, max_bytes=1)
+        cache.save("1", make_entry([]))
+        old = time.time() - 100
+        os.utime(self.cache_dir / "1.json", (old, old))
+        cache.save("2", make_entry([]))
+
+        self.assertFalse((self.cache_dir / "1.json").exists())
+        self.assertTrue((self.cache_dir / "2.json").exists())
+
+    def test_evict_expired(self):
+        cache = AlbumCache(self.cache_dir, ttl=3600, max_age=10)
+        cache.save("1", make_entry([]))
+        old = time.time() - 100
+        os.utime(self.cache_dir / "1.json", (old, old))
+
+        cache.evict()
+
+        self.assertFalse((self.cache_dir / "1.json").exists())
+
+
+class AlbumCacheFlickrTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.album = FlickrAlbum("42", "url")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_flickr(self, date_update="100", updated=()):
+        return SimpleNamespace(
+            photosets=SimpleNamespace(
+                getInfo=MagicMock(
+                    return_value={"photoset": {"date_update": date_update}}
+                ),
+                getPhotos=MagicMock(),
+            ),
+            photos=SimpleNamespace(
+                recentlyUpdated=MagicMock(
+                    return_value={"photos": {"pages": 1, "photo": list(updated)}}
+                )
+            ),
+        )
+
+    def test_fresh_entry_needs_no_call(self):
+        cache = AlbumCache(self.tmp_dir.name, ttl=3600)
+        cache.save("42", make_entry([{"id": "1", "lastupdate": "5"}]))
+        flickr = self.make_flickr()
+
+        _, images = get_images_in_album_cached(flickr, self.album, cache)
+
+        self.assertEqual([image.id for image in images], ["1"])
+        flickr.photosets.getInfo.assert_not_called()
+        flickr.photosets.getPhotos.assert_not_called()
+
+    def test_fresh_entry_is_refreshed_for_updates(self):
+        cache = AlbumCache(self.tmp_dir.name, ttl=3600)
+        cache.save("42", make_entry([{"id": "1", "lastupdate": "5"}]))
+        updated = [{"id": "1", "lastupdate": "9", "latitude": 1.5}]
+        flickr = self.make_flickr(updated=updated)
+
+        _, images = get_images_in_album_cached(
+            flickr, self.album, cache, is_refresh=True
+        )
+
+        self.assertEqual(images[0].latitude, 1.5)
+        flickr.photos.recentlyUpdated.assert_called()
+        flickr.photosets.getPhotos.assert_not_called()
+
+    def test_stale_entry_is_refreshed_incrementally(self):
+        cache = AlbumCache(self.tmp_dir.name, ttl=3600)
+        photos = [{"id": "1", "lastupdate": "5"}, {"id": "2", "lastupdate": "5"}]
+        cache.save("42", make_entry(photos, refreshed=time.time() - 7200))
+        updated = [
+            {"id": "2", "lastupdate": "9", "latitude": 1.5},
+            {"id": "3", "lastupdate": "9"},
+        ]
+        flickr = self.make_flickr(updated=updated)
+
+        entry, images = get_images_in_album_cached(flickr, self.album, cache)
+
+        self.assertEqual([image.id for image in images], ["1", "2"])
+        self.assertEqual(entry["photos"][1].latitude, 1.5)
+        self.assertTrue(cache.is_fresh(entry))
+        flickr.photosets.getPhotos.assert_not_called()
+
+    def test_changed_album_is_listed_again(self):
+        cache = AlbumCache(self.tmp_dir.name, ttl=3600)
+        cache.save("42", make_entry([], refreshed=0))
+        flickr = self.make_flickr(date_update="200")
+        flickr.photosets.getPhotos.return_value = {
+            "photoset": {"title": "a", "total": 1, "pages": 1, "photo": [{"id": "7"}]}
+        }
+
+        entry, images = get_images_in_album_cached(flickr, self.album, cache)
+
+        self.assertEqual([image.id for image in images], ["7"])
+        self.assertEqual(entry["date_update"], "200")
+        self.assertEqual(len(entry["photos"]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
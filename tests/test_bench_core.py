@@ -0,0 +1,66 @@
+from datetime import datetime
+from pathlib import Path
+import tempfile
+import unittest
+
+import piexif
+
+from benchmarks.bench_core import compare_results
+from benchmarks.corpus import write_gpx, write_jpegs
+from gpx2exif.common import read_gpx
+from gpx2exif.gpx2exif import read_original_photo_time
+
+
+class CorpusTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_gpx(self):
+        gpx_path = self.dir / "track.gpx"
+        start_time, end_time = write_gpx(gpx_path, 1000, num_segments=3)
+
+        gpx_segments = read_gpx(gpx_path)
+        self.assertEqual([len(df) for df in gpx_segments], [334, 334, 332])
+        self.assertEqual(gpx_segments[0].index[0], start_time)
+        self.assertEqual(gpx_segments[-1].index[-1], end_time)
+
+    def test_jpegs(self):
+        paths = write_jpegs(
+            self.dir / "photos", 2, 100_000, offset="+02:00", is_gps=True
+        )
+
+        self.assertAlmostEqual(Path(paths[1]).stat().st_size, 100_000, delta=1000)
+        exif_data = piexif.load(paths[1])
+        self.assertEqual(
+            read_original_photo_time(exif_data, False, False),
+            datetime.fromisoformat("2025-10-24T08:00:30+00:00"),
+        )
+        self.assertIn(piexif.GPSIFD.GPSLatitude, exif_data["GPS"])
+
+
+class CompareTest(unittest.TestCase):
+    def test_regressions(self):
+        baseline = [
+            {"name": "read_gpx", "scale": 1000, "seconds": 1.0},
+            {"name": "write_kml", "scale": 100, "seconds": 1.0},
+        ]
+        current = [
+            {"name": "read_gpx", "scale": 1000, "seconds": 1.1},
+            {"name": "write_kml", "scale": 100, "seconds": 1.5},
+            {"name": "write_kml", "scale": 1000, "seconds": 9.0},
+        ]
+
+        rows = compare_results(baseline, current, 0.2)
+
+        self.assertEqual(
+            [(name, is_regression) for name, *_, is_regression in rows],
+            [("read_gpx", False), ("write_kml", True)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta, timezone
+import unittest
+
+import pandas as pd
+
+from gpx2exif.common import (
+    MATCH_EXACT,
+    MATCH_INTERPOLATED,
+    MATCH_OUTSIDE,
+    compute_pos,
+    compute_positions,
+)
+
+START = datetime(2025, 10, 24, 8, 0, 0, tzinfo=timezone.utc)
+
+
+def make_segment():
+    index = pd.DatetimeIndex(
+        [START, START + timedelta(seconds=10), START + timedelta(seconds=20)],
+        name="time",
+    )
+    return pd.DataFrame({"lat": [45.0, 45.1, 45.2], "lon": [6.0, 6.1, 6.2]}, index)
+
+
+class ComputePosTest(unittest.TestCase):
+    def test_match_quality(self):
+        gpx_segments = [make_segment()]
+        tolerance = timedelta(seconds=5)
+
+        pos = compute_pos(START + timedelta(seconds=10), gpx_segments, tolerance)
+        self.assertEqual((pos.lat, pos.lon, pos.quality), (45.1, 6.1, MATCH_EXACT))
+
+        pos = compute_pos(START + timedelta(seconds=13), gpx_segments, tolerance)
+        self.assertEqual(pos.quality, MATCH_INTERPOLATED)
+        self.assertEqual(pos.gap, 3)
+        self.assertAlmostEqual(pos.lat, 45.13)
+
+        pos = compute_pos(START - timedelta(seconds=2), gpx_segments, tolerance)
+        self.assertEqual((pos.lat, pos.quality, pos.gap), (45.0, MATCH_OUTSIDE, 2))
+
+        self.assertIsNone(
+            compute_pos(START + timedelta(seconds=30), gpx_segments, tolerance)
+        )
+
+    def test_vectorized_same_as_compute_pos(self):
+        second = make_segment()
+        second.index = second.index + timedelta(seconds=40)
+        gpx_segments = [make_segment(), second]
+        tolerance = timedelta(seconds=5)
+        img_times = [
+            START + timedelta(seconds=s)
+            for s in [-10, -3, 0, 4.5, 10, 19, 20, 23, 30, 37, 40, 55, 60, 64, 66]
+        ]
+        expected = [compute_pos(t, gpx_segments, tolerance) for t in img_times]
+        self.assertEqual(
+            compute_positions(img_times, gpx_segments, tolerance), expected
+        )
+        index = pd.DatetimeIndex(img_times)
+        self.assertEqual(compute_positions(index, gpx_segments, tolerance), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
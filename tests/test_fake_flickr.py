@@ -0,0 +1,78 @@
+from datetime import timedelta
+import logging
+import unittest
+from unittest.mock import patch
+
+from addict import Dict as Addict
+
+from benchmarks.bench_flickr import make_track
+from benchmarks.fake_flickr import (
+    ALBUM_ID,
+    ALBUM_URL,
+    FakeFlickr,
+    FakeFlickrServer,
+    create_fake_flickr_api,
+)
+from gpx2exif.flickr_writer import FlickrWriter
+from gpx2exif.gpx2flickr import FlickrAlbum, synch_gps_flickr
+
+
+class FakeFlickrServerTest(unittest.TestCase):
+    def setUp(self):
+        # logs the HTTP errors
+        logging.getLogger("flickrapi").setLevel(logging.CRITICAL)
+
+    def synch(self, flickr, num_photos, writer):
+        user = Addict(flickr.urls.lookupUser(url=ALBUM_URL)).user
+        return synch_gps_flickr(
+            flickr,
+            user,
+            FlickrAlbum(ALBUM_ID, ALBUM_URL),
+            make_track(num_photos),
+            timedelta(0),
+            timedelta(0),
+            timedelta(seconds=10),
+            False,
+            True,
+            False,
+            False,
+            writer=writer,
+        )
+
+    @patch("gpx2exif.flickr_writer.retry_delay", return_value=0)
+    def test_synch_paged_album_with_update_errors(self, _):
+        # 3 pages
+        fake_flickr = FakeFlickr(1200)
+        server = FakeFlickrServer(
+            fake_flickr,
+            error_rate=0.05,
+            seed=1,
+            error_methods={"flickr.photos.geo.setLocation"},
+        )
+        with server, self.assertLogs("gpx2exif", logging.INFO):
+            flickr = create_fake_flickr_api(server.url, pool_size=8)
+            writer = FlickrWriter(flickr, max_retries=10, workers=4)
+            positions = self.synch(flickr, 1200, writer)
+            writer.close()
+
+        self.assertEqual(len(positions), 1200)
+        self.assertGreater(server.http_errors[502], 0)
+        self.assertTrue(all(photo["latitude"] for photo in fake_flickr.photos.values()))
+        self.assertEqual(fake_flickr.calls["flickr.photosets.getPhotos"], 3)
+        self.assertEqual(fake_flickr.calls["flickr.photos.geo.setLocation"], 1200)
+
+    def test_second_run_makes_no_update(self):
+        fake_flickr = FakeFlickr(50)
+        with FakeFlickrServer(fake_flickr) as server:
+            flickr = create_fake_flickr_api(server.url)
+            with self.assertLogs("gpx2exif", logging.INFO):
+                self.synch(flickr, 50, FlickrWriter(flickr))
+                writer = FlickrWriter(flickr)
+                self.synch(flickr, 50, writer)
+
+        self.assertEqual(fake_flickr.calls["flickr.photos.geo.setLocation"], 50)
+        self.assertEqual(writer.stats["api_calls_saved"], 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
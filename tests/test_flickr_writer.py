@@ -0,0 +1,106 @@
+from pathlib import Path
+import tempfile
+from types import SimpleNamespace
+import unittest
+from unittest.mock import MagicMock, patch
+
+from flickrapi import FlickrError
+
+from gpx2exif.flickr_writer import FlickrJournal, FlickrWriter, retry_delay
+
+
+def make_flickr(set_location):
+    return SimpleNamespace(
+        photos=SimpleNamespace(geo=SimpleNamespace(setLocation=set_location))
+    )
+
+
+PARAMS = {"photo_id": "1", "lat": 1.0, "lon": 2.0}
+
+
+@patch("gpx2exif.flickr_writer.retry_delay", return_value=0)
+class FlickrWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.journal_path = Path(self.tmp_dir.name) / "journal.jsonl"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_temporary_error_is_retried(self, _):
+        set_location = MagicMock(
+            side_effect=[FlickrError("do_request: Status code 502 received"), None]
+        )
+        writer = FlickrWriter(make_flickr(set_location), max_retries=3)
+        on_success = MagicMock()
+
+        with patch("gpx2exif.flickr_writer.logger.warning"):
+            writer.call("photos.geo.setLocation", PARAMS, on_success)
+        on_success.assert_not_called()
+        writer.flush()
+
+        self.assertEqual(set_location.call_count, 2)
+        on_success.assert_called_once()
+        self.assertEqual(writer.stats["api_calls_retried"], 1)
+
+    def test_api_error_is_not_retried(self, _):
+        set_location = MagicMock(side_effect=FlickrError("Photo not found", code=1))
+        writer = FlickrWriter(make_flickr(set_location), max_retries=3)
+
+        with self.assertRaises(FlickrError):
+            writer.call("photos.geo.setLocation", PARAMS)
+
+        self.assertEqual(writer.retry_queue, [])
+        self.assertEqual(writer.stats["api_calls_failed"], 1)
+
+    def test_resume_skips_completed_calls(self, _):
+        set_location = MagicMock(side_effect=[FlickrError("502"), None])
+        journal = FlickrJournal(self.journal_path)
+        writer = FlickrWriter(make_flickr(set_location), journal)
+        with self.assertRaises(FlickrError):
+            writer.call("photos.geo.setLocation", {**PARAMS, "photo_id": "2"})
+        writer.call("photos.geo.setLocation", PARAMS)
+        writer.close()
+
+        set_location = MagicMock()
+        with patch("gpx2exif.flickr_writer.logger.info"):
+            journal = FlickrJournal(self.journal_path, is_resume=True)
+        writer = FlickrWriter(make_flickr(set_location), journal)
+        writer.call("photos.geo.setLocation", PARAMS)
+        writer.call("photos.geo.setLocation", {**PARAMS, "photo_id": "2"})
+        writer.close()
+
+        set_location.assert_called_once_with(**{**PARAMS, "photo_id": "2"})
+        self.assertEqual(writer.stats["api_calls_saved"], 1)
+
+    def test_concurrent_calls(self, _):
+        set_location = MagicMock(
+            side_effect=[FlickrError("502")] + [None] * 20,
+        )
+        writer = FlickrWriter(make_flickr(set_location), max_retries=1, workers=4)
+        on_success = MagicMock()
+
+        with patch("gpx2exif.flickr_writer.logger.warning"):
+            for i in range(20):
+                writer.call(
+                    "photos.geo.setLocation", {**PARAMS, "photo_id": str(i)}, on_success
+                )
+            writer.flush()
+        writer.close()
+
+        self.assertEqual(set_location.call_count, 21)
+        self.assertEqual(on_success.call_count, 20)
+        self.assertEqual(writer.stats["api_calls"], 21)
+        self.assertEqual(writer.stats["api_calls_retried"], 1)
+
+
+class RetryDelayTest(unittest.TestCase):
+    def test_retry_delay_is_bounded(self):
+        for attempt in range(10):
+            delay = retry_delay(attempt, base=1, max_delay=8)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(8, 2**attempt))
+
+
+if __name__ == "__main__":
+    unittest.main()
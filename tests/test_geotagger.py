@@ -0,0 +1,105 @@
+import dataclasses
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import tempfile
+import unittest
+
+import piexif
+
+from gpx2exif import GeotagOptions, Geotagger
+from gpx2exif.common import MATCH_INTERPOLATED, MATCH_OUTSIDE
+
+from .test_metrics import GPX
+from .test_common import make_segment
+from .test_time_extractor import make_jpeg
+
+LATER_GPX = GPX.replace("2025-10-24T08", "2025-10-24T10")
+
+
+class GeotagOptionsTest(unittest.TestCase):
+    def test_options(self):
+        options = GeotagOptions(delta=timedelta(hours=1))
+
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            options.is_clear = True
+        self.assertEqual(options.delta_total, timedelta(hours=1))
+
+        options = dataclasses.replace(options, delta_tz=timedelta(hours=-2))
+        self.assertTrue(options.is_ignore_offset)
+        self.assertEqual(options.delta_total, timedelta(hours=-1))
+
+
+class GeotaggerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_locate(self):
+        geotagger = Geotagger(
+            [make_segment()], GeotagOptions(delta=timedelta(seconds=-60))
+        )
+
+        positions = geotagger.locate(
+            [
+                datetime(2025, 10, 24, 8, 1, 5),
+                datetime(2025, 10, 24, 10, 1, 5, tzinfo=timezone(timedelta(hours=2))),
+                datetime(2025, 10, 24, 8, 0, 55),
+                datetime(2025, 10, 24, 9, 0, 0),
+            ]
+        )
+
+        self.assertEqual(positions[0].quality, MATCH_INTERPOLATED)
+        self.assertAlmostEqual(positions[0].lat, 45.05)
+        self.assertEqual(positions[1], positions[0])
+        self.assertEqual(positions[2].quality, MATCH_OUTSIDE)
+        self.assertIsNone(positions[3])
+
+    def test_tag_many(self):
+        gpx_paths = [self.dir / "later.gpx", self.dir / "track.gpx"]
+        gpx_paths[0].write_text(LATER_GPX, encoding="utf-8")
+        gpx_paths[1].write_text(GPX, encoding="utf-8")
+        paths = [self.dir / name for name in ["a.jpg", "b.jpg", "c.jpg", "d.txt"]]
+        make_jpeg(paths[0], "2025:10:24 08:00:05", "Cam")
+        make_jpeg(paths[1], "2025:10:24 10:00:15", "Cam")
+        make_jpeg(paths[2], "2025:10:24 09:00:00", "Cam")
+        paths[3].write_text("not an image")
+
+        geotagger = Geotagger.from_gpx(*gpx_paths)
+        results = list(geotagger.tag_many(paths, jobs=2))
+
+        self.assertEqual([path for path, _ in results], paths)
+        self.assertAlmostEqual(results[0][1].lat, 45.05)
+        self.assertAlmostEqual(results[1][1].lat, 45.15)
+        self.assertIsNone(results[2][1])
+        self.assertIsNone(results[3][1])
+        exif_data = piexif.load(str(paths[1]))
+        self.assertIn(piexif.GPSIFD.GPSLatitude, exif_data["GPS"])
+        self.assertEqual(piexif.load(str(paths[2]))["GPS"], {})
+
+    def test_tag_many_streams(self):
+        num_read = 0
+
+        def paths():
+            # distinct files, created on demand: the same file would be written
+            # by several threads
+            nonlocal num_read
+            while True:
+                path = self.dir / f"a{num_read}.jpg"
+                make_jpeg(path, "2025:10:24 08:00:05", "Cam")
+                num_read += 1
+                yield path
+
+        geotagger = Geotagger([make_segment()])
+        results = geotagger.tag_many(paths(), jobs=2)
+
+        self.assertAlmostEqual(next(results)[1].lat, 45.05)
+        # bounded by the window of tasks submitted in advance
+        self.assertLessEqual(num_read, 5)
+        results.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
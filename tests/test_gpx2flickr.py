@@ -1,14 +1,23 @@
+from collections import Counter
 from datetime import datetime, timedelta, timezone
+import tempfile
 from types import SimpleNamespace
 import unittest
 from unittest.mock import MagicMock, patch
 
 from click.testing import CliRunner
+import pandas as pd
 
 from gpx2exif.gpx2flickr import (
+    ALBUM_PAGE_SIZE,
+    FlickrAlbum,
+    FlickrTimeRange,
+    compute_search_time_range,
     format_flickr_date_taken,
+    get_images_in_album,
     gpx2flickr,
     process_image,
+    search_images_in_time_range,
 )
 
 
@@ -133,6 +142,64 @@ class FlickrDateTakenTest(unittest.TestCase):
         flickr.photos.setDates.assert_not_called()
         flickr.photos.geo.setLocation.assert_not_called()
 
+    def test_process_image_skips_unchanged_location_and_date(self):
+        flickr = make_flickr()
+        image = make_image()
+        image.latitude = "1.0000001"
+        image.longitude = "2.0"
+        user = SimpleNamespace(id="user-id")
+        stats = Counter()
+
+        with patch("gpx2exif.gpx2flickr.compute_pos", return_value=(1.0, 2.0)):
+            result = process_image(
+                flickr,
+                image,
+                user,
+                [],
+                timedelta(0),
+                timedelta(0),
+                timedelta(seconds=10),
+                is_clear=False,
+                is_update_images=True,
+                is_update_time=True,
+                stats=stats,
+            )
+
+        self.assertEqual(result, (1.0, 2.0))
+        flickr.photos.setDates.assert_not_called()
+        flickr.photos.geo.setLocation.assert_not_called()
+        self.assertEqual(stats["api_calls_saved"], 2)
+        self.assertEqual(stats["api_calls"], 0)
+
+    def test_process_image_updates_changed_location(self):
+        flickr = make_flickr()
+        image = make_image()
+        image.latitude = "1.001"
+        image.longitude = "2.0"
+        user = SimpleNamespace(id="user-id")
+        stats = Counter()
+
+        with patch("gpx2exif.gpx2flickr.compute_pos", return_value=(1.0, 2.0)):
+            process_image(
+                flickr,
+                image,
+                user,
+                [],
+                timedelta(0),
+                timedelta(0),
+                timedelta(seconds=10),
+                is_clear=False,
+                is_update_images=True,
+                is_update_time=False,
+                stats=stats,
+            )
+
+        flickr.photos.geo.setLocation.assert_called_once_with(
+            photo_id="123", lat=1.0, lon=2.0
+        )
+        self.assertEqual((image.latitude, image.longitude), (1.0, 2.0))
+        self.assertEqual(stats["api_calls"], 1)
+
     def test_flickr_help_shows_update_time(self):
         result = CliRunner().invoke(gpx2flickr, ["--help"])
 
@@ -140,5 +207,93 @@ class FlickrDateTakenTest(unittest.TestCase):
         self.assertIn("--update-time", result.output)
 
 
+class FlickrAlbumPagesTest(unittest.TestCase):
+    def make_album_flickr(self, pages):
+        def get_photos(photoset_id, page, per_page, extras):
+            return {
+                "photoset": {
+                    "title": "album",
+                    "total": pages * 2,
+                    "pages": pages,
+                    "photo": [{"id": f"{page}-{i}"} for i in range(2)],
+                }
+            }
+
+        return SimpleNamespace(
+            photosets=SimpleNamespace(getPhotos=MagicMock(side_effect=get_photos))
+        )
+
+    def test_get_images_in_album_yields_all_pages_in_order(self):
+        flickr = self.make_album_flickr(5)
+        album = FlickrAlbum("42", "url")
+
+        ids = [image.id for image in get_images_in_album(flickr, album)]
+
+        self.assertEqual(ids, [f"{page}-{i}" for page in range(1, 6) for i in range(2)])
+        self.assertEqual(flickr.photosets.getPhotos.call_count, 5)
+        for call in flickr.photosets.getPhotos.call_args_list:
+            self.assertEqual(call.kwargs["per_page"], ALBUM_PAGE_SIZE)
+
+    def test_get_images_in_album_single_page(self):
+        flickr = self.make_album_flickr(1)
+        album = FlickrAlbum("42", "url")
+
+        images = list(get_images_in_album(flickr, album, workers=1))
+
+        self.assertEqual(len(images), 2)
+        flickr.photosets.getPhotos.assert_called_once()
+
+
+class FlickrTimeRangeTest(unittest.TestCase):
+    def test_compute_search_time_range(self):
+        index = pd.to_datetime(
+            ["2025-10-24 08:00:00", "2025-10-24 10:00:00"], utc=True
+        ).rename("time")
+        df = pd.DataFrame({"lat": [1.0, 2.0], "lon": [1.0, 2.0]}, index=index)
+
+        time_range = compute_search_time_range(
+            [df], timedelta(hours=-2), timedelta(seconds=10)
+        )
+
+        self.assertEqual(time_range.min_taken, datetime(2025, 10, 24, 9, 59, 49))
+        self.assertEqual(time_range.max_taken, datetime(2025, 10, 24, 12, 0, 11))
+
+    def test_search_images_in_time_range(self):
+        flickr = SimpleNamespace(
+            photos=SimpleNamespace(
+                search=MagicMock(
+                    return_value={
+                        "photos": {"total": 1, "pages": 1, "photo": [{"id": "1"}]}
+                    }
+                )
+            )
+        )
+        time_range = FlickrTimeRange(
+            datetime(2025, 10, 24, 9, 59, 49), datetime(2025, 10, 24, 12, 0, 11)
+        )
+
+        images = list(
+            search_images_in_time_range(flickr, SimpleNamespace(id="u"), time_range)
+        )
+
+        self.assertEqual([image.id for image in images], ["1"])
+        kwargs = flickr.photos.search.call_args.kwargs
+        self.assertEqual(kwargs["user_id"], "u")
+        self.assertEqual(kwargs["min_taken_date"], "2025-10-24 09:59:49")
+        self.assertEqual(kwargs["max_taken_date"], "2025-10-24 12:00:11")
+
+    def test_album_or_user_required(self):
+        with tempfile.NamedTemporaryFile(suffix=".gpx") as gpx_file:
+            result = CliRunner().invoke(
+                gpx2flickr,
+                [gpx_file.name, "--api_key", "k", "--api_secret", "s"],
+                obj={"DEBUG": False},
+            )
+
+        # usage error of click, not an unrecoverable error
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn("Either FLICKR_ALBUM_URL or --user must be set", result.output)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,210 @@
+from io import BytesIO
+from pathlib import Path
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+import zipfile
+
+import numpy as np
+import pandas as pd
+import piexif
+
+from gpx2exif.common import GpsPosition, MATCH_EXACT, write_kml
+from gpx2exif.kml_writer import decimate_track
+from gpx2exif.imaging import PIL_AVAILABLE
+
+if PIL_AVAILABLE:
+    from PIL import Image
+
+NS = {
+    "kml": "http://www.opengis.net/kml/2.2",
+    "gx": "http://www.google.com/kml/ext/2.2",
+}
+
+
+def image_src(x):
+    return f"file://{x}"
+
+
+def image_name(x):
+    return x.rsplit("/", 1)[-1]
+
+
+class KmlWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.kml_path = Path(self.tmp_dir.name) / "photos.kml"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_placemarks_streamed(self):
+        def positions():
+            yield (45.1, 6.2), "/photos/a & b.jpg"
+            # not written yet: the KML is only renamed at the end
+            self.assertFalse(self.kml_path.exists())
+            yield (45.2, 6.3), "/photos/c]]>.jpg"
+
+        write_kml(
+            positions(),
+            self.kml_path,
+            300,
+            image_src,
+            image_name,
+            lambda x: "transform: rotate(90deg);",
+        )
+
+        root = ET.parse(self.kml_path).getroot()
+        styles = root.findall("kml:Document/kml:Style", NS)
+        self.assertEqual(len(styles), 1)
+        placemarks = root.findall("kml:Document/kml:Placemark", NS)
+        self.assertEqual(len(placemarks), 2)
+        self.assertEqual(
+            placemarks[0].find("kml:Point/kml:coordinates", NS).text, "6.2,45.1,0.0"
+        )
+        self.assertEqual(placemarks[0].find("kml:styleUrl", NS).text, "#photo")
+        description = placemarks[0].find("kml:description", NS).text
+        self.assertIn(
+            '<img src="file:///photos/a &amp; b.jpg" width="300"', description
+        )
+        self.assertIn('style="transform: rotate(90deg);"', description)
+        # CDATA end in the name
+        description = placemarks[1].find("kml:description", NS).text
+        self.assertIn("c]]&gt;.jpg<br/>", description)
+
+    def test_no_kml_without_positions(self):
+        with self.assertLogs("gpx2exif", "ERROR"):
+            write_kml([], self.kml_path, 300, image_src, image_name)
+
+        self.assertEqual(list(Path(self.tmp_dir.name).iterdir()), [])
+
+    def test_no_kml_on_error(self):
+        def positions():
+            yield (45.1, 6.2), "/photos/a.jpg"
+            raise RuntimeError("interrupted")
+
+        with self.assertRaises(RuntimeError):
+            write_kml(positions(), self.kml_path, 300, image_src, image_name)
+
+        self.assertEqual(list(Path(self.tmp_dir.name).iterdir()), [])
+
+
+class KmlTrackTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.kml_path = Path(self.tmp_dir.name) / "photos.kml"
+        # L shape: 1000 points east then 1000 points north
+        n = 1000
+        lons = np.concatenate([np.linspace(6, 7, n), np.full(n, 7.0)])
+        lats = np.concatenate([np.full(n, 45.0), np.linspace(45, 46, n)])
+        index = pd.date_range(
+            "2025-10-24 08:00:00", periods=2 * n, freq="1s", tz="utc", name="time"
+        )
+        self.gpx_segments = [pd.DataFrame({"lat": lats, "lon": lons}, index)]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_decimate_track_keeps_shape(self):
+        df = self.gpx_segments[0]
+
+        indices = decimate_track(df["lat"].to_numpy(), df["lon"].to_numpy(), 50)
+
+        self.assertEqual(len(indices), 50)
+        self.assertEqual((indices[0], indices[-1]), (0, len(df) - 1))
+        # corner of the L kept
+        self.assertIn(999, indices)
+
+    def write(self, track_mode):
+        pos = GpsPosition(45.0, 6.5, self.gpx_segments[0].index[500], MATCH_EXACT, 0)
+        write_kml(
+            [(pos, "/photos/a.jpg")],
+            self.kml_path,
+            300,
+            image_src,
+            image_name,
+            gpx_segments=self.gpx_segments,
+            kml_track=track_mode,
+            kml_track_points=100,
+        )
+        return ET.parse(self.kml_path).getroot()
+
+    def test_line_track(self):
+        root = self.write("line")
+
+        track = root.find("kml:Document/kml:Folder/kml:Placemark", NS)
+        coords = track.find("kml:LineString/kml:coordinates", NS).text.split()
+        self.assertEqual(len(coords), 100)
+        self.assertEqual(coords[0], "6.0,45.0,0")
+        self.assertEqual(
+            track.find("kml:TimeSpan/kml:end", NS).text, "2025-10-24T08:33:19Z"
+        )
+        photo = root.find("kml:Document/kml:Placemark", NS)
+        self.assertEqual(
+            photo.find("kml:TimeStamp/kml:when", NS).text, "2025-10-24T08:08:20Z"
+        )
+
+    def test_gx_track(self):
+        root = self.write("gx-track")
+
+        track = root.find("kml:Document/kml:Folder/kml:Placemark/gx:Track", NS)
+        self.assertEqual(len(track.findall("kml:when", NS)), 100)
+        self.assertEqual(len(track.findall("gx:coord", NS)), 100)
+
+
+def make_photo(path, size, orientation=1, thumbnail_size=None):
+    exif_data = {"0th": {piexif.ImageIFD.Orientation: orientation}}
+    if thumbnail_size:
+        thumbnail = BytesIO()
+        Image.new("RGB", thumbnail_size).save(thumbnail, format="JPEG")
+        exif_data["1st"] = {piexif.ImageIFD.JPEGInterchangeFormat: 0}
+        exif_data["thumbnail"] = thumbnail.getvalue()
+    Image.new("RGB", size).save(path, format="JPEG", exif=piexif.dump(exif_data))
+    return str(path)
+
+
+@unittest.skipUnless(PIL_AVAILABLE, "Pillow not installed")
+class KmzWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_thumbnails_embedded(self):
+        # rotated: the EXIF thumbnail is turned upright
+        rotated = make_photo(self.dir / "a.jpg", (800, 600), 6, (160, 120))
+        no_thumbnail = make_photo(self.dir / "b.jpg", (1600, 1200))
+        kmz_path = self.dir / "photos.kmz"
+
+        write_kml(
+            [((45.1, 6.2), rotated), ((45.2, 6.3), no_thumbnail)],
+            kmz_path,
+            400,
+            image_src,
+            image_name,
+            lambda x: "transform: rotate(90deg);",
+            is_kmz=True,
+        )
+
+        with zipfile.ZipFile(kmz_path) as kmz:
+            root = ET.fromstring(kmz.read("doc.kml"))
+            sizes = {}
+            for placemark in root.findall("kml:Document/kml:Placemark", NS):
+                description = placemark.find("kml:description", NS).text
+                # no CSS orientation needed
+                self.assertNotIn("style=", description)
+                name = description.split('src="', 1)[1].split('"', 1)[0]
+                sizes[description.split("<br/>")[0].strip()] = Image.open(
+                    BytesIO(kmz.read(name))
+                ).size
+
+        self.assertEqual(sizes, {"a.jpg": (120, 160), "b.jpg": (400, 300)})
+        self.assertEqual(
+            sorted(p.name for p in self.dir.iterdir()), ["a.jpg", "b.jpg", "photos.kmz"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
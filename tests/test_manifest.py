@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta, timezone
+import json
+from pathlib import Path
+import tempfile
+import unittest
+
+import click
+from click.testing import CliRunner
+
+from gpx2exif.common import parse_shard
+from gpx2exif.exiftool import _exiftool_position
+from gpx2exif.main import main
+from gpx2exif.manifest import check_shards, read_manifest
+from gpx2exif.scanner import ScanOptions, scan_files, shard_of
+
+from .test_metrics import GPX
+from .test_time_extractor import make_jpeg
+
+
+class ShardTest(unittest.TestCase):
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("2/4"), (2, 4))
+        for value in ["0/4", "5/4", "2", "a/b"]:
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_shard(value)
+
+    def test_partition(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            (tmp_dir / "sub").mkdir()
+            for i in range(50):
+                (tmp_dir / f"{i}.jpg").write_bytes(b"")
+                (tmp_dir / "sub" / f"{i}.jpg").write_bytes(b"")
+            all_paths = set(scan_files(tmp_dir, ScanOptions(is_recursive=True)))
+            shards = [
+                set(scan_files(tmp_dir, ScanOptions(is_recursive=True, shard=(i, 3))))
+                for i in range(1, 4)
+            ]
+        self.assertEqual(set.union(*shards), all_paths)
+        self.assertEqual(sum(len(shard) for shard in shards), 100)
+        self.assertTrue(all(shards))
+        # stable across processes and hosts
+        self.assertEqual(shard_of("sub/1.jpg", 3), shard_of("sub/1.jpg", 3))
+        self.assertEqual(shard_of("2026/IMG_0001.JPG", 1000), 110)
+
+    def test_check_shards(self):
+        def headers(*shards):
+            return {f"m{i}": {"shard": shard} for i, shard in enumerate(shards)}
+
+        check_shards(headers([1, 2], [2, 2]))
+        with self.assertLogs("gpx2exif", "WARNING") as logs:
+            check_shards(headers([1, 3], [3, 3]))
+        self.assertIn("2/3", logs.output[0])
+        for shards in [([1, 2], [1, 2]), ([1, 2], [1, 3]), ([1, 2], None)]:
+            with self.subTest(shards=shards), self.assertRaises(click.UsageError):
+                check_shards(headers(*shards))
+
+
+class ShardedRunTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp_dir.name)
+        self.gpx_path = self.dir / "track.gpx"
+        self.gpx_path.write_text(GPX, encoding="utf-8")
+        self.img_dir = self.dir / "photos"
+        self.img_dir.mkdir()
+        for i in range(8):
+            make_jpeg(self.img_dir / f"{i}.jpg", f"2025:10:24 08:00:{i * 2:02d}", "Cam")
+        make_jpeg(self.img_dir / "late.jpg", "2025:10:24 09:00:00", "Cam")
+        (self.img_dir / "notes.txt").write_text("not an image", encoding="utf-8")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def invoke(self, *args):
+        result = CliRunner().invoke(main, [str(arg) for arg in args])
+        self.assertEqual(result.exit_code, 0, result.output)
+
+    def test_shards_and_merge(self):
+        manifests = []
+        for i in [1, 2]:
+            manifest_path = self.dir / f"shard{i}.jsonl"
+            self.invoke(
+                "image", self.gpx_path, self.img_dir, "-y",
+                "--shard", f"{i}/2", "--manifest", manifest_path,
+            )  # fmt: skip
+            manifests.append(manifest_path)
+
+        records = [list(read_manifest(path)) for path in manifests]
+        for i, shard_records in enumerate(records, 1):
+            self.assertEqual(shard_records[0]["type"], "header")
+            self.assertEqual(shard_records[0]["shard"], [i, 2])
+            self.assertEqual(shard_records[-1]["type"], "report")
+        files = [r for rs in records for r in rs if r["type"] == "file"]
+        self.assertEqual(len(files), 10)
+        self.assertEqual(len({r["path"] for r in files}), 10)
+        statuses = {Path(r["path"]).name: r["status"] for r in files}
+        self.assertEqual(statuses["0.jpg"], "located")
+        self.assertEqual(statuses["late.jpg"], "not_located")
+        self.assertEqual(statuses["notes.txt"], "skipped")
+        located = next(r for r in files if Path(r["path"]).name == "5.jpg")
+        self.assertAlmostEqual(located["lat"], 45.1)
+        self.assertGreater(located["seconds"], 0)
+
+        kml_path = self.dir / "all.kml"
+        csv_path = self.dir / "all.csv"
+        report_path = self.dir / "report.json"
+        self.invoke(
+            "merge", *manifests, "--kml", kml_path, "--output", csv_path,
+            "--report", report_path,
+        )  # fmt: skip
+        self.assertEqual(kml_path.read_text(encoding="utf-8").count("<Placemark>"), 8)
+        self.assertEqual(len(csv_path.read_text(encoding="utf-8").splitlines()), 9)
+        with open(report_path, encoding="utf-8") as f:
+            report = json.load(f)
+        self.assertEqual(report["shards"], 2)
+        self.assertEqual(
+            report["statuses"], {"located": 8, "not_located": 1, "skipped": 1}
+        )
+        self.assertEqual(report["counters"]["files_located"], 8)
+        self.assertIn("p95", report["file_latency"])
+
+    def test_shard_requires_folder(self):
+        result = CliRunner().invoke(
+            main,
+            ["image", str(self.gpx_path), str(self.img_dir / "0.jpg"), "-y"]
+            + ["--shard", "1/2"],
+        )
+        self.assertEqual(result.exit_code, 1)
+
+
+class ExiftoolPositionTest(unittest.TestCase):
+    def test_position(self):
+        metadata = {
+            "EXIF:GPSLatitude": 45.1,
+            "Composite:GPSLatitude": 45.1,
+            "EXIF:GPSLongitude": 6.1,
+            "Composite:GPSLongitude": -6.1,
+            "EXIF:DateTimeOriginal": "2025:10:24 08:00:10",
+        }
+        pos = _exiftool_position(metadata, timedelta(seconds=5))
+        self.assertEqual((pos.lat, pos.lon), (45.1, -6.1))
+        self.assertEqual(
+            pos.time, datetime(2025, 10, 24, 8, 0, 15, tzinfo=timezone.utc)
+        )
+        del metadata["EXIF:DateTimeOriginal"]
+        self.assertIsNone(_exiftool_position(metadata, timedelta(0)))
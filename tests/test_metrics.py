@@ -0,0 +1,87 @@
+import json
+from pathlib import Path
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+import piexif
+
+from gpx2exif.main import main
+from gpx2exif.metrics import Metrics
+
+from .test_time_extractor import make_jpeg
+
+GPX = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">
+  <trk><trkseg>
+    <trkpt lat="45.0" lon="6.0"><time>2025-10-24T08:00:00Z</time></trkpt>
+    <trkpt lat="45.1" lon="6.1"><time>2025-10-24T08:00:10Z</time></trkpt>
+    <trkpt lat="45.2" lon="6.2"><time>2025-10-24T08:00:20Z</time></trkpt>
+  </trkseg></trk>
+</gpx>
+"""
+
+
+class MetricsTest(unittest.TestCase):
+    def test_report(self):
+        metrics = Metrics()
+        for seconds in range(1, 101):
+            metrics.add_time("image", seconds / 1000, is_per_file=True)
+        metrics.add_time("gpx_parse", 0.5)
+        metrics.count("files_read", 100)
+
+        report = metrics.report()
+
+        image = report["stages"]["image"]
+        self.assertEqual(image["calls"], 100)
+        self.assertAlmostEqual(image["seconds"], 5.05)
+        self.assertAlmostEqual(image["latency"]["p50"], 0.0505)
+        self.assertAlmostEqual(image["latency"]["p99"], 0.09901)
+        self.assertNotIn("latency", report["stages"]["gpx_parse"])
+        self.assertEqual(report["counters"], {"files_read": 100})
+        self.assertGreater(report["throughput"]["files_per_sec"], 0)
+
+
+class ImageReportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_image_command_report(self):
+        gpx_path = self.dir / "track.gpx"
+        gpx_path.write_text(GPX, encoding="utf-8")
+        img_dir = self.dir / "photos"
+        img_dir.mkdir()
+        make_jpeg(img_dir / "a.jpg", "2025:10:24 08:00:05", "Cam")
+        make_jpeg(img_dir / "b.jpg", "2025:10:24 09:00:00", "Cam")
+        (img_dir / ".hidden").write_bytes(b"")
+        report_path = self.dir / "report.json"
+
+        result = CliRunner().invoke(
+            main,
+            ["image", str(gpx_path), str(img_dir), "-y", "--report", str(report_path)],
+        )
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        with open(report_path, encoding="utf-8") as f:
+            report = json.load(f)
+        counters = report["counters"]
+        self.assertEqual(counters["files_read"], 2)
+        self.assertEqual(counters["files_located"], 1)
+        self.assertEqual(counters["files_outside_gpx"], 1)
+        self.assertEqual(counters["files_skipped"], 1)
+        self.assertEqual(counters["files_written"], 1)
+        self.assertEqual(counters["gpx_points"], 3)
+        self.assertEqual(report["stages"]["image"]["calls"], 2)
+        self.assertIn("p95", report["stages"]["image"]["latency"])
+        self.assertIn("exif_write", report["stages"])
+        # GPS written to the photo
+        exif_data = piexif.load(str(img_dir / "a.jpg"))
+        self.assertIn(piexif.GPSIFD.GPSLatitude, exif_data["GPS"])
+
+
+if __name__ == "__main__":
+    unittest.main()
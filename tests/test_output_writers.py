@@ -0,0 +1,102 @@
+import csv
+from datetime import timedelta
+import json
+from pathlib import Path
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+from gpx2exif.common import (
+    MATCH_EXACT,
+    MATCH_INTERPOLATED,
+    MATCH_OUTSIDE,
+    compute_pos,
+    process_outputs,
+)
+from gpx2exif.output_writers import PositionWriter
+
+from .test_common import START, make_segment
+
+
+class OutputWritersTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def positions(self):
+        gpx_segments = [make_segment()]
+        for i, seconds in enumerate([0, 5, 21]):
+            img_time = START + timedelta(seconds=seconds)
+            pos = compute_pos(img_time, gpx_segments, timedelta(seconds=5))
+            yield pos, f"/photos/IMG_{i}.jpg"
+
+    def test_all_formats(self):
+        paths = [
+            self.dir / name for name in ["a.geojson", "a.ndjson", "a.csv", "a.gpx"]
+        ]
+
+        process_outputs(
+            self.positions(),
+            None,
+            None,
+            None,
+            None,
+            output_paths=[str(p) for p in paths],
+        )
+
+        with open(paths[0], encoding="utf-8") as f:
+            features = json.load(f)["features"]
+        self.assertEqual(len(features), 3)
+        self.assertEqual(features[1]["geometry"]["coordinates"], [6.05, 45.05])
+        self.assertEqual(
+            features[1]["properties"],
+            {
+                "path": "/photos/IMG_1.jpg",
+                "time": "2025-10-24T08:00:05+00:00",
+                "quality": MATCH_INTERPOLATED,
+                "gap": 5.0,
+            },
+        )
+
+        with open(paths[1], encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(lines, features)
+
+        with open(paths[2], encoding="utf-8", newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(
+            [row["quality"] for row in rows],
+            [MATCH_EXACT, MATCH_INTERPOLATED, MATCH_OUTSIDE],
+        )
+        self.assertEqual(rows[2]["lat"], "45.2")
+
+        ns = {"gpx": "http://www.topografix.com/GPX/1/1"}
+        wpts = ET.parse(paths[3]).getroot().findall("gpx:wpt", ns)
+        self.assertEqual([w.find("gpx:name", ns).text for w in wpts][0], "IMG_0.jpg")
+        self.assertEqual(wpts[2].find("gpx:time", ns).text, "2025-10-24T08:00:21Z")
+
+    def test_no_output_on_error(self):
+        def positions():
+            yield from self.positions()
+            raise RuntimeError("interrupted")
+
+        with self.assertRaises(RuntimeError):
+            process_outputs(
+                positions(), None, None, None, None, output_paths=[self.dir / "a.csv"]
+            )
+
+        self.assertEqual(list(self.dir.iterdir()), [])
+
+    def test_write_position_required(self):
+        class NoPositionWriter(PositionWriter):
+            format_name = "none"
+
+        with self.assertRaises(TypeError):
+            NoPositionWriter(self.dir / "a.txt")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+from pathlib import Path
+import pstats
+import tempfile
+import tracemalloc
+import unittest
+
+from click.testing import CliRunner
+
+from gpx2exif.main import main
+from gpx2exif.metrics import metrics
+from gpx2exif.profiling import Profiler
+
+from .test_metrics import GPX
+from .test_time_extractor import make_jpeg
+
+
+class ProfileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp_dir.name)
+        self.gpx_path = self.dir / "track.gpx"
+        self.gpx_path.write_text(GPX, encoding="utf-8")
+        self.img_dir = self.dir / "photos"
+        self.img_dir.mkdir()
+        make_jpeg(self.img_dir / "a.jpg", "2025:10:24 08:00:05", "Cam")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def run_profile(self, mode, profile_path):
+        return CliRunner().invoke(
+            main,
+            [
+                "--profile",
+                mode,
+                "--profile-output",
+                str(profile_path),
+                "--profile-top",
+                "5",
+                "image",
+                str(self.gpx_path),
+                str(self.img_dir),
+                "-n",
+            ],
+        )
+
+    def test_cpu(self):
+        profile_path = self.dir / "run.pstats"
+
+        result = self.run_profile("cpu", profile_path)
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Top 5 functions", result.stderr)
+        self.assertIn("gpx_parse", result.stderr)
+        stats = pstats.Stats(str(profile_path))
+        self.assertTrue(any(func[2] == "read_gpx" for func in stats.stats))
+
+    def test_mem(self):
+        profile_path = self.dir / "run.snapshot"
+
+        result = self.run_profile("mem", profile_path)
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Top 5 allocation sites", result.stderr)
+        self.assertIn("MB retained", result.stderr)
+        self.assertTrue(tracemalloc.Snapshot.load(str(profile_path)).traces)
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertIsNone(metrics.stage_listener)
+
+    def test_methods_required(self):
+        class StartOnlyProfiler(Profiler):
+            def start(self):
+                pass
+
+        with self.assertRaises(TypeError):
+            StartOnlyProfiler()
+
+
+if __name__ == "__main__":
+    unittest.main()
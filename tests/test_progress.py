@@ -0,0 +1,56 @@
+from collections import Counter
+import io
+import unittest
+from unittest.mock import patch
+
+from gpx2exif.metrics import metrics
+from gpx2exif.progress import Progress, logger
+
+
+class TtyStream(io.StringIO):
+    def isatty(self):
+        return True
+
+
+class ProgressTest(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    def test_status(self):
+        with patch("gpx2exif.progress.time.monotonic", return_value=0):
+            progress = Progress(100, stats=Counter(api_calls=20), is_enabled=False)
+        progress.update(25)
+        metrics.count("bytes_written", 50_000_000)
+        metrics.count("api_calls_list", 5)
+
+        self.assertEqual(
+            progress.status(10),
+            "25/100 files | 2.5 files/s | 5.0 MB/s written | 2.5 API calls/s "
+            "| ETA 0:00:30",
+        )
+
+    def test_tty_throttled(self):
+        stream = TtyStream()
+        times = iter([0, 0.1, 0.2, 0.3, 0.4])
+        with patch("gpx2exif.progress.time.monotonic", side_effect=lambda: next(times)):
+            with Progress(4, stream=stream) as progress:
+                for _ in range(3):
+                    progress.update()
+                # erased before a log message (redrawn at the next update)
+                logger.warning("message")
+
+        # 1 refresh (at 0.3s) + the final one
+        self.assertEqual(stream.getvalue().count("[#"), 2)
+        self.assertIn("\r\x1b[K", stream.getvalue())
+        self.assertIn("3/4 files", stream.getvalue())
+        self.assertNotIn(progress, logger.filters)
+
+    def test_disabled(self):
+        stream = TtyStream()
+        with Progress(2, stream=stream, is_enabled=False) as progress:
+            progress.update(2)
+        self.assertEqual(stream.getvalue(), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
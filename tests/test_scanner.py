@@ -0,0 +1,147 @@
+import io
+from pathlib import Path
+import tempfile
+import threading
+import time
+import unittest
+
+from click.testing import CliRunner
+import piexif
+
+from gpx2exif.common import GeotagOptions, read_gpx
+from gpx2exif.gpx2exif import synch_gps_exif
+from gpx2exif.main import main
+from gpx2exif.progress import Progress
+from gpx2exif.scanner import (
+    ScanOptions,
+    count_files_in_background,
+    is_image_file,
+    scan_files,
+)
+
+from .test_metrics import GPX
+from .test_time_extractor import make_jpeg
+
+
+class ScannerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp_dir.name)
+        for rel_path in [
+            "b.jpg",
+            "a.JPG",
+            "notes.txt",
+            ".DS_Store",
+            "day2/c.jpg",
+            "day2/raw/c.cr2",
+            "day2/.thumbs/t.jpg",
+            "trash/d.jpg",
+        ]:
+            path = self.dir / rel_path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b"")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def scan(self, **kwargs):
+        skipped = []
+        paths = scan_files(self.dir, ScanOptions(**kwargs), skipped.append)
+        rel_paths = [Path(path).relative_to(self.dir).as_posix() for path in paths]
+        return rel_paths, sorted(Path(path).name for path in skipped)
+
+    def test_flat(self):
+        rel_paths, skipped = self.scan(is_sorted=True)
+        self.assertEqual(rel_paths, ["a.JPG", "b.jpg", "notes.txt"])
+        self.assertEqual(skipped, [".DS_Store"])
+
+    def test_recursive_filters(self):
+        rel_paths, _ = self.scan(is_recursive=True, is_sorted=True)
+        self.assertEqual(
+            rel_paths,
+            [
+                "a.JPG",
+                "b.jpg",
+                "notes.txt",
+                "day2/c.jpg",
+                "day2/raw/c.cr2",
+                "trash/d.jpg",
+            ],
+        )
+
+        rel_paths, skipped = self.scan(
+            is_recursive=True, extensions=(".jpg",), excludes=("trash",)
+        )
+        self.assertEqual(sorted(rel_paths), ["a.JPG", "b.jpg", "day2/c.jpg"])
+        self.assertEqual(skipped, [".DS_Store", "c.cr2", "notes.txt"])
+
+        rel_paths, _ = self.scan(is_recursive=True, includes=("day2/*",))
+        self.assertEqual(sorted(rel_paths), ["day2/c.jpg", "day2/raw/c.cr2"])
+
+    def test_count_in_background(self):
+        counts = []
+        done = threading.Event()
+
+        def on_count(num_files):
+            counts.append(num_files)
+            done.set()
+
+        count_files_in_background(self.dir, ScanOptions(is_recursive=True), on_count)
+        self.assertTrue(done.wait(5))
+        self.assertEqual(counts, [6])
+
+    def test_is_image_file(self):
+        jpeg_path = self.dir / "photo.dat"
+        make_jpeg(jpeg_path, "2025:10:24 08:00:05", "Cam")
+        self.assertTrue(is_image_file(jpeg_path))
+        (self.dir / "t.tif").write_bytes(b"II*\x00" + b"\x00" * 8)
+        self.assertTrue(is_image_file(self.dir / "t.tif"))
+        self.assertFalse(is_image_file(self.dir / "notes.txt"))
+        self.assertFalse(is_image_file(self.dir / "missing.jpg"))
+
+
+class ImageRecursiveTest(unittest.TestCase):
+    def test_image_command_recursive(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            gpx_path = tmp_dir / "track.gpx"
+            gpx_path.write_text(GPX, encoding="utf-8")
+            img_dir = tmp_dir / "photos"
+            (img_dir / "day1").mkdir(parents=True)
+            make_jpeg(img_dir / "day1" / "a.jpg", "2025:10:24 08:00:05", "Cam")
+            make_jpeg(img_dir / "day1" / "b.jpeg", "2025:10:24 08:00:15", "Cam")
+            (img_dir / "day1" / "video.mp4").write_bytes(b"\x00" * 1000)
+
+            result = CliRunner().invoke(
+                main,
+                ["image", str(gpx_path), str(img_dir), "-y", "-r", "--ext", "jpg"],
+            )
+
+            self.assertEqual(result.exit_code, 0, result.output)
+            for name, is_tagged in [("a.jpg", True), ("b.jpeg", False)]:
+                exif_data = piexif.load(str(img_dir / "day1" / name))
+                self.assertEqual(
+                    piexif.GPSIFD.GPSLatitude in exif_data["GPS"], is_tagged
+                )
+
+    def test_progress_total(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            gpx_path = tmp_dir / "track.gpx"
+            gpx_path.write_text(GPX, encoding="utf-8")
+            img_dir = tmp_dir / "photos"
+            img_dir.mkdir()
+            for i in range(3):
+                make_jpeg(img_dir / f"{i}.jpg", "2025:10:24 08:00:05", "Cam")
+            progress = Progress(is_enabled=True, stream=io.StringIO())
+
+            positions = synch_gps_exif(
+                img_dir, read_gpx(gpx_path), GeotagOptions(), progress
+            )
+            next(positions)
+            for _ in range(500):
+                if progress.total is not None:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(progress.total, 3)
+            self.assertEqual(len(list(positions)), 2)
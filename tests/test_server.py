@@ -0,0 +1,129 @@
+import http.client
+import json
+import os
+from pathlib import Path
+import socket
+import tempfile
+import unittest
+
+import piexif
+
+from benchmarks.bench_serve import UnixHTTPConnection
+from gpx2exif.common import GeotagOptions
+from gpx2exif.server import GeotagServer
+from gpx2exif.track_index import TrackIndex
+
+from .test_metrics import GPX
+from .test_time_extractor import MINIMAL_JPEG, make_jpeg
+
+
+def request(connection, method, path, body=None):
+    data = json.dumps(body) if body is not None else None
+    connection.request(method, path, data, {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+class GeotagServerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp_dir.name)
+        self.gpx_path = self.dir / "track.gpx"
+        self.gpx_path.write_text(GPX, encoding="utf-8")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def start(self, index=None, **kwargs):
+        index = index or TrackIndex([self.gpx_path])
+        server = GeotagServer(index, port=0, **kwargs).start()
+        self.addCleanup(server.stop)
+        if server.socket_path:
+            connection = UnixHTTPConnection(server.socket_path)
+        else:
+            connection = http.client.HTTPConnection(*server.httpd.server_address[:2])
+        self.addCleanup(connection.close)
+        return connection
+
+    def test_locate(self):
+        connection = self.start()
+        times = ["2025-10-24T08:00:10Z", "2025-10-24T10:00:05+02:00", "2025-10-25"]
+        status, body = request(connection, "POST", "/locate", {"times": times})
+        self.assertEqual(status, 200)
+        positions = body["positions"]
+        self.assertEqual(positions[0]["lat"], 45.1)
+        self.assertEqual(positions[0]["quality"], "exact")
+        self.assertAlmostEqual(positions[1]["lat"], 45.05)
+        self.assertIsNone(positions[2])
+
+        # Unix times, same connection (keep-alive)
+        status, body = request(
+            connection, "POST", "/locate", {"times": [1761292810, 1761292815.0]}
+        )
+        self.assertEqual(status, 200)
+        exact, interpolated = body["positions"]
+        self.assertEqual(exact["lat"], 45.1)
+        self.assertAlmostEqual(interpolated["lat"], 45.15)
+
+    def test_bad_requests(self):
+        connection = self.start()
+        status, body = request(connection, "POST", "/locate", {"times": "now"})
+        self.assertEqual(status, 400)
+        status, body = request(connection, "POST", "/locate", {"times": ["never"]})
+        self.assertEqual(status, 400)
+        self.assertIn("Invalid times", body["error"])
+        status, body = request(connection, "POST", "/tag", {"paths": [1]})
+        self.assertEqual(status, 400)
+        status, body = request(connection, "POST", "/other", {})
+        self.assertEqual(status, 404)
+
+    def test_tag(self):
+        connection = self.start(TrackIndex([self.gpx_path], GeotagOptions()))
+        img_path = self.dir / "a.jpg"
+        make_jpeg(img_path, "2025:10:24 08:00:15", "Cam")
+        # EXIF header in big-endian but truncated (struct.error)
+        corrupt_path = self.dir / "corrupt.jpg"
+        corrupt_path.write_bytes(
+            MINIMAL_JPEG[:2] + b"\xff\xe1\x00\x10Exif\x00\x00MM\x00*"
+        )
+        paths = [str(img_path), str(self.dir / "missing.jpg"), str(corrupt_path)]
+        status, body = request(connection, "POST", "/tag", {"paths": paths})
+        self.assertEqual(status, 200)
+        tagged, missing, corrupt = body["results"]
+        self.assertAlmostEqual(tagged["position"]["lat"], 45.15)
+        self.assertIn(piexif.GPSIFD.GPSLatitude, piexif.load(str(img_path))["GPS"])
+        for result in [missing, corrupt]:
+            self.assertIsNone(result["position"])
+            self.assertIn("error", result)
+
+    def test_hot_reload(self):
+        index = TrackIndex([self.gpx_path], check_interval=0)
+        connection = self.start(index)
+        status, body = request(connection, "GET", "/health")
+        self.assertEqual(status, 200)
+        self.assertEqual(body["points"], 3)
+        self.assertEqual(body["end"], "2025-10-24T08:00:20+00:00")
+
+        self.gpx_path.write_text(GPX.replace("2025-10-24", "2025-10-25"), "utf-8")
+        # the mtime may not have changed: the size is the same
+        stat = self.gpx_path.stat()
+        os.utime(self.gpx_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        status, body = request(
+            connection, "POST", "/locate", {"times": ["2025-10-25T08:00:10Z"]}
+        )
+        self.assertEqual(body["positions"][0]["lat"], 45.1)
+
+        # invalid new version: the previous one is kept
+        self.gpx_path.write_text("<gpx", encoding="utf-8")
+        with self.assertLogs("gpx2exif", "ERROR"):
+            status, body = request(connection, "GET", "/health")
+        self.assertEqual(body["end"], "2025-10-25T08:00:20+00:00")
+
+    @unittest.skipUnless(hasattr(socket, "AF_UNIX"), "Unix sockets")
+    def test_unix_socket(self):
+        connection = self.start(socket_path=str(self.dir / "serve.sock"))
+        status, body = request(
+            connection, "POST", "/locate", {"times": ["2025-10-24T08:00:00Z"]}
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(body["positions"][0]["lat"], 45.0)
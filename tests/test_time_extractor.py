@@ -0,0 +1,297 @@
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from pathlib import Path
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import click
+import piexif
+
+from gpx2exif.imaging import PIL_AVAILABLE
+from gpx2exif.time_extractor import (
+    ClockPhoto,
+    OcrCache,
+    OcrOptions,
+    StubOcrBackend,
+    VisionOcrBackend,
+    compute_camera_deltas,
+    compute_consensus_delta,
+    compute_delta,
+    extract_clock_with_vision_api,
+    find_clock_time,
+    read_clock_photo,
+    read_clock_photos,
+)
+
+if PIL_AVAILABLE:
+    from PIL import Image
+
+# smallest JPEG structure accepted by piexif
+MINIMAL_JPEG = (
+    b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+    b"\xff\xda\x00\x02\x00\xff\xd9"
+)
+
+
+def make_jpeg(path, dt_original, model):
+    with open(path, "wb") as f:
+        f.write(MINIMAL_JPEG)
+    exif_data = {
+        "0th": {piexif.ImageIFD.Model: model.encode("ascii")},
+        "Exif": {piexif.ExifIFD.DateTimeOriginal: dt_original.encode("ascii")},
+    }
+    piexif.insert(piexif.dump(exif_data), str(path))
+    return str(path)
+
+
+def make_large_jpeg(path, size, thumbnail=None):
+    image = Image.new("RGB", size, (200, 200, 200))
+    exif_data = {
+        "Exif": {piexif.ExifIFD.DateTimeOriginal: b"2025:10:24 08:00:00"},
+    }
+    if thumbnail:
+        exif_data["1st"] = {piexif.ImageIFD.JPEGInterchangeFormat: 0}
+        exif_data["thumbnail"] = thumbnail
+    image.save(path, format="JPEG", exif=piexif.dump(exif_data))
+    return str(path)
+
+
+def image_size(content):
+    return Image.open(BytesIO(content)).size
+
+
+ORIGINAL = OcrOptions("original", None, None)
+
+
+class TimeExtractorTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_find_clock_time(self):
+        self.assertEqual(find_clock_time(["Sat 24", "7:12:23", "8:00:00"]), "7:12:23")
+        with self.assertRaises(click.ClickException):
+            find_clock_time(["7:12"])
+
+    def test_ocr_cache_skips_api(self):
+        photo_path = make_jpeg(self.dir / "a.jpg", "2025:10:24 08:00:00", "Cam")
+        ocr_cache = OcrCache(self.dir / "cache")
+        client = MagicMock()
+
+        with patch(
+            "gpx2exif.time_extractor.detect_texts_with_vision_api",
+            return_value=["8:01:00"],
+        ) as detect:
+            first = extract_clock_with_vision_api(
+                photo_path, client, ocr_cache, ORIGINAL
+            )
+            second = extract_clock_with_vision_api(
+                photo_path, client, ocr_cache, ORIGINAL
+            )
+
+        self.assertEqual(first, "8:01:00")
+        self.assertEqual(second, "8:01:00")
+        detect.assert_called_once()
+
+    def test_read_clock_photos_one_delta_per_camera(self):
+        photo_paths = [
+            make_jpeg(self.dir / "a.jpg", "2025:10:24 08:00:00", "CamA"),
+            make_jpeg(self.dir / "b.jpg", "2025:10:24 09:00:00", "CamA"),
+            make_jpeg(self.dir / "c.jpg", "2025:10:24 08:00:00", "CamB"),
+        ]
+        texts = {
+            # read from the content: distinct since EXIF differs
+            "a.jpg": ["8:01:00"],
+            "b.jpg": ["9:01:10"],
+            "c.jpg": ["7:59:30"],
+        }
+
+        def recognize(content):
+            for name, path in zip(texts, photo_paths, strict=True):
+                with open(path, "rb") as f:
+                    if f.read() == content:
+                        return texts[name]
+            raise AssertionError("unknown content")
+
+        with self.assertLogs("gpx2exif.time_extractor"):
+            clock_photos = read_clock_photos(
+                photo_paths, StubOcrBackend(recognize), None, ORIGINAL, jobs=2
+            )
+
+        self.assertEqual([c.model for c in clock_photos], ["CamA", "CamA", "CamB"])
+        deltas = compute_camera_deltas(clock_photos)
+        self.assertEqual(deltas["CamA"].delta, timedelta(minutes=1, seconds=5))
+        self.assertEqual(deltas["CamB"].delta, timedelta(seconds=-30))
+
+    def test_read_clock_photos_api_error(self):
+        photo_paths = [
+            make_jpeg(self.dir / "a.jpg", "2025:10:24 08:00:00", "Cam"),
+            make_jpeg(self.dir / "b.jpg", "2025:10:24 09:00:00", "Cam"),
+        ]
+        with open(photo_paths[1], "rb") as f:
+            failing = f.read()
+
+        def recognize(content):
+            if content == failing:
+                raise ConnectionError("quota exceeded")
+            return ["8:01:00"]
+
+        with self.assertLogs("gpx2exif.time_extractor", "ERROR") as logs:
+            clock_photos = read_clock_photos(
+                photo_paths, StubOcrBackend(recognize), None, ORIGINAL, jobs=2
+            )
+
+        self.assertEqual([c.path for c in clock_photos], photo_paths[:1])
+        self.assertIn("b.jpg: quota exceeded", logs.output[0])
+
+    def test_vision_client_not_needed_if_cached(self):
+        photo_path = make_jpeg(self.dir / "a.jpg", "2025:10:24 08:00:00", "Cam")
+        ocr_cache = OcrCache(self.dir / "cache")
+
+        with (
+            patch("gpx2exif.time_extractor.vision", create=True) as vision,
+            patch(
+                "gpx2exif.time_extractor.detect_texts_with_vision_api",
+                return_value=["8:01:00"],
+            ),
+        ):
+            read_clock_photo(photo_path, VisionOcrBackend(), ocr_cache, ORIGINAL)
+            vision.ImageAnnotatorClient.assert_called_once()
+
+            clock_photos = read_clock_photos(
+                [photo_path], VisionOcrBackend(), ocr_cache, ORIGINAL
+            )
+            self.assertEqual(clock_photos[0].time_str_clock, "8:01:00")
+            vision.ImageAnnotatorClient.assert_called_once()
+
+
+def make_clock_photo(name, time_exif, time_clock):
+    dt_exif = datetime.combine(
+        datetime(2025, 10, 24).date(),
+        datetime.strptime(time_exif, "%H:%M:%S").time(),
+        tzinfo=timezone.utc,
+    )
+    return ClockPhoto(name, "Cam", dt_exif, time_clock)
+
+
+class ConsensusDeltaTest(unittest.TestCase):
+    def test_misread_clock_rejected(self):
+        clock_photos = [
+            make_clock_photo("a.jpg", "08:00:00", "8:01:00"),
+            make_clock_photo("b.jpg", "09:00:00", "9:01:02"),
+            make_clock_photo("c.jpg", "10:00:00", "10:01:01"),
+            make_clock_photo("d.jpg", "11:00:00", "11:01:01"),
+            # 0 read as 4
+            make_clock_photo("e.jpg", "12:00:00", "12:41:01"),
+        ]
+
+        consensus = compute_consensus_delta(clock_photos)
+
+        self.assertEqual(consensus.delta, timedelta(minutes=1, seconds=1))
+        self.assertEqual(consensus.num_photos, 4)
+        self.assertEqual([c.path for c, _ in consensus.outliers], ["e.jpg"])
+        self.assertEqual(consensus.min_delta, timedelta(minutes=1))
+        self.assertEqual(consensus.max_delta, timedelta(minutes=1, seconds=2))
+
+    def test_am_pm_alternative(self):
+        # delta close to 6h: the most likely delta of each photo alone flips
+        clock_photos = [
+            make_clock_photo("a.jpg", "08:00:00", "1:59:55"),
+            make_clock_photo("b.jpg", "09:00:00", "3:00:05"),
+            make_clock_photo("c.jpg", "10:00:00", "3:59:58"),
+        ]
+
+        consensus = compute_consensus_delta(clock_photos)
+
+        self.assertEqual(consensus.outliers, [])
+        # -6h or +6h are the same modulo 12h: the photos must agree on one
+        self.assertIn(
+            consensus.delta,
+            [-timedelta(hours=6, seconds=2), timedelta(hours=5, seconds=3598)],
+        )
+        self.assertEqual(
+            consensus.max_delta - consensus.min_delta, timedelta(seconds=10)
+        )
+
+    def test_one_photo_same_as_single_delta(self):
+        clock_photo = make_clock_photo("a.jpg", "23:50:00", "0:05:00")
+
+        consensus = compute_consensus_delta([clock_photo])
+
+        self.assertEqual(consensus.delta, compute_delta(clock_photo))
+        self.assertEqual(consensus.spread, timedelta(0))
+
+
+@unittest.skipUnless(PIL_AVAILABLE, "Pillow not installed")
+class OcrPreprocessTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp_dir.name)
+        self.backend = StubOcrBackend(self.recognize)
+        self.sent = []
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def recognize(self, content):
+        self.sent.append(content)
+        return ["8:01:00"]
+
+    def test_reduced_image_sent(self):
+        photo_path = make_large_jpeg(self.dir / "a.jpg", (4000, 3000))
+
+        clock_photo = read_clock_photo(
+            photo_path, self.backend, None, OcrOptions("reduced", 800, None)
+        )
+
+        self.assertEqual(clock_photo.time_str_clock, "8:01:00")
+        self.assertEqual(image_size(self.sent[0]), (800, 600))
+        self.assertLess(self.backend.bytes_sent, Path(photo_path).stat().st_size)
+
+    def test_cropped_image_sent(self):
+        photo_path = make_large_jpeg(self.dir / "a.jpg", (4000, 3000))
+
+        read_clock_photo(
+            photo_path,
+            self.backend,
+            None,
+            OcrOptions("reduced", 800, (0.25, 0.0, 0.75, 0.5)),
+        )
+
+        # the region (2000x1500) is reduced to fit the max size
+        self.assertEqual(image_size(self.sent[0]), (800, 600))
+
+    def test_exif_thumbnail_sent(self):
+        output = BytesIO()
+        Image.new("RGB", (160, 120)).save(output, format="JPEG")
+        thumbnail = output.getvalue()
+        photo_path = make_large_jpeg(self.dir / "a.jpg", (1600, 1200), thumbnail)
+
+        read_clock_photo(
+            photo_path, self.backend, None, OcrOptions("thumbnail", 800, None)
+        )
+
+        # piexif strips the JFIF segment of the thumbnail: compare the size
+        self.assertEqual(image_size(self.sent[0]), (160, 120))
+
+    def test_cache_depends_on_options(self):
+        photo_path = make_large_jpeg(self.dir / "a.jpg", (1600, 1200))
+        ocr_cache = OcrCache(self.dir / "cache")
+
+        for max_size in (800, 800, 400):
+            read_clock_photo(
+                photo_path,
+                self.backend,
+                ocr_cache,
+                OcrOptions("reduced", max_size, None),
+            )
+
+        self.assertEqual(self.backend.calls, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+from datetime import datetime
+import os
+from pathlib import Path
+import tempfile
+import unittest
+
+import piexif
+
+from gpx2exif.common import GeotagOptions, read_gpx
+from gpx2exif.gpx2exif import process_image
+from gpx2exif.time_sources import time_from_filename
+
+from .test_metrics import GPX
+from .test_time_extractor import MINIMAL_JPEG
+
+
+class TimeFromFilenameTest(unittest.TestCase):
+    def test_patterns(self):
+        expected = datetime(2025, 10, 24, 8, 0, 5)
+        for name in [
+            "IMG_20251024_080005.jpg",
+            "VID_20251024_080005.mp4",
+            "Screenshot_20251024-080005.png",
+            "DJI_20251024080005_0001_D.JPG",
+            "2025-10-24 08.00.05.jpg",
+            "trip_2025-10-24_08-00-05_1.jpeg",
+        ]:
+            with self.subTest(name=name):
+                self.assertEqual(time_from_filename(name), expected)
+        self.assertEqual(
+            time_from_filename("PXL_20251024_080005123.jpg"),
+            datetime(2025, 10, 24, 8, 0, 5, 123000),
+        )
+
+    def test_no_time(self):
+        for name in ["IMG_0001.JPG", "DSC_20251399_080005.jpg", "1234567890123.jpg"]:
+            with self.subTest(name=name):
+                self.assertIsNone(time_from_filename(name))
+
+
+class TimeSourceChainTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp_dir.name)
+        gpx_path = self.dir / "track.gpx"
+        gpx_path.write_text(GPX, encoding="utf-8")
+        self.gpx_segments = read_gpx(gpx_path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def make_jpeg_without_time(self, name):
+        path = self.dir / name
+        path.write_bytes(MINIMAL_JPEG)
+        return path
+
+    def test_fallback_to_filename(self):
+        path = self.make_jpeg_without_time("IMG_20251024_080010.jpg")
+        self.assertIsNone(process_image(path, self.gpx_segments, GeotagOptions()))
+
+        options = GeotagOptions(time_sources=("exif", "filename"))
+        pos = process_image(path, self.gpx_segments, options)
+        self.assertEqual(pos.lat, 45.1)
+        self.assertIn(piexif.GPSIFD.GPSLatitude, piexif.load(str(path))["GPS"])
+
+    def test_filename_without_reading(self):
+        # not an image: would fail if read
+        path = self.dir / "PXL_20251024_080010000.jpg"
+        path.write_bytes(b"not read")
+        options = GeotagOptions(time_sources=("filename",), is_update_images=False)
+        self.assertEqual(process_image(path, self.gpx_segments, options).lat, 45.1)
+
+        options = GeotagOptions(time_sources=("filename",))
+        with self.assertRaises(piexif.InvalidImageDataError):
+            process_image(path, self.gpx_segments, options)
+
+    def test_mtime(self):
+        path = self.make_jpeg_without_time("photo.jpg")
+        # local time of the computer
+        mtime = datetime(2025, 10, 24, 8, 0, 20).timestamp()
+        os.utime(path, (mtime, mtime))
+        options = GeotagOptions(time_sources=("exif", "filename", "mtime"))
+        self.assertEqual(process_image(path, self.gpx_segments, options).lat, 45.2)
+
+    def test_invalid_sources(self):
+        with self.assertRaises(ValueError):
+            GeotagOptions(time_sources=())
+        with self.assertRaises(ValueError):
+            GeotagOptions(time_sources=("gps",))
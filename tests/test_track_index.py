@@ -0,0 +1,136 @@
+from datetime import timedelta
+import os
+from pathlib import Path
+import tempfile
+import unittest
+
+import numpy as np
+
+from benchmarks.corpus import DEFAULT_START_TIME, write_gpx
+from gpx2exif.common import read_gpx
+from gpx2exif.track_index import IncrementalGpxReader, TrackIndex
+
+HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">\n'
+    "<trk>\n<trkseg>\n"
+)
+CLOSING = "</trkseg>\n</trk>\n</gpx>\n"
+
+
+def trkpt(seconds, lat=45.0):
+    time = DEFAULT_START_TIME + timedelta(seconds=seconds)
+    return (
+        f'<trkpt lat="{lat}" lon="6.0"><ele>1000</ele>'
+        f"<time>{time:%Y-%m-%dT%H:%M:%SZ}</time></trkpt>\n"
+    )
+
+
+class IncrementalGpxReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name) / "track.gpx"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, content, mode="w"):
+        with open(self.path, mode, encoding="utf-8") as f:
+            f.write(content)
+
+    def rewrite_closing(self, content):
+        """Like a logger: the closing tags are overwritten by the new points"""
+        with open(self.path, "r+b") as f:
+            f.seek(-len(CLOSING), os.SEEK_END)
+            f.write(content.encode("utf-8"))
+            f.truncate()
+
+    def test_same_as_read_gpx(self):
+        write_gpx(self.path, 500, num_segments=3)
+        reader = IncrementalGpxReader(self.path)
+        self.assertEqual(reader.update(), 500)
+        expected = read_gpx(self.path)
+        self.assertEqual(len(reader.segments), len(expected))
+        for df, expected_df in zip(reader.segments, expected, strict=True):
+            self.assertTrue((df.index == expected_df.index).all())
+            np.testing.assert_array_equal(df["lat"], expected_df["lat"])
+            np.testing.assert_array_equal(df["lon"], expected_df["lon"])
+        # no change
+        self.assertEqual(reader.update(), 0)
+
+    def test_growing_file(self):
+        self.write(HEADER + trkpt(0) + trkpt(10) + CLOSING)
+        reader = IncrementalGpxReader(self.path)
+        self.assertEqual(reader.update(), 2)
+        first = reader.segments[0]
+        offset = reader.offset
+
+        # trackpoint still being written: for the next update
+        self.rewrite_closing(trkpt(20) + trkpt(30)[:30])
+        self.assertEqual(reader.update(), 1)
+        self.write(trkpt(30)[30:] + "</trkseg>\n<trkseg>\n" + trkpt(50), "a")
+        self.assertEqual(reader.update(), 2)
+        self.write(trkpt(60, lat=46.0) + CLOSING, "a")
+        self.assertEqual(reader.update(), 1)
+
+        self.assertGreater(reader.offset, offset)
+        self.assertEqual([len(df) for df in reader.segments], [4, 2])
+        self.assertEqual(reader.segments[1]["lat"].iloc[-1], 46.0)
+        self.assertEqual(
+            reader.segments[0].index[-1], DEFAULT_START_TIME + timedelta(seconds=30)
+        )
+        # the DataFrames returned before are not changed
+        self.assertEqual(len(first), 2)
+
+    def test_replaced_file(self):
+        self.write(HEADER + trkpt(0) + trkpt(10) + trkpt(20) + CLOSING)
+        reader = IncrementalGpxReader(self.path)
+        reader.update()
+        # shorter
+        self.write(HEADER + trkpt(100) + CLOSING)
+        with self.assertLogs("gpx2exif", "INFO"):
+            self.assertEqual(reader.update(), 1)
+        # same size but different points
+        self.write(HEADER + trkpt(200) + CLOSING)
+        self.assertEqual(reader.update(), 1)
+        self.assertEqual([len(df) for df in reader.segments], [1])
+        self.assertEqual(
+            reader.segments[0].index[0], DEFAULT_START_TIME + timedelta(seconds=200)
+        )
+
+
+class TrackIndexTest(unittest.TestCase):
+    def test_new_points(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "track.gpx"
+            path.write_text(HEADER + trkpt(0) + trkpt(10) + CLOSING, "utf-8")
+            index = TrackIndex([path], check_interval=0)
+            time = DEFAULT_START_TIME + timedelta(minutes=10)
+            self.assertEqual(index.get().locate([time]), [None])
+
+            # the logger writes the file again with the new point
+            path.write_text(
+                HEADER + trkpt(0) + trkpt(10) + trkpt(600, lat=46.0) + CLOSING,
+                "utf-8",
+            )
+            (pos,) = index.get().locate([time])
+            self.assertEqual(pos.lat, 46.0)
+            self.assertEqual(index.info()["points"], 3)
+
+    def test_no_point_yet(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "track.gpx"
+            # just created by the logger
+            path.write_text(HEADER, "utf-8")
+            index = TrackIndex([path], check_interval=0)
+            time = DEFAULT_START_TIME + timedelta(seconds=5)
+            self.assertEqual(index.get().locate([time]), [None])
+            info = index.info()
+            self.assertEqual(info["points"], 0)
+            self.assertIsNone(info["start"])
+            self.assertIsNone(info["end"])
+
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(trkpt(0) + trkpt(10))
+            (pos,) = index.get().locate([time])
+            self.assertEqual(pos.lat, 45.0)
@@ -0,0 +1,115 @@
+from pathlib import Path
+import tempfile
+import unittest
+
+import piexif
+
+from gpx2exif import Geotagger
+from gpx2exif.common import read_gpx
+from gpx2exif.track_index import TrackIndex
+from gpx2exif.watch import FolderWatcher
+
+from .test_metrics import GPX
+from .test_time_extractor import MINIMAL_JPEG, make_jpeg
+
+
+class FolderWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp_dir.name)
+        gpx_path = self.dir / "track.gpx"
+        gpx_path.write_text(GPX, encoding="utf-8")
+        self.geotagger = Geotagger(read_gpx(gpx_path))
+        self.folder = self.dir / "photos"
+        self.folder.mkdir()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_new_files_once_settled(self):
+        make_jpeg(self.folder / "old.jpg", "2025:10:24 08:00:05", "Cam")
+        watcher = FolderWatcher(self.folder, self.geotagger, settle=2, is_polling=True)
+        watcher.skip_existing()
+
+        new_path = self.folder / "new.jpg"
+        make_jpeg(new_path, "2025:10:24 08:00:15", "Cam")
+        # being written
+        (self.folder / ".new.jpg.tmp").write_bytes(b"\xff\xd8")
+
+        self.assertEqual(watcher.poll_once(0), 0)
+        self.assertEqual(len(watcher.pending), 1)
+        # copy still going on: the settle time restarts
+        with open(new_path, "ab") as f:
+            f.write(b"\x00")
+        self.assertEqual(watcher.poll_once(1.5), 0)
+        self.assertEqual(watcher.poll_once(3), 0)
+        self.assertEqual(watcher.poll_once(3.5), 1)
+
+        self.assertEqual(watcher.num_tagged, 1)
+        self.assertIn(piexif.GPSIFD.GPSLatitude, piexif.load(str(new_path))["GPS"])
+        self.assertEqual(piexif.load(str(self.folder / "old.jpg"))["GPS"], {})
+        # not tagged again after the update of its EXIF
+        self.assertEqual(watcher.poll_once(10), 0)
+        self.assertEqual(watcher.poll_once(20), 0)
+        self.assertEqual(watcher.num_tagged, 1)
+
+    def test_existing_in_batches(self):
+        for i in range(5):
+            make_jpeg(self.folder / f"{i}.jpg", "2025:10:24 08:00:05", "Cam")
+        watcher = FolderWatcher(
+            self.folder, self.geotagger, settle=0, batch_size=2, is_polling=True
+        )
+        watcher.add_existing()
+
+        watcher.poll_once(0)
+        self.assertEqual(watcher.poll_once(0), 5)
+        self.assertEqual(watcher.num_tagged, 5)
+
+    def test_file_error_does_not_stop(self):
+        # EXIF header in big-endian but truncated
+        (self.folder / "a.jpg").write_bytes(
+            MINIMAL_JPEG[:2] + b"\xff\xe1\x00\x10Exif\x00\x00MM\x00*"
+        )
+        (self.folder / "b.txt").write_text("not an image")
+        make_jpeg(self.folder / "c.jpg", "2025:10:24 08:00:05", "Cam")
+        watcher = FolderWatcher(self.folder, self.geotagger, settle=0, is_polling=True)
+        watcher.add_existing()
+
+        with self.assertLogs("gpx2exif", "ERROR") as logs:
+            watcher.poll_once(0)
+            self.assertEqual(watcher.poll_once(0), 3)
+
+        self.assertEqual(len(logs.output), 2)
+        self.assertEqual(watcher.num_tagged, 1)
+        self.assertEqual(watcher.unlocated, {})
+
+    def test_retry_with_new_points(self):
+        gpx_path = self.dir / "growing.gpx"
+        gpx_path.write_text(GPX, encoding="utf-8")
+        index = TrackIndex([gpx_path], check_interval=0)
+        make_jpeg(self.folder / "later.jpg", "2025:10:24 08:00:35", "Cam")
+        watcher = FolderWatcher(self.folder, index, settle=0, is_polling=True)
+        watcher.add_existing()
+
+        watcher.poll_once(0)
+        self.assertEqual(watcher.poll_once(0), 1)
+        self.assertEqual(watcher.num_tagged, 0)
+        # no new point: not tried again
+        self.assertEqual(watcher.poll_once(1), 0)
+
+        later_points = (
+            '<trkpt lat="45.3" lon="6.3"><time>2025-10-24T08:00:30Z</time></trkpt>'
+            '<trkpt lat="45.4" lon="6.4"><time>2025-10-24T08:00:40Z</time></trkpt>'
+            "</trkseg>"
+        )
+        gpx_path.write_text(GPX.replace("</trkseg>", later_points), encoding="utf-8")
+
+        self.assertEqual(watcher.poll_once(2), 1)
+        self.assertEqual(watcher.num_tagged, 1)
+        self.assertEqual(watcher.unlocated, {})
+        exif_data = piexif.load(str(self.folder / "later.jpg"))
+        self.assertIn(piexif.GPSIFD.GPSLatitude, exif_data["GPS"])
+
+
+if __name__ == "__main__":
+    unittest.main()